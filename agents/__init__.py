@@ -2,6 +2,12 @@
 Módulos de agentes especializados para análise fiscal e validação
 """
 
-from .validador import ValidadorFiscal, buscar_regras_fiscais_nfe
+__all__ = ['ValidadorFiscal', 'buscar_regras_fiscais_nfe']
 
-__all__ = ['ValidadorFiscal', 'buscar_regras_fiscais_nfe']
\ No newline at end of file
+
+def __getattr__(name):
+    # Importação adiada: o validador carrega o LLM e o RAG, que só são necessários na primeira análise.
+    if name in __all__:
+        from . import validador
+        return getattr(validador, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -11,7 +11,7 @@ from typing import Dict, Any, List, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from rag_system import RAGSystem
+from rag_system import RAGSystem, get_rag_system
 
 # Import do processador de criptografia
 try:
@@ -30,13 +30,13 @@ class AnalistaFiscal:
     Usa conhecimento da nuvem para propor soluções específicas para LUCRO REAL.
     """
 
-    def __init__(self):
+    def __init__(self, orcamento_tokens_rag: int = 2000, rag_system: Optional[RAGSystem] = None):
         """Inicializa o analista fiscal com LangChain"""
         self.processor = SecureDataProcessor()
         self.llm = None
         self.chain = None
-        self.rag_system = RAGSystem() # Inicializa o sistema RAG
-        self.rag_system.initialize_vectorstore() # Carrega o vectorstore
+        self.rag_system = rag_system or get_rag_system() # Sistema RAG compartilhado pelo processo
+        self.orcamento_tokens_rag = orcamento_tokens_rag # Limite de tokens do contexto RAG no prompt
         
         # Modelos disponíveis para fallback
         self.modelos_disponiveis = [
@@ -332,9 +332,13 @@ Analise essas discrepâncias considerando o regime de LUCRO REAL e forneça solu
             oportunidades_formatadas = self._formatar_oportunidades(resultado_validador.get('oportunidades', []))
             contexto_formatado = self._formatar_contexto_validador(resultado_validador)
             
-            # Recuperar contexto relevante usando o sistema RAG
-            query = f"Análise de discrepâncias para NFe com UF de origem {cabecalho.get('Emitente UF', 'N/A')} e UF de destino {cabecalho.get('Destinatário UF', 'N/A')}. Discrepâncias: {discrepancias_formatadas}"
-            contexto_rag = "\n".join(self.rag_system.retrieve_context(query))
+            # Recuperar contexto relevante usando o sistema RAG (uma consulta por discrepância)
+            consultas = [f"Análise de discrepâncias para NFe com UF de origem {cabecalho.get('Emitente UF', 'N/A')} e UF de destino {cabecalho.get('Destinatário UF', 'N/A')}"]
+            consultas += [
+                f"{disc.get('tipo', '')}: {disc.get('problema', '')} Produto: {disc.get('produto', '')}"
+                for disc in discrepancias
+            ]
+            contexto_rag = self.rag_system.assemble_context(consultas, token_budget=self.orcamento_tokens_rag)["context"]
             
             # Executar análise via LangChain
             resultado = self.chain.invoke({
@@ -11,7 +11,7 @@ from typing import Dict, Any, List, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from rag_system import RAGSystem
+from rag_system import RAGSystem, get_rag_system
 
 # Import do processador de criptografia
 try:
@@ -30,13 +30,13 @@ class TributaristaFiscal:
     Usa conhecimento da nuvem para calcular diferenças tributárias e possíveis penalidades.
     """
 
-    def __init__(self):
+    def __init__(self, orcamento_tokens_rag: int = 2000, rag_system: Optional[RAGSystem] = None):
         """Inicializa o tributarista fiscal com LangChain"""
         self.processor = SecureDataProcessor()
         self.llm = None
         self.chain = None
-        self.rag_system = RAGSystem() # Inicializa o sistema RAG
-        self.rag_system.initialize_vectorstore() # Carrega o vectorstore
+        self.rag_system = rag_system or get_rag_system() # Sistema RAG compartilhado pelo processo
+        self.orcamento_tokens_rag = orcamento_tokens_rag # Limite de tokens do contexto RAG no prompt
         
         # Modelos disponíveis para fallback
         self.modelos_disponiveis = [
@@ -277,9 +277,13 @@ Realize os cálculos considerando regime de LUCRO REAL e apresente resultados em
             discrepancias_formatadas = self._formatar_discrepancias(resultado_validador.get('discrepancias', []))
             oportunidades_formatadas = self._formatar_oportunidades(resultado_validador.get('oportunidades', []))
             
-            # Recuperar contexto relevante usando o sistema RAG
-            query = f"Cálculo de delta tributário para NFe com UF de origem {cabecalho.get('Emitente UF', 'N/A')} e UF de destino {cabecalho.get('Destinatário UF', 'N/A')}. Discrepâncias: {discrepancias_formatadas}. Insights do analista: {insights_analista}"
-            contexto_rag = "\n".join(self.rag_system.retrieve_context(query))
+            # Recuperar contexto relevante usando o sistema RAG (uma consulta por discrepância)
+            consultas = [f"Cálculo de delta tributário e multas para NFe com UF de origem {cabecalho.get('Emitente UF', 'N/A')} e UF de destino {cabecalho.get('Destinatário UF', 'N/A')}"]
+            consultas += [
+                f"Cálculo de delta para {disc.get('tipo', '')}: {disc.get('problema', '')} Produto: {disc.get('produto', '')}"
+                for disc in resultado_validador.get('discrepancias', [])
+            ]
+            contexto_rag = self.rag_system.assemble_context(consultas, token_budget=self.orcamento_tokens_rag)["context"]
             
             # Executar cálculos via LangChain
             resultado = self.chain.invoke({
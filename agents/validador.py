@@ -11,12 +11,12 @@ from typing import Dict, Any, List, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from rag_system import RAGSystem
+from rag_system import RAGSystem, get_rag_system
 
 # Import do processador de criptografia e das novas funções de NCM
 try:
     from criptografia import SecureDataProcessor
-    from utils import carregar_base_ncm, consultar_ncm
+    from utils import carregar_base_ncm, carregar_tabela_base_ncm, consultar_ncm
 except Exception:
     class SecureDataProcessor:
         def __init__(self):
@@ -25,9 +25,34 @@ except Exception:
             return df
     def carregar_base_ncm():
         return None
+    def carregar_tabela_base_ncm():
+        return None
     def consultar_ncm(ncm_codigo, base_ncm_df):
         return "Erro no import do utils."
 
+# Enriquecimento NCM em lote: import próprio, para que uma falha aqui não desative a criptografia
+try:
+    from base_ncm import enrich_ncm, NCM_ENCONTRADO, NCM_ANCESTRAL
+except Exception:
+    NCM_ENCONTRADO, NCM_ANCESTRAL = "encontrado", "ancestral"
+    def enrich_ncm(serie, tabela=None):
+        return pd.DataFrame({'Descrição NCM (Oficial)': "Erro no import do base_ncm.", 'Status NCM': "",
+                             'NCM Resolvido': "", 'Descrição NCM Resolvido': ""}, index=serie.index)
+
+# Classificação NCM determinística (TF-IDF sobre a tabela NCM)
+try:
+    from classificador_ncm import classificar_produtos
+except Exception:
+    def classificar_produtos(produtos_df, k=5, coluna_descricao=None):
+        return pd.DataFrame({'Suspeita NCM': False}, index=produtos_df.index)
+
+# Conferência base x alíquota = valor dos tributos de cada item
+try:
+    from view.extrator_xml import divergencias_tributos
+except Exception:
+    def divergencias_tributos(produtos_df):
+        return pd.DataFrame()
+
 
 class ValidadorFiscal:
     """
@@ -35,14 +60,16 @@ class ValidadorFiscal:
     Compara dados da NFe com banco de regras fiscais usando AI.
     """
 
-    def __init__(self):
+    def __init__(self, orcamento_tokens_rag: int = 1500, rag_system: Optional[RAGSystem] = None):
         """Inicializa o validador fiscal com LangChain"""
         self.processor = SecureDataProcessor()
         self.base_ncm = carregar_base_ncm()  # Carrega a base de NCM na inicialização
+        # Mesma tabela da base acima, para o enriquecimento em lote não carregar outra
+        self.tabela_ncm = carregar_tabela_base_ncm() if self.base_ncm is not None else None
         self.llm = None
         self.chain = None
-        self.rag_system = RAGSystem() # Inicializa o sistema RAG
-        self.rag_system.initialize_vectorstore() # Carrega o vectorstore
+        self.rag_system = rag_system or get_rag_system() # Sistema RAG compartilhado pelo processo
+        self.orcamento_tokens_rag = orcamento_tokens_rag # Limite de tokens do contexto RAG no prompt
         
         # Modelos disponíveis para fallback
         self.modelos_disponiveis = [
@@ -184,9 +211,9 @@ Analise estes dados contra as regras fiscais e a descrição oficial do NCM, e f
             # Formata os produtos e ENRIQUECE com a base de NCM
             dados_produtos = self._formatar_e_enriquecer_produtos(produtos)
             
-            # Recuperar contexto relevante usando o sistema RAG
-            query = f"Análise fiscal para NFe com CFOP {cabecalho.get('CFOP', 'N/A')} e produtos: {produtos['Descrição'].tolist()}"
-            contexto_rag = "\n".join(self.rag_system.retrieve_context(query))
+            # Recuperar contexto relevante usando o sistema RAG (uma consulta por produto)
+            consultas = self._montar_consultas_rag(cabecalho, produtos)
+            contexto_rag = self.rag_system.assemble_context(consultas, token_budget=self.orcamento_tokens_rag)["context"]
             
             # Executar análise via LangChain
             resultado = self.chain.invoke({
@@ -210,6 +237,23 @@ Analise estes dados contra as regras fiscais e a descrição oficial do NCM, e f
         except Exception as e:
             return self._erro_analise(str(e))
 
+    def _montar_consultas_rag(self, cabecalho_df: pd.DataFrame, produtos_df: pd.DataFrame) -> List[str]:
+        """Monta uma consulta RAG para a nota e uma por produto distinto (descrição, NCM e CFOP)."""
+        cabecalho = cabecalho_df.iloc[0] if len(cabecalho_df) > 0 else {}
+        consultas = [
+            f"Análise fiscal para NFe com CFOP {cabecalho.get('CFOP', 'N/A')}, "
+            f"UF de origem {cabecalho.get('Emitente UF', 'N/A')} e UF de destino {cabecalho.get('Destinatário UF', 'N/A')}"
+        ]
+        coluna_descricao = 'Descrição' if 'Descrição' in produtos_df.columns else 'Produto'
+        for _, produto in produtos_df.iterrows():
+            partes = [str(produto.get(coluna_descricao, '')).strip()]
+            if pd.notna(produto.get('NCM')):
+                partes.append(f"NCM {produto['NCM']}")
+            if pd.notna(produto.get('CFOP')):
+                partes.append(f"CFOP {produto['CFOP']}")
+            consultas.append(" ".join(parte for parte in partes if parte))
+        return list(dict.fromkeys(consultas))
+
     def _formatar_cabecalho(self, cabecalho_df: pd.DataFrame) -> str:
         """Formata dados do cabeçalho para o prompt"""
         if cabecalho_df.empty:
@@ -233,16 +277,20 @@ Analise estes dados contra as regras fiscais e a descrição oficial do NCM, e f
             
         produtos_enriquecidos = produtos_df.copy()
         
-        # Adiciona a descrição oficial do NCM
+        # Adiciona a descrição oficial do NCM (coluna inteira de uma vez, não produto a produto)
         if 'NCM' in produtos_enriquecidos.columns and self.base_ncm is not None:
-            produtos_enriquecidos['Descrição NCM (Oficial)'] = produtos_enriquecidos['NCM'].apply(
-                lambda ncm: consultar_ncm(ncm, self.base_ncm)
+            ncm = enrich_ncm(produtos_enriquecidos['NCM'], tabela=self.tabela_ncm)
+            aproximado = ("NCM não encontrado; mais próximo " + ncm['NCM Resolvido'] + ": "
+                          + ncm['Descrição NCM Resolvido'].str.lstrip("- "))
+            produtos_enriquecidos['Descrição NCM (Oficial)'] = ncm['Descrição NCM (Oficial)'].where(
+                ncm['Status NCM'] == NCM_ENCONTRADO,
+                aproximado.where(ncm['Status NCM'] == NCM_ANCESTRAL, "NCM não encontrado na base de conhecimento.")
             )
 
         # Selecionar e ordenar colunas para o prompt
         colunas_fiscais = [
             'Produto', 'Descrição NCM (Oficial)', 'NCM', 'CFOP', 'Quantidade', 'Valor Unitário', 'Valor Total',
-            'Alíquota ICMS', 'Valor ICMS', 'Alíquota PIS', 'Valor PIS', 
+            'CST ICMS', 'CSOSN', 'Base ICMS', 'Alíquota ICMS', 'Valor ICMS', 'Valor ICMS ST', 'Alíquota PIS', 'Valor PIS', 
             'Alíquota COFINS', 'Valor COFINS', 'Alíquota IPI', 'Valor IPI'
         ]
         
@@ -255,7 +303,26 @@ Analise estes dados contra as regras fiscais e a descrição oficial do NCM, e f
         resultado = f"Total de produtos: {len(produtos_df)}\n\n"
         resultado += "Primeiros produtos para análise (enriquecidos com base NCM):\n"
         resultado += produtos_limitados.to_string(index=False)
-        
+
+        # Classificação NCM determinística de todos os itens (não só dos 20 acima), sem LLM
+        if 'NCM' in produtos_enriquecidos.columns and self.base_ncm is not None:
+            classificacao = classificar_produtos(produtos_enriquecidos, k=3)
+            suspeitos = classificacao[classificacao['Suspeita NCM']]
+            if not suspeitos.empty:
+                coluna_descricao = 'Descrição' if 'Descrição' in produtos_enriquecidos.columns else 'Produto'
+                suspeitos = pd.concat([produtos_enriquecidos.loc[suspeitos.index, [coluna_descricao]],
+                                       suspeitos[['NCM Declarado', 'Candidatos NCM', 'Motivo Suspeita']]], axis=1)
+                resultado += (f"\n\nItens com possível erro de classificação NCM ({len(suspeitos)}, por similaridade "
+                              "da descrição com a tabela NCM oficial; confirme antes de apontar):\n")
+                resultado += suspeitos.head(20).to_string(index=False)
+
+        # Conferência base x alíquota = valor de cada tributo, também em todos os itens
+        divergencias = divergencias_tributos(produtos_enriquecidos)
+        if not divergencias.empty:
+            resultado += (f"\n\nItens com valor de tributo diferente de base x alíquota ({len(divergencias)} "
+                          "ocorrências, calculadas a partir dos grupos de tributos do XML):\n")
+            resultado += divergencias.head(20).to_string(index=False)
+
         return resultado
 
     def _gerar_dropdown(self, resultado: Dict[str, Any]) -> str:
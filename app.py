@@ -1,17 +1,12 @@
 import streamlit as st
 import os
-import pandas as pd
-import xml.etree.ElementTree as ET
-from io import BytesIO
-from st_aggrid import AgGrid, GridOptionsBuilder
 
 # Adiciona o diretório raiz ao sys.path para garantir que as importações funcionem
 import sys
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from utils import validate_gemini_api_key
-from view.main import extrair_dados_xml
-from criptografia import SecureDataProcessor
+# Só as telas iniciais são importadas aqui; o extrator, a criptografia e o AgGrid carregam
+# em upload_page(), para a tela de boas-vindas abrir sem esperar por eles.
 from view.welcome import welcome_page
 from view.login import login_page
 
@@ -35,6 +30,10 @@ st.sidebar.divider()
 
 # --- Página Principal (Upload e Extração) ---
 def upload_page():
+    from st_aggrid import AgGrid, GridOptionsBuilder
+    from view.main import extrair_dados_xml
+    from criptografia import SecureDataProcessor
+
     render_sidebar() # Renderiza a sidebar apenas na main_app
 
     st.title("Extrator de Nota Fiscal Eletrônica (NF-e XML)")
@@ -0,0 +1,371 @@
+"""
+Tabela NCM com cache colunar em disco.
+
+A planilha oficial da NCM (`referencias/Tabela_NCM_Vigente_*.xlsx`) leva alguns segundos para
+ser lida com o openpyxl. Na primeira leitura a tabela é gravada em colunas NumPy sob
+`.rag_index/ncm/<planilha>/` (ou em NCM_CACHE_PATH):
+
+- codigos.npy: códigos sem pontos, em ordem da planilha (bytes ASCII de largura fixa)
+- descricoes.npy: as descrições concatenadas em UTF-8
+- offsets.npy: início de cada descrição no blob (n + 1 posições)
+- meta.json: versão do formato, tamanho, mtime e SHA-256 da planilha de origem
+
+As leituras seguintes mapeiam esses arquivos em memória (np.load com mmap_mode) em poucos
+milissegundos, em qualquer processo: o app Streamlit (utils.carregar_base_ncm), a ingestão do
+RAG (rag_loaders.iter_ncm_records) e o validador. O cache vale enquanto tamanho e mtime da
+planilha baterem com o meta.json; se só o mtime mudou, o SHA-256 decide. Caso contrário a
+planilha é relida e o cache regravado.
+
+Consultas: TabelaNCM.posicao()/buscar() resolvem um código por hash (dict montado uma vez por
+tabela) e enrich_ncm() enriquece uma coluna inteira de produtos de uma vez, consultando só os
+códigos distintos. A NCM é hierárquica (capítulo 2 dígitos, posição 4, subposições 5-6, item e
+subitem 7-8): ancestral() resolve um código ausente pelo prefixo mais longo presente na tabela
+(no máximo 7 consultas por hash), caminho() devolve a cadeia capítulo -> ... -> código, e
+descendentes() lista todos os códigos sob um prefixo ("8471") por busca binária nos códigos
+ordenados.
+
+    python base_ncm.py                 # valida (ou gera) o cache e mede a carga
+    python base_ncm.py --reconstruir
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+CAMINHO_PLANILHA_NCM = os.path.join(os.path.dirname(__file__), 'referencias', 'Tabela_NCM_Vigente_20251024.xlsx')
+CAMINHO_CACHE_NCM = os.environ.get("NCM_CACHE_PATH", os.path.join(os.path.dirname(__file__), '.rag_index', 'ncm'))
+
+# Incrementar quando o layout dos arquivos do cache mudar; caches antigos são então regravados.
+VERSAO_FORMATO_CACHE = 1
+
+# Situação de cada código em enrich_ncm.
+NCM_ENCONTRADO = "encontrado"
+NCM_ANCESTRAL = "ancestral"  # Ausente na tabela, resolvido pelo prefixo mais longo presente
+NCM_NAO_ENCONTRADO = "não encontrado"
+NCM_INVALIDO = "inválido"
+
+
+class TabelaNCM:
+    """Códigos (sem pontos) e descrições da NCM em colunas, na ordem da planilha."""
+
+    def __init__(self, codigos: np.ndarray, descricoes: np.ndarray, offsets: np.ndarray):
+        self.codigos = codigos
+        self.descricoes = descricoes
+        self.offsets = offsets
+        self._posicoes: Optional[Dict[str, int]] = None
+        self._textos: Optional[np.ndarray] = None
+        self._ordem: Optional[np.ndarray] = None
+        self._ordenados: Optional[np.ndarray] = None
+
+    @classmethod
+    def de_registros(cls, registros: List[Dict[str, str]]) -> "TabelaNCM":
+        codigos = np.array([registro["codigo"].encode("ascii") for registro in registros], dtype="S8")
+        textos = [registro["descricao"].encode("utf-8") for registro in registros]
+        offsets = np.zeros(len(textos) + 1, dtype=np.int64)
+        np.cumsum([len(texto) for texto in textos], out=offsets[1:])
+        descricoes = np.frombuffer(b"".join(textos), dtype=np.uint8)
+        return cls(codigos, descricoes, offsets)
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def codigo(self, posicao: int) -> str:
+        return self.codigos[posicao].decode("ascii")
+
+    def descricao(self, posicao: int) -> str:
+        return self.descricoes[self.offsets[posicao]:self.offsets[posicao + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for posicao in range(len(self)):
+            yield {"codigo": self.codigo(posicao), "descricao": self.descricao(posicao)}
+
+    @property
+    def posicoes(self) -> Dict[str, int]:
+        """Código -> posição na tabela (montado na primeira consulta)."""
+        if self._posicoes is None:
+            self._posicoes = {codigo.decode("ascii"): posicao for posicao, codigo in enumerate(self.codigos)}
+        return self._posicoes
+
+    @property
+    def textos(self) -> np.ndarray:
+        """Descrições decodificadas (array de objetos), para seleção vetorizada por posição."""
+        if self._textos is None:
+            self._textos = np.array([self.descricao(posicao) for posicao in range(len(self))], dtype=object)
+        return self._textos
+
+    def posicao(self, codigo: str) -> int:
+        """Posição do código (com ou sem pontos) na tabela, ou -1."""
+        return self.posicoes.get(normalizar_codigo_ncm(codigo), -1)
+
+    def buscar(self, codigo: str) -> Optional[str]:
+        """Descrição oficial do código, ou None se ele não estiver na tabela."""
+        posicao = self.posicao(codigo)
+        return self.textos[posicao] if posicao >= 0 else None
+
+    def ancestral(self, codigo: str) -> int:
+        """Posição do código ou, se ele não estiver na tabela, do seu prefixo mais longo presente; -1 se nenhum."""
+        codigo = normalizar_codigo_ncm(codigo)
+        for tamanho in range(len(codigo), 1, -1):
+            posicao = self.posicoes.get(codigo[:tamanho], -1)
+            if posicao >= 0:
+                return posicao
+        return -1
+
+    def caminho(self, codigo: str) -> List[Dict[str, str]]:
+        """
+        Cadeia {"codigo", "descricao"} do capítulo até o código resolvido por ancestral(), com
+        as descrições sem os travessões de nível da planilha; vazia se nada for resolvido.
+        """
+        posicao = self.ancestral(codigo)
+        if posicao < 0:
+            return []
+        resolvido = self.codigo(posicao)
+        caminho = []
+        for tamanho in range(2, len(resolvido) + 1):
+            nivel = self.posicoes.get(resolvido[:tamanho], -1)
+            if nivel >= 0:
+                caminho.append({"codigo": resolvido[:tamanho], "descricao": self.textos[nivel].lstrip("- ")})
+        return caminho
+
+    def descendentes(self, prefixo: str) -> np.ndarray:
+        """Posições, em ordem de código, do prefixo e de todos os códigos abaixo dele (ex.: "8471")."""
+        prefixo = normalizar_codigo_ncm(prefixo)
+        if not prefixo.isdigit():
+            return np.empty(0, dtype=np.int64)
+        if self._ordem is None:
+            # A planilha já vem em ordem de código, mas o índice não depende disso
+            self._ordem = np.argsort(self.codigos, kind="stable")
+            self._ordenados = np.asarray(self.codigos)[self._ordem]
+        chave = prefixo.encode("ascii")
+        inicio = np.searchsorted(self._ordenados, chave, side="left")
+        fim = np.searchsorted(self._ordenados, chave + b":", side="left")  # ":" vem logo após "9" em ASCII
+        return self._ordem[inicio:fim]
+
+    def para_dataframe(self):
+        """
+        DataFrame com as colunas 'Código NCM' e 'Descrição NCM' usadas pelo app, indexado pelo
+        código para consultas por hash (`df['Descrição NCM'].get(codigo)`).
+        """
+        import pandas as pd
+
+        codigos = [codigo.decode("ascii") for codigo in self.codigos]
+        return pd.DataFrame({'Código NCM': codigos, 'Descrição NCM': list(self.textos)}, index=codigos)
+
+
+def normalizar_codigo_ncm(valor) -> str:
+    """Código NCM sem espaços nem pontos ("8471.30.12 " -> "84713012"); vazio para valores ausentes."""
+    if valor is None or valor != valor:  # None ou NaN
+        return ""
+    return str(valor).strip().replace(".", "")
+
+
+def formatar_codigo_ncm(codigo: str) -> str:
+    """Código sem pontos no formato da tabela oficial ("84713012" -> "8471.30.12", "0101" -> "01.01")."""
+    if len(codigo) <= 4:
+        return f"{codigo[:2]}.{codigo[2:]}".rstrip(".")
+    return ".".join(filter(None, [codigo[:4], codigo[4:6], codigo[6:]]))
+
+
+def formatar_caminho_ncm(caminho: List[Dict[str, str]]) -> str:
+    """Caminho de TabelaNCM.caminho() em uma linha: "01 Animais vivos. > 01.01 Cavalos, ... > ..."."""
+    return " > ".join(f"{formatar_codigo_ncm(nivel['codigo'])} {nivel['descricao']}".strip() for nivel in caminho)
+
+
+def enrich_ncm(serie, tabela: Optional[TabelaNCM] = None):
+    """
+    Enriquece uma coluna de NCMs (pandas Series) de uma vez: devolve um DataFrame com o mesmo
+    índice e as colunas 'Descrição NCM (Oficial)', 'Capítulo NCM' (descrição do capítulo, os
+    2 primeiros dígitos), 'NCM Resolvido' e 'Descrição NCM Resolvido' (o próprio código ou, se
+    ausente, seu ancestral mais longo na tabela) e 'Status NCM' (NCM_ENCONTRADO, NCM_ANCESTRAL,
+    NCM_NAO_ENCONTRADO ou NCM_INVALIDO, quando o valor não é numérico). Cada código distinto é
+    consultado uma única vez.
+    """
+    import pandas as pd
+
+    tabela = tabela if tabela is not None else tabela_ncm()
+    rotulos, distintos = pd.factorize(serie.map(normalizar_codigo_ncm))
+    posicoes = np.fromiter((tabela.posicoes.get(codigo, -1) for codigo in distintos),
+                           dtype=np.int64, count=len(distintos))
+    validos = np.fromiter((codigo.isdigit() for codigo in distintos), dtype=bool, count=len(distintos))
+    capitulos = np.fromiter((tabela.posicoes.get(codigo[:2], -1) for codigo in distintos),
+                            dtype=np.int64, count=len(distintos))
+    # Só os códigos válidos ausentes da tabela procuram um ancestral
+    resolvidos = posicoes.copy()
+    for indice in np.flatnonzero((posicoes < 0) & validos):
+        resolvidos[indice] = tabela.ancestral(distintos[indice])
+
+    # Uma posição extra vazia no fim recebe os -1 (não encontrados)
+    textos = np.append(tabela.textos, "")
+    codigos = np.array([formatar_codigo_ncm(tabela.codigo(posicao)) if posicao >= 0 else "" for posicao in resolvidos],
+                       dtype=object)
+    status = np.where(posicoes >= 0, NCM_ENCONTRADO,
+                      np.where(resolvidos >= 0, NCM_ANCESTRAL,
+                               np.where(validos, NCM_NAO_ENCONTRADO, NCM_INVALIDO))).astype(object)
+    return pd.DataFrame({
+        'Descrição NCM (Oficial)': textos[posicoes][rotulos],
+        'Capítulo NCM': textos[np.where(validos, capitulos, -1)][rotulos],
+        'NCM Resolvido': codigos[rotulos],
+        'Descrição NCM Resolvido': textos[resolvidos][rotulos],
+        'Status NCM': status[rotulos],
+    }, index=serie.index)
+
+
+def ler_planilha_ncm(caminho_planilha: str) -> Iterator[Dict[str, str]]:
+    """Lê a planilha com o openpyxl: {"codigo", "descricao"} de cada linha após o cabeçalho "Código"."""
+    from openpyxl import load_workbook
+
+    def limpar(valor) -> str:
+        texto = " ".join(str(valor).split()) if valor is not None else ""
+        return "" if texto in ("-", "nan", "None") else texto
+
+    workbook = load_workbook(caminho_planilha, read_only=True)
+    try:
+        iniciado = False
+        for linha in workbook.worksheets[0].iter_rows(max_col=2, values_only=True):
+            codigo = limpar(linha[0]) if linha else ""
+            if not iniciado:
+                iniciado = codigo.lower() == "código"
+                continue
+            codigo = codigo.replace(".", "")
+            if codigo.isdigit():
+                yield {"codigo": codigo, "descricao": limpar(linha[1]) if len(linha) > 1 else ""}
+    finally:
+        workbook.close()
+
+
+def _hash_arquivo(caminho: str) -> str:
+    digest = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def _diretorio_cache(caminho_planilha: str, caminho_cache: str) -> str:
+    return os.path.join(caminho_cache, os.path.splitext(os.path.basename(caminho_planilha))[0])
+
+
+def _carregar_cache(diretorio: str, caminho_planilha: str) -> Optional[TabelaNCM]:
+    """Tabela mapeada do cache, ou None se ele não existir, estiver incompleto ou desatualizado."""
+    try:
+        with open(os.path.join(diretorio, "meta.json"), encoding="utf-8") as arquivo:
+            meta = json.load(arquivo)
+        estado = os.stat(caminho_planilha)
+        if meta.get("versao") != VERSAO_FORMATO_CACHE or meta.get("tamanho") != estado.st_size:
+            return None
+        if meta.get("mtime_ns") != estado.st_mtime_ns:
+            # Planilha tocada (cópia, checkout) mas talvez igual: o conteúdo decide
+            if meta.get("sha256") != _hash_arquivo(caminho_planilha):
+                return None
+            meta["mtime_ns"] = estado.st_mtime_ns
+            _gravar_json(os.path.join(diretorio, "meta.json"), meta)
+        tabela = TabelaNCM(
+            np.load(os.path.join(diretorio, "codigos.npy"), mmap_mode="r"),
+            np.load(os.path.join(diretorio, "descricoes.npy"), mmap_mode="r"),
+            np.load(os.path.join(diretorio, "offsets.npy"), mmap_mode="r"),
+        )
+    except (OSError, ValueError):
+        return None
+    if len(tabela) != meta.get("linhas") or len(tabela.offsets) != len(tabela) + 1:
+        return None
+    return tabela
+
+
+def _gravar_json(caminho: str, dados: Dict) -> None:
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def _gravar_cache(diretorio: str, caminho_planilha: str, tabela: TabelaNCM) -> None:
+    """Grava as colunas e, por último, o meta.json (atômico: um cache pela metade nunca é válido)."""
+    os.makedirs(diretorio, exist_ok=True)
+    for nome, coluna in (("codigos", tabela.codigos), ("descricoes", tabela.descricoes), ("offsets", tabela.offsets)):
+        temporario = os.path.join(diretorio, f"{nome}.{os.getpid()}.tmp.npy")
+        np.save(temporario, np.ascontiguousarray(coluna))
+        os.replace(temporario, os.path.join(diretorio, f"{nome}.npy"))
+    estado = os.stat(caminho_planilha)
+    _gravar_json(os.path.join(diretorio, "meta.json"), {
+        "versao": VERSAO_FORMATO_CACHE,
+        "origem": os.path.basename(caminho_planilha),
+        "tamanho": estado.st_size,
+        "mtime_ns": estado.st_mtime_ns,
+        "sha256": _hash_arquivo(caminho_planilha),
+        "linhas": len(tabela),
+    })
+
+
+def carregar_tabela_ncm(caminho_planilha: str = CAMINHO_PLANILHA_NCM, caminho_cache: Optional[str] = CAMINHO_CACHE_NCM,
+                        reconstruir: bool = False) -> TabelaNCM:
+    """
+    Tabela NCM da planilha, lida do cache colunar quando ele estiver válido. Com
+    `caminho_cache=None` a planilha é sempre relida. Levanta FileNotFoundError se a planilha
+    não existir.
+    """
+    if not os.path.exists(caminho_planilha):
+        raise FileNotFoundError(caminho_planilha)
+    diretorio = _diretorio_cache(caminho_planilha, caminho_cache) if caminho_cache else None
+    if diretorio and not reconstruir:
+        tabela = _carregar_cache(diretorio, caminho_planilha)
+        if tabela is not None:
+            return tabela
+
+    tabela = TabelaNCM.de_registros(list(ler_planilha_ncm(caminho_planilha)))
+    if diretorio:
+        try:
+            _gravar_cache(diretorio, caminho_planilha, tabela)
+        except OSError as e:  # Ex.: diretório somente leitura; segue com a tabela em memória
+            print(f"Aviso: não foi possível gravar o cache da NCM em '{diretorio}': {e}")
+    return tabela
+
+
+@lru_cache(maxsize=None)
+def tabela_ncm() -> TabelaNCM:
+    """Tabela NCM padrão do projeto, carregada uma vez por processo."""
+    return carregar_tabela_ncm()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera ou valida o cache colunar da tabela NCM.")
+    parser.add_argument("--planilha", default=CAMINHO_PLANILHA_NCM)
+    parser.add_argument("--cache", default=CAMINHO_CACHE_NCM)
+    parser.add_argument("--reconstruir", action="store_true", help="Relê a planilha mesmo com cache válido.")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    tabela = carregar_tabela_ncm(args.planilha, args.cache, reconstruir=args.reconstruir)
+    print(f"{len(tabela)} linhas em {(time.perf_counter() - inicio) * 1000:.1f} ms "
+          f"({'planilha' if args.reconstruir else 'cache ou planilha'})")
+    inicio = time.perf_counter()
+    tabela = carregar_tabela_ncm(args.planilha, args.cache)
+    print(f"Cache: {len(tabela)} linhas em {(time.perf_counter() - inicio) * 1000:.1f} ms "
+          f"em {_diretorio_cache(args.planilha, args.cache)}")
+    print(f"Consulta NCM (base indexada e não indexada): {'OK' if conferir_consulta_ncm(tabela) else 'DIVERGENTE'}")
+
+
+def conferir_consulta_ncm(tabela: TabelaNCM) -> bool:
+    """
+    Confere que utils.consultar_ncm responde igual com a base de para_dataframe() (indexada pelo
+    código) e com um DataFrame comum, só com as colunas, para códigos existentes e ausentes.
+    """
+    from utils import consultar_ncm
+
+    indexada = tabela.para_dataframe()
+    simples = indexada.reset_index(drop=True)
+    existentes = [tabela.codigo(posicao) for posicao in (0, len(tabela) // 2, len(tabela) - 1)]
+    amostra = existentes + [formatar_codigo_ncm(codigo) for codigo in existentes] + [codigo + "99" for codigo in existentes]
+    for codigo in amostra:
+        if consultar_ncm(codigo, indexada) != consultar_ncm(codigo, simples):
+            return False
+    return all(consultar_ncm(codigo, simples) == indexada['Descrição NCM'][codigo] for codigo in existentes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Classificador NCM determinístico, em lote e sem LLM.
+
+Cada NCM de 8 dígitos da tabela oficial (base_ncm) vira um vetor TF-IDF do seu caminho de
+descrições a partir da posição (4 dígitos), já que itens como "Outros" só têm sentido junto dos
+ancestrais. Os termos são as palavras de rag_retrieval.tokenize mais o radical de 4 letras das
+mais longas, o que aproxima abreviações e plurais comuns nas descrições de NF-e ("PNEU" e
+"Pneumáticos"). Os vetores ficam num índice invertido NumPy (postings por termo), montado uma
+vez por processo.
+
+classificar() compara as descrições de um lote inteiro de produtos com todas as NCMs por blocos
+de produtos (similaridade de cosseno, busca exata) e devolve, por produto, a similaridade do
+NCM declarado e da melhor NCM da sua posição, os k melhores candidatos e a suspeita de
+classificação errada: NCM inexistente na tabela, ou posição declarada bem menos parecida com a
+descrição do que a melhor candidata e fora das posições dos k candidatos.
+
+    python classificador_ncm.py --sintetico 10000          # lote sintético: tempo e acerto das suspeitas
+    python classificador_ncm.py produtos.csv --k 3         # colunas "Descrição" e "NCM"
+"""
+
+import re
+import time
+import argparse
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from base_ncm import TabelaNCM, tabela_ncm, normalizar_codigo_ncm, formatar_codigo_ncm
+from rag_retrieval import tokenize
+
+# Palavras mais longas que isto também contam pelo radical (prefixo) com este tamanho.
+TAMANHO_RADICAL = 4
+
+# Suspeita quando a melhor NCM da posição declarada tem menos que esta fração da similaridade
+# da melhor candidata (e a posição declarada não está entre as dos k candidatos).
+LIMIAR_SUSPEITA = 0.35
+
+# Produtos pontuados por vez: a matriz de similaridades do bloco tem TAMANHO_BLOCO x ~10.500 floats.
+TAMANHO_BLOCO = 512
+
+
+def termos(texto: str) -> List[str]:
+    """Palavras normalizadas do texto e os radicais das mais longas."""
+    palavras = tokenize(texto)
+    return palavras + [palavra[:TAMANHO_RADICAL] for palavra in palavras
+                       if len(palavra) > TAMANHO_RADICAL and not palavra.isdigit()]
+
+
+class ClassificadorNCM:
+    """Índice TF-IDF das NCMs de 8 dígitos e pontuação de lotes de descrições contra ele."""
+
+    def __init__(self, tabela: TabelaNCM):
+        self.tabela = tabela
+        self.folhas = np.array([posicao for posicao in range(len(tabela)) if len(tabela.codigos[posicao]) == 8],
+                               dtype=np.int64)
+        self.codigos = [tabela.codigo(posicao) for posicao in self.folhas]
+        self.coluna = {codigo: coluna for coluna, codigo in enumerate(self.codigos)}
+        # Colunas em ordem de código: as folhas de uma posição (4 dígitos) são contíguas
+        self._posicoes_folhas = np.array([codigo[:4] for codigo in self.codigos], dtype="S4")
+
+        self.vocabulario: Dict[str, int] = {}
+        linhas, colunas, contagens = [], [], []
+        for coluna, codigo in enumerate(self.codigos):
+            texto = " ".join(nivel["descricao"] for nivel in tabela.caminho(codigo)[1:])
+            for termo, contagem in Counter(termos(texto)).items():
+                linhas.append(self.vocabulario.setdefault(termo, len(self.vocabulario)))
+                colunas.append(coluna)
+                contagens.append(contagem)
+        termos_ids = np.array(linhas, dtype=np.int64)
+        documentos = np.array(colunas, dtype=np.int64)
+        frequencias = np.bincount(termos_ids, minlength=len(self.vocabulario))
+        self.idf = (np.log((1 + len(self.codigos)) / (1 + frequencias)) + 1).astype(np.float32)
+        pesos = (1 + np.log(np.array(contagens, dtype=np.float32))) * self.idf[termos_ids]
+        normas = np.sqrt(np.bincount(documentos, weights=pesos.astype(np.float64) ** 2, minlength=len(self.codigos)))
+        pesos /= np.maximum(normas[documentos], 1e-12).astype(np.float32)
+
+        # Postings agrupados por termo: documentos e pesos do termo t em [inicio[t], inicio[t + 1])
+        ordem = np.argsort(termos_ids, kind="stable")
+        self._documentos = documentos[ordem]
+        self._pesos = pesos[ordem]
+        self._inicio = np.zeros(len(self.vocabulario) + 1, dtype=np.int64)
+        np.cumsum(frequencias, out=self._inicio[1:])
+
+    def vetorizar(self, texto: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids de termo, pesos) normalizados da descrição; termos fora do vocabulário são ignorados."""
+        contagem: Dict[int, int] = {}
+        for termo in termos(texto):
+            termo_id = self.vocabulario.get(termo)
+            if termo_id is not None:
+                contagem[termo_id] = contagem.get(termo_id, 0) + 1
+        ids = np.fromiter(contagem.keys(), dtype=np.int64, count=len(contagem))
+        pesos = (1 + np.log(np.fromiter(contagem.values(), dtype=np.float32, count=len(contagem)))) * self.idf[ids]
+        return ids, pesos / max(float(np.linalg.norm(pesos)), 1e-12)
+
+    def similaridades(self, descricoes: Sequence[str]) -> np.ndarray:
+        """Matriz len(descricoes) x NCMs de similaridades de cosseno (use em blocos: é densa)."""
+        vetores = [self.vetorizar(descricao) for descricao in descricoes]
+        resultado = np.zeros((len(descricoes), len(self.codigos)), dtype=np.float32)
+        if not any(len(ids) for ids, _ in vetores):
+            return resultado
+        linhas = np.concatenate([np.full(len(ids), linha, dtype=np.int64) for linha, (ids, _) in enumerate(vetores)])
+        ids = np.concatenate([ids for ids, _ in vetores])
+        pesos = np.concatenate([pesos for _, pesos in vetores])
+        ordem = np.argsort(ids, kind="stable")
+        linhas, ids, pesos = linhas[ordem], ids[ordem], pesos[ordem]
+        # Um termo por vez: soma o produto externo (produtos com o termo) x (NCMs com o termo)
+        limites = np.flatnonzero(np.diff(ids)) + 1
+        for inicio, fim in zip(np.r_[0, limites], np.r_[limites, len(ids)]):
+            termo = ids[inicio]
+            postings = slice(self._inicio[termo], self._inicio[termo + 1])
+            resultado[np.ix_(linhas[inicio:fim], self._documentos[postings])] += np.outer(pesos[inicio:fim],
+                                                                                           self._pesos[postings])
+        return resultado
+
+    def _colunas_da_posicao(self, codigo: str) -> slice:
+        chave = codigo[:4].encode("ascii")
+        return slice(int(np.searchsorted(self._posicoes_folhas, chave, side="left")),
+                     int(np.searchsorted(self._posicoes_folhas, chave, side="right")))
+
+    def classificar(self, descricoes: Sequence[str], ncms: Sequence, k: int = 5,
+                    limiar: float = LIMIAR_SUSPEITA) -> pd.DataFrame:
+        """
+        Uma linha por produto com 'NCM Declarado', 'Similaridade NCM Declarado', 'Similaridade
+        Posição Declarada', 'NCM Sugerido', 'Similaridade NCM Sugerido', 'Candidatos NCM' (os k
+        melhores, formatados), 'Suspeita NCM' e 'Motivo Suspeita'.
+        """
+        linhas = []
+        for bloco in range(0, len(descricoes), TAMANHO_BLOCO):
+            pontuacoes = self.similaridades(descricoes[bloco:bloco + TAMANHO_BLOCO])
+            k_bloco = min(k, pontuacoes.shape[1])
+            melhores = np.argpartition(-pontuacoes, k_bloco - 1, axis=1)[:, :k_bloco]
+            for linha, ncm in enumerate(ncms[bloco:bloco + TAMANHO_BLOCO]):
+                scores = pontuacoes[linha]
+                candidatos = melhores[linha][np.argsort(-scores[melhores[linha]], kind="stable")]
+                candidatos = candidatos[scores[candidatos] > 0]
+                linhas.append(self._avaliar(normalizar_codigo_ncm(ncm), scores, candidatos, limiar))
+        return pd.DataFrame(linhas, columns=['NCM Declarado', 'Similaridade NCM Declarado', 'Similaridade Posição Declarada',
+                                             'NCM Sugerido', 'Similaridade NCM Sugerido', 'Candidatos NCM',
+                                             'Suspeita NCM', 'Motivo Suspeita'])
+
+    def _avaliar(self, codigo: str, scores: np.ndarray, candidatos: np.ndarray, limiar: float) -> list:
+        melhor = float(scores[candidatos[0]]) if len(candidatos) else 0.0
+        sugerido = formatar_codigo_ncm(self.codigos[candidatos[0]]) if len(candidatos) else ""
+        lista = [formatar_codigo_ncm(self.codigos[coluna]) for coluna in candidatos]
+        coluna = self.coluna.get(codigo)
+        if coluna is None:
+            motivo = "NCM declarado vazio" if not codigo else "NCM inexistente na tabela oficial"
+            return [codigo, None, None, sugerido, melhor, lista, True, motivo]
+
+        declarado = float(scores[coluna])
+        colunas_posicao = self._colunas_da_posicao(codigo)
+        posicao = float(scores[colunas_posicao].max())
+        posicoes_candidatas = {self.codigos[candidato][:4] for candidato in candidatos}
+        suspeita = bool(melhor > 0 and posicao < limiar * melhor and codigo[:4] not in posicoes_candidatas)
+        motivo = (f"descrição mais próxima da posição {formatar_codigo_ncm(self.codigos[candidatos[0]][:4])}"
+                  if suspeita else "")
+        return [formatar_codigo_ncm(codigo), declarado, posicao, sugerido, melhor, lista, suspeita, motivo]
+
+
+@lru_cache(maxsize=None)
+def classificador_ncm() -> ClassificadorNCM:
+    """Classificador sobre a tabela NCM padrão do projeto, montado uma vez por processo."""
+    return ClassificadorNCM(tabela_ncm())
+
+
+def classificar_produtos(produtos_df: pd.DataFrame, k: int = 5, coluna_descricao: Optional[str] = None) -> pd.DataFrame:
+    """Classifica as colunas de descrição ('Descrição' ou 'Produto') e 'NCM' de um DataFrame de produtos."""
+    coluna_descricao = coluna_descricao or ('Descrição' if 'Descrição' in produtos_df.columns else 'Produto')
+    descricoes = produtos_df[coluna_descricao].fillna("").astype(str).tolist()
+    resultado = classificador_ncm().classificar(descricoes, produtos_df['NCM'].tolist(), k=k)
+    resultado.index = produtos_df.index
+    return resultado
+
+
+def lote_sintetico(classificador: ClassificadorNCM, quantidade: int, proporcao_errada: float = 0.1,
+                   semente: int = 0) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Produtos com descrição curta em caixa alta, como em NF-e: as primeiras palavras da posição
+    do próprio NCM e algumas do item (sem "Outros"). `proporcao_errada` deles recebem o NCM de
+    outro capítulo; devolve também a máscara dos itens trocados.
+    """
+    rng = np.random.default_rng(semente)
+    escolhidos = rng.choice(len(classificador.codigos), quantidade)
+    descricoes, ncms = [], []
+    for coluna in escolhidos:
+        codigo = classificador.codigos[coluna]
+        caminho = [nivel["descricao"] for nivel in classificador.tabela.caminho(codigo)[1:]]
+        palavras = re.split(r"[,;:(]", caminho[0])[0].split()[:3]
+        if len(caminho) > 1:
+            item = [palavra for palavra in re.sub(r"[^\w\s]", " ", caminho[-1]).split()
+                    if palavra.lower() not in ("outros", "outras")]
+            palavras += item[:rng.integers(0, 5)]
+        descricoes.append(" ".join(palavras).upper())
+        ncms.append(codigo)
+    trocados = rng.random(quantidade) < proporcao_errada
+    for indice in np.flatnonzero(trocados):
+        while True:
+            outro = classificador.codigos[rng.integers(len(classificador.codigos))]
+            if outro[:2] != ncms[indice][:2]:
+                ncms[indice] = outro
+                break
+    return pd.DataFrame({'Descrição': descricoes, 'NCM': ncms}), trocados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classificação NCM em lote: candidatos e suspeitas por produto.")
+    parser.add_argument("arquivo", nargs="?", help="CSV ou planilha com as colunas de descrição e 'NCM'.")
+    parser.add_argument("--coluna-descricao", default=None, help="Padrão: 'Descrição' ou 'Produto'.")
+    parser.add_argument("--k", type=int, default=5, help="Candidatos por produto.")
+    parser.add_argument("--sintetico", type=int, default=None, metavar="N",
+                        help="Classifica um lote sintético de N produtos (10%% com NCM trocado) e mede o acerto.")
+    parser.add_argument("--saida", default=None, help="Grava o resultado em CSV.")
+    args = parser.parse_args()
+    if not args.arquivo and not args.sintetico:
+        parser.error("informe um arquivo ou --sintetico N")
+
+    inicio = time.perf_counter()
+    classificador_ncm()
+    print(f"Índice: {len(classificador_ncm().codigos)} NCMs, {len(classificador_ncm().vocabulario)} termos, "
+          f"{time.perf_counter() - inicio:.2f} s")
+
+    trocados = None
+    if args.sintetico:
+        produtos, trocados = lote_sintetico(classificador_ncm(), args.sintetico)
+    elif args.arquivo.lower().endswith((".xlsx", ".xls")):
+        produtos = pd.read_excel(args.arquivo, dtype={'NCM': str})
+    else:
+        produtos = pd.read_csv(args.arquivo, dtype={'NCM': str})
+
+    inicio = time.perf_counter()
+    resultado = classificar_produtos(produtos, k=args.k, coluna_descricao=args.coluna_descricao)
+    segundos = time.perf_counter() - inicio
+    suspeitas = resultado['Suspeita NCM'].to_numpy()
+    print(f"{len(produtos)} produtos em {segundos:.2f} s ({len(produtos) / max(segundos, 1e-9):.0f}/s): "
+          f"{int(suspeitas.sum())} suspeitas")
+    if trocados is not None:
+        acertos = int((suspeitas & trocados).sum())
+        print(f"NCMs trocados detectados: {acertos}/{int(trocados.sum())}; "
+              f"suspeitas em itens corretos: {int((suspeitas & ~trocados).sum())}/{int((~trocados).sum())}")
+
+    if args.saida:
+        pd.concat([produtos, resultado.drop(columns=['NCM Declarado'])], axis=1).to_csv(args.saida, index=False)
+        print(f"Resultado gravado em {args.saida}")
+    elif not args.sintetico:
+        print(pd.concat([produtos, resultado[['NCM Sugerido', 'Suspeita NCM', 'Motivo Suspeita']]], axis=1)
+              .to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
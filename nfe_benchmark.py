@@ -0,0 +1,315 @@
+"""
+Benchmark da extração de NF-e (view.extrator_xml): tempo e pico de memória por modo.
+
+Gera uma NF-e sintética com --itens itens `det` (estrutura de nfeProc com assinatura e
+protocolo) e mede cada modo num processo Python próprio, para que o pico de RSS de um não
+contamine o outro:
+
+- dom: extrair_dados_xml sobre o conteúdo decodificado, como o app faz no upload
+- streaming: extrair_dados_xml_streaming sobre o arquivo (mesmo resultado, uma passada)
+- streaming-blocos: só percorre os blocos de LeitorNFe, sem juntar os produtos num DataFrame
+- lxml: extrair_dados_xml_lxml (view.extrator_lxml, XPath compilados), se o lxml estiver instalado
+
+pico_mb é o pico de RSS do processo durante a extração menos o RSS logo antes dela (após as
+importações). Em seguida mede a vazão (documentos/s) de cada implementação sobre --documentos
+NF-e de --itens-por-nota itens já em memória, o caso da ingestão em lote.
+
+Antes de medir, confere que streaming e lxml devolvem DataFrames idênticos aos de
+extrair_dados_xml, na NF-e grande e em variações dela (declaração ISO-8859-1, tags vazias,
+seções e grupos ausentes, ICMS ST e Simples Nacional, IPI/PIS/COFINS não tributados, item sem
+imposto, nota sem nfeProc), e que divergencias_tributos não acusa nada nessas variações, todas
+com tributos coerentes. Com divergência, o script termina com código 1.
+
+    python nfe_benchmark.py                        # 10.000 itens, 500 documentos de 20 itens
+    python nfe_benchmark.py --itens 50000 --repeticoes 3
+    python nfe_benchmark.py --modos dom lxml --documentos 2000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODOS = ("dom", "streaming", "streaming-blocos", "lxml")
+
+
+def gerar_nfe(caminho: str, itens: int, semente: int = 0) -> None:
+    """Grava uma NF-e sintética com `itens` produtos (parte sem IPI, como em notas reais)."""
+    rng = random.Random(semente)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe><infNFe Id="NFe35" versao="4.00">'
+            '<ide><cUF>35</cUF><natOp>VENDA DE MERCADORIA</natOp><mod>55</mod><serie>1</serie><nNF>123456</nNF>'
+            '<dhEmi>2025-10-24T10:00:00-03:00</dhEmi><dhSaiEnt>2025-10-24T11:00:00-03:00</dhSaiEnt><tpNF>1</tpNF>'
+            '<finNFe>1</finNFe></ide>'
+            '<emit><CNPJ>12345678000195</CNPJ><xNome>EMITENTE SINTETICO LTDA</xNome><xFant>SINTETICO</xFant>'
+            '<enderEmit><xMun>SAO PAULO</xMun><UF>SP</UF><CEP>01001000</CEP></enderEmit><IE>111111111111</IE></emit>'
+            '<dest><CNPJ>98765432000110</CNPJ><xNome>DESTINATARIO SINTETICO SA</xNome>'
+            '<enderDest><xMun>CURITIBA</xMun><UF>PR</UF><CEP>80010000</CEP></enderDest><IE>2222222222</IE></dest>'
+        )
+        for item in range(1, itens + 1):
+            quantidade = rng.randint(1, 50)
+            unitario = rng.randint(100, 100000) / 100
+            total = quantidade * unitario
+            ipi = (f'<IPI><cEnq>999</cEnq><IPITrib><CST>50</CST><vBC>{total:.2f}</vBC><pIPI>5.00</pIPI>'
+                   f'<vIPI>{total * 0.05:.2f}</vIPI></IPITrib></IPI>') if item % 7 else ""
+            arquivo.write(
+                f'<det nItem="{item}"><prod><cProd>P{item:06d}</cProd><cEAN>SEM GTIN</cEAN>'
+                f'<xProd>PRODUTO SINTETICO {item} DESCRICAO DE TESTE</xProd><NCM>{rng.randint(1010000, 97069000):08d}</NCM>'
+                f'<CFOP>6102</CFOP><uCom>UN</uCom><qCom>{quantidade:.4f}</qCom><vUnCom>{unitario:.10f}</vUnCom>'
+                f'<vProd>{total:.2f}</vProd><indTot>1</indTot></prod>'
+                f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><modBC>3</modBC><vBC>{total:.2f}</vBC>'
+                f'<pICMS>12.00</pICMS><vICMS>{total * 0.12:.2f}</vICMS></ICMS00></ICMS>{ipi}'
+                f'<PIS><PISAliq><CST>01</CST><vBC>{total:.2f}</vBC><pPIS>1.65</pPIS><vPIS>{total * 0.0165:.2f}</vPIS></PISAliq></PIS>'
+                f'<COFINS><COFINSAliq><CST>01</CST><vBC>{total:.2f}</vBC><pCOFINS>7.60</pCOFINS>'
+                f'<vCOFINS>{total * 0.076:.2f}</vCOFINS></COFINSAliq></COFINS></imposto></det>'
+            )
+        arquivo.write(
+            '<total><ICMSTot><vBC>1000.00</vBC><vICMS>120.00</vICMS><vProd>1000.00</vProd><vFrete>0.00</vFrete>'
+            '<vIPI>50.00</vIPI><vPIS>16.50</vPIS><vCOFINS>76.00</vCOFINS><vNF>1050.00</vNF></ICMSTot></total>'
+            '<transp><modFrete>0</modFrete><transporta><CNPJ>11222333000181</CNPJ><xNome>TRANSPORTES SINTETICOS</xNome>'
+            '<UF>SP</UF></transporta><vol><qVol>10</qVol><pesoL>100.000</pesoL><pesoB>110.000</pesoB></vol></transp>'
+            '<cobr><fat><nFat>123456</nFat><vOrig>1050.00</vOrig><vLiq>1050.00</vLiq></fat>'
+            '<dup><nDup>001</nDup><dVenc>2025-11-24</dVenc><vDup>1050.00</vDup></dup></cobr>'
+            '</infNFe><Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignatureValue>AAAA</SignatureValue>'
+            '</Signature></NFe><protNFe versao="4.00"><infProt><cStat>100</cStat></infProt></protNFe></nfeProc>'
+        )
+
+
+def _zerar_pico_rss() -> bool:
+    """Reinicia o pico de RSS do processo (Linux), para que o das importações não esconda o da extração."""
+    try:
+        with open("/proc/self/clear_refs", "w") as arquivo:
+            arquivo.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(campo: str) -> float:
+    """VmRSS (atual) ou VmHWM (pico) de /proc/self/status; fora do Linux, o pico do getrusage (0 sem ele)."""
+    try:
+        with open("/proc/self/status") as arquivo:
+            for linha in arquivo:
+                if linha.startswith(campo + ":"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def imprimir_tabela(resultados: List[Dict[str, Any]], colunas: List[str]) -> None:
+    def celula(valor) -> str:
+        return f"{valor:.3f}" if isinstance(valor, float) else str(valor)
+
+    larguras = [max([len(coluna)] + [len(celula(r.get(coluna, ""))) for r in resultados]) for coluna in colunas]
+    print("  ".join(coluna.ljust(largura) for coluna, largura in zip(colunas, larguras)))
+    for r in resultados:
+        print("  ".join(celula(r.get(coluna, "")).ljust(largura) for coluna, largura in zip(colunas, larguras)))
+
+
+def medir(modo: str, caminho: str) -> Dict[str, Any]:
+    """Roda um modo neste processo e devolve tempo, itens e o pico de RSS acima do RSS inicial."""
+    from view.extrator_lxml import extrair_dados_xml_lxml
+    from view.extrator_xml import LeitorNFe, extrair_dados_xml_streaming
+    from view.main import extrair_dados_xml
+
+    _zerar_pico_rss()
+    base = _rss_mb("VmRSS")
+    inicio = time.perf_counter()
+    if modo == "dom":
+        with open(caminho, "rb") as arquivo:
+            _, produtos = extrair_dados_xml(arquivo.read().decode("utf-8"))
+        itens = len(produtos)
+    elif modo == "streaming":
+        _, produtos = extrair_dados_xml_streaming(caminho)
+        itens = len(produtos)
+    elif modo == "lxml":
+        _, produtos = extrair_dados_xml_lxml(caminho)
+        itens = len(produtos)
+    else:
+        leitor = LeitorNFe(caminho)
+        for _ in leitor.blocos():
+            pass
+        itens = leitor.itens
+    return {"modo": modo, "itens": itens, "segundos": time.perf_counter() - inicio,
+            "pico_mb": _rss_mb("VmHWM") - base}
+
+
+def _extratores(modos) -> Dict[str, Callable]:
+    """Implementação completa (cabeçalho e produtos) de cada modo pedido; dom sempre entra como referência."""
+    from view.extrator_lxml import extrair_dados_xml_lxml, lxml_disponivel
+    from view.extrator_xml import extrair_dados_xml_streaming
+    from view.main import extrair_dados_xml
+
+    extratores = {"dom": extrair_dados_xml}
+    if "streaming" in modos or "streaming-blocos" in modos:
+        extratores["streaming"] = extrair_dados_xml_streaming
+    if "lxml" in modos and lxml_disponivel():
+        extratores["lxml"] = extrair_dados_xml_lxml
+    return extratores
+
+
+def variacoes_paridade(conteudo: str) -> Iterator[Tuple[str, str]]:
+    """A NF-e sintética e variações com os casos de borda dos extratores (nome, XML decodificado)."""
+    inicio_det = conteudo.index("<det ")
+    fim_det = conteudo.index("</det>", conteudo.index("</det>") + 1) + len("</det>")
+    pequena = conteudo[:inicio_det] + conteudo[inicio_det:fim_det] + conteudo[conteudo.index("<total>"):]
+    yield "completa", conteudo
+    yield "iso-8859-1", pequena.replace('encoding="UTF-8"', 'encoding="ISO-8859-1"')
+    yield "tags vazias", (pequena.replace("<xFant>SINTETICO</xFant>", "<xFant/>")
+                          .replace("<qVol>10</qVol>", "<qVol></qVol>").replace("<CFOP>6102</CFOP>", "<CFOP/>", 1))
+    yield "sem transp e cobr", (pequena[:pequena.index("<transp>")]
+                                + pequena[pequena.index("</cobr>") + len("</cobr>"):])
+    yield "sem grupos", (pequena.replace(pequena[pequena.index("<transporta>"):pequena.index("</transporta>") + 13], "")
+                         .replace(pequena[pequena.index("<dup>"):pequena.index("</dup>") + 6], "")
+                         .replace("<dest>", "<dest><CPF>12345678909</CPF>", 1))
+    yield "item sem imposto", pequena.replace(pequena[pequena.index("<imposto>"):pequena.index("</imposto>") + 10], "", 1)
+    icms = pequena[pequena.index("<ICMS>"):pequena.index("</ICMS>") + 7]
+    yield "ICMS ST e Simples", (pequena.replace(icms, (
+        '<ICMS><ICMS10><orig>2</orig><CST>10</CST><modBC>3</modBC><vBC>100.00</vBC><pICMS>18.00</pICMS>'
+        '<vICMS>18.00</vICMS><vBCFCP>100.00</vBCFCP><pFCP>2.00</pFCP><vFCP>2.00</vFCP><modBCST>4</modBCST>'
+        '<pMVAST>40.00</pMVAST><vBCST>140.00</vBCST><pICMSST>18.00</pICMSST><vICMSST>7.20</vICMSST></ICMS10></ICMS>'), 1)
+                                .replace(icms, '<ICMS><ICMSSN102><orig>0</orig><CSOSN>102</CSOSN></ICMSSN102></ICMS>', 1))
+    # ST no Simples: o ICMS próprio deduzido não aparece no grupo (vICMSST = 140 x 18% - 18)
+    yield "ICMS ST no Simples", pequena.replace(icms, (
+        '<ICMS><ICMSSN202><orig>0</orig><CSOSN>202</CSOSN><modBCST>4</modBCST><pMVAST>40.00</pMVAST>'
+        '<vBCST>140.00</vBCST><pICMSST>18.00</pICMSST><vICMSST>7.20</vICMSST></ICMSSN202></ICMS>'), 1)
+    yield "IPI, PIS e COFINS não tributados", (pequena
+        .replace(pequena[pequena.index("<IPITrib>"):pequena.index("</IPITrib>") + 10], "<IPINT><CST>53</CST></IPINT>")
+        .replace(pequena[pequena.index("<PISAliq>"):pequena.index("</PISAliq>") + 10], "<PISNT><CST>07</CST></PISNT>", 1)
+        .replace(pequena[pequena.index("<COFINSAliq>"):pequena.index("</COFINSAliq>") + 13],
+                 "<COFINSQtde><CST>03</CST><qBCProd>10.0000</qBCProd><vAliqProd>0.5000</vAliqProd>"
+                 "<vCOFINS>5.00</vCOFINS></COFINSQtde>", 1))
+    yield "NFe sem nfeProc", (pequena[pequena.index("<NFe>"):pequena.index("</NFe>") + 6]
+                              .replace("<NFe>", '<NFe xmlns="http://www.portalfiscal.inf.br/nfe">', 1))
+
+
+def conferir_paridade(caminho: str, modos=MODOS) -> List[Tuple[str, str]]:
+    """Compara cada modo com extrair_dados_xml nas variações da NF-e; devolve as (variação, modo) divergentes."""
+    extratores = _extratores(modos)
+    referencia = extratores.pop("dom")
+    with open(caminho, "rb") as arquivo:
+        conteudo = arquivo.read().decode("utf-8")
+    divergentes = []
+    for nome, xml in variacoes_paridade(conteudo):
+        esperado = referencia(xml)
+        for modo, extrator in extratores.items():
+            for fonte in (xml, xml.encode("utf-8") if nome != "iso-8859-1" else xml.encode("latin-1")):
+                obtido = extrator(fonte)
+                if not all(a.equals(b) and list(a.columns) == list(b.columns) for a, b in zip(esperado, obtido)):
+                    divergentes.append((nome, modo))
+                    break
+    return divergentes
+
+
+def conferir_tributos(caminho: str) -> List[str]:
+    """Variações em que divergencias_tributos acusa algo; todas são coerentes, então deve vir vazia."""
+    from view.extrator_xml import divergencias_tributos
+    from view.main import extrair_dados_xml
+
+    with open(caminho, "rb") as arquivo:
+        conteudo = arquivo.read().decode("utf-8")
+    return [nome for nome, xml in variacoes_paridade(conteudo)
+            if not divergencias_tributos(extrair_dados_xml(xml)[1]).empty]
+
+
+def medir_vazao(modos, documentos: int, itens_por_nota: int, tmp: str) -> List[Dict[str, Any]]:
+    """Documentos/s de cada implementação sobre `documentos` NF-e (bytes já em memória)."""
+    distintas = []
+    for semente in range(min(documentos, 100)):
+        caminho = os.path.join(tmp, f"nota_{semente}.xml")
+        gerar_nfe(caminho, itens_por_nota, semente)
+        with open(caminho, "rb") as arquivo:
+            distintas.append(arquivo.read())
+    lote = [distintas[i % len(distintas)] for i in range(documentos)]
+
+    resultados = []
+    for modo, extrator in _extratores(modos).items():
+        if modo not in modos:
+            continue
+        extrator(lote[0])  # Aquecimento (importações, XPath compilados)
+        inicio = time.perf_counter()
+        for conteudo in lote:
+            extrator(conteudo)
+        segundos = time.perf_counter() - inicio
+        resultados.append({"modo": modo, "documentos": documentos, "segundos": segundos,
+                           "documentos_s": documentos / segundos})
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo e pico de memória da extração de NF-e por modo.")
+    parser.add_argument("--itens", type=int, default=10000, help="Itens det da NF-e sintética.")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--repeticoes", type=int, default=1, help="Execuções (processos) por modo; vale a mediana do tempo.")
+    parser.add_argument("--documentos", type=int, default=500, help="NF-e da medição de vazão (0 desliga).")
+    parser.add_argument("--itens-por-nota", type=int, default=20, help="Itens det de cada NF-e da medição de vazão.")
+    parser.add_argument("--medir", nargs=2, metavar=("MODO", "ARQUIVO"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:  # Processo filho
+        print(json.dumps(medir(*args.medir)))
+        return
+
+    from view.extrator_lxml import lxml_disponivel
+
+    modos = list(args.modos)
+    if "lxml" in modos and not lxml_disponivel():
+        print("lxml não instalado (pip install lxml): modo lxml ignorado.")
+        modos.remove("lxml")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "nfe_sintetica.xml")
+        gerar_nfe(caminho, args.itens)
+        print(f"NF-e sintética: {args.itens} itens, {os.path.getsize(caminho) / 1e6:.1f} MB")
+        divergentes = conferir_paridade(caminho, modos)
+        for variacao, modo in divergentes:
+            print(f"Paridade DIVERGENTE: {modo} x dom na variação '{variacao}'")
+        print(f"Paridade com dom: {'DIVERGENTE' if divergentes else 'OK'}")
+        falsos_positivos = conferir_tributos(caminho)
+        for variacao in falsos_positivos:
+            print(f"Conferência de tributos acusou divergência na variação coerente '{variacao}'")
+        print(f"Conferência de tributos: {'DIVERGENTE' if falsos_positivos else 'OK'}")
+
+        resultados = []
+        for modo in modos:
+            execucoes = []
+            for _ in range(args.repeticoes):
+                processo = subprocess.run([sys.executable, __file__, "--medir", modo, caminho],
+                                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+                if processo.returncode != 0:
+                    raise RuntimeError(f"Falha no modo {modo}:\n{processo.stderr[-2000:]}")
+                execucoes.append(json.loads(processo.stdout.strip().splitlines()[-1]))
+            execucoes.sort(key=lambda resultado: resultado["segundos"])
+            resultado = execucoes[len(execucoes) // 2]
+            resultado["pico_mb"] = max(execucao["pico_mb"] for execucao in execucoes)
+            resultados.append(resultado)
+            print(f"  {modo}: ok")
+
+        vazao = medir_vazao(modos, args.documentos, args.itens_por_nota, tmp) if args.documentos > 0 else []
+
+    print()
+    imprimir_tabela(resultados, ["modo", "itens", "segundos", "pico_mb"])
+    if vazao:
+        print(f"\nVazão: {args.documentos} NF-e de {args.itens_por_nota} itens em memória")
+        imprimir_tabela(vazao, ["modo", "documentos", "segundos", "documentos_s"])
+    if divergentes or falsos_positivos:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,6 @@ import os
 # Adiciona o diretório raiz ao sys.path para garantir que as importações funcionem
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from agents.validador import buscar_regras_fiscais_nfe
-
 st.set_page_config(layout="wide", page_title="Validador Fiscal", page_icon="📊")
 
 # --- Barra Lateral Profissional ---
@@ -42,6 +40,9 @@ else:
     if st.button("Executar Análise do Validador", type="primary", width="stretch"):
         with st.spinner("Analisando conformidade fiscal com o Agente Validador... Isso pode levar um momento."):
             try:
+                # O agente (LLM e RAG) só é carregado na primeira análise.
+                from agents.validador import buscar_regras_fiscais_nfe
+
                 resultado = buscar_regras_fiscais_nfe(
                     st.session_state['cabecalho_criptografado'], 
                     st.session_state['produtos_criptografado']
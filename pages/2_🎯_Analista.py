@@ -5,8 +5,6 @@ import os
 # Adiciona o diretório raiz ao sys.path para garantir que as importações funcionem
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from agents.analista import analisar_discrepancias_nfe
-
 st.set_page_config(layout="wide", page_title="Analista Fiscal", page_icon="🎯")
 
 # --- Barra Lateral Profissional ---
@@ -51,6 +49,9 @@ else:
     if st.button("Analisar Discrepâncias com IA", type="primary", width="stretch"):
         with st.spinner("Analisando discrepâncias com o Agente Analista... Isso pode levar um momento."):
             try:
+                # O agente (LLM e RAG) só é carregado na primeira análise.
+                from agents.analista import analisar_discrepancias_nfe
+
                 resultado_analista = analisar_discrepancias_nfe(
                     st.session_state['cabecalho_criptografado'],
                     st.session_state['produtos_criptografado'],
@@ -5,8 +5,6 @@ import os
 # Adiciona o diretório raiz ao sys.path para garantir que as importações funcionem
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from agents.tributarista import calcular_delta_tributario
-
 st.set_page_config(layout="wide", page_title="Tributarista Fiscal", page_icon="🧮")
 
 # --- Barra Lateral Profissional ---
@@ -43,6 +41,9 @@ else:
     if st.button("Calcular Delta Tributário e Multas", type="primary", width="stretch"):
         with st.spinner("Calculando impacto financeiro com o Agente Tributarista... Isso pode levar um momento."):
             try:
+                # O agente (LLM e RAG) só é carregado na primeira análise.
+                from agents.tributarista import calcular_delta_tributario
+
                 resultado_tributarista = calcular_delta_tributario(
                     st.session_state['cabecalho_criptografado'],
                     st.session_state['produtos_criptografado'],
@@ -0,0 +1,249 @@
+"""
+Ingestão em lote de NF-e: diretórios, arquivos ZIP e tar(.gz) com milhares de XMLs.
+
+Percorre as fontes informadas (um XML, um diretório — recursivo, incluindo os arquivos
+compactados que houver nele — um .zip ou um .tar/.tar.gz/.tgz/.tar.bz2) lendo cada XML direto
+para a memória, sem extrair nada em disco; os tar são lidos em modo de fluxo. Os XMLs são
+agrupados em tarefas e extraídos num pool de processos com extrair_dados_xml_lxml
+(view.extrator_lxml) quando o lxml está instalado, ou com o leitor em uma passada de
+view.extrator_xml; os dois dão o mesmo resultado de extrair_dados_xml. Só a fila de tarefas é
+limitada (algumas por processo), para não ler o lote inteiro antes de extrair; os resultados
+ficam em memória até a montagem das tabelas, que portanto crescem com o número de XMLs.
+
+O resultado são três tabelas consolidadas, todas com a coluna 'Arquivo' (caminho do XML, com
+"!" separando o arquivo compactado do membro):
+
+- cabeçalhos: uma linha por NF-e
+- itens: uma linha por item de cada NF-e
+- erros: uma linha por XML que não pôde ser lido ou extraído, com a mensagem
+
+    python processar_lote.py notas/ 2025-10.zip --saida auditoria/          # CSV
+    python processar_lote.py notas.tar.gz --saida auditoria/ --formato xlsx --workers 8
+"""
+
+import os
+import time
+import tarfile
+import zipfile
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from view.extrator_lxml import extrair_dados_xml_lxml, lxml_disponivel
+from view.extrator_xml import extrair_dados_xml_streaming
+
+# XMLs enviados por tarefa ao pool: amortiza o custo de IPC de notas pequenas.
+ARQUIVOS_POR_TAREFA = 32
+
+EXTRATORES = {"lxml": extrair_dados_xml_lxml, "streaming": extrair_dados_xml_streaming}
+
+_EXTENSOES_TAR = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz")
+
+Membro = Tuple[str, Optional[bytes], Optional[str]]  # (nome, conteúdo, erro de leitura)
+Extracao = Tuple[str, Optional[Dict[str, str]], Optional[pd.DataFrame], Optional[str]]
+
+
+def _eh_tar(nome: str) -> bool:
+    return nome.lower().endswith(_EXTENSOES_TAR)
+
+
+def iterar_xmls(caminho: str) -> Iterator[Membro]:
+    """(nome, conteúdo, None) de cada XML da fonte, ou (nome, None, erro) do que não pôde ser lido."""
+    nome = caminho.lower()
+    try:
+        if os.path.isdir(caminho):
+            for raiz, diretorios, arquivos in os.walk(caminho):
+                diretorios.sort()
+                for arquivo in sorted(arquivos):
+                    completo = os.path.join(raiz, arquivo)
+                    if arquivo.lower().endswith((".xml", ".zip")) or _eh_tar(arquivo):
+                        yield from iterar_xmls(completo)
+        elif nome.endswith(".zip"):
+            with zipfile.ZipFile(caminho) as compactado:
+                for info in compactado.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(".xml"):
+                        try:
+                            yield f"{caminho}!{info.filename}", compactado.read(info), None
+                        except (zipfile.BadZipFile, OSError, RuntimeError) as e:
+                            yield f"{caminho}!{info.filename}", None, f"Erro ao ler do ZIP: {e}"
+        elif _eh_tar(nome):
+            # "r|*": leitura em fluxo, membro a membro, sem acesso aleatório nem extração em disco
+            with tarfile.open(caminho, "r|*") as compactado:
+                for membro in compactado:
+                    if membro.isfile() and membro.name.lower().endswith(".xml"):
+                        yield f"{caminho}!{membro.name}", compactado.extractfile(membro).read(), None
+        else:
+            with open(caminho, "rb") as arquivo:
+                yield caminho, arquivo.read(), None
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        yield caminho, None, f"Erro ao ler a fonte: {e}"
+
+
+def extrair_lote(membros: List[Tuple[str, bytes]], extrator: str = "streaming") -> List[Extracao]:
+    """Extrai cada XML da tarefa; uma falha fica registrada no próprio XML e não derruba as demais."""
+    extrair = EXTRATORES[extrator]
+    resultados = []
+    for nome, conteudo in membros:
+        try:
+            cabecalho_df, produtos_df = extrair(conteudo)
+            resultados.append((nome, cabecalho_df.iloc[0].to_dict(), produtos_df, None))
+        except Exception as e:
+            resultados.append((nome, None, None, f"{type(e).__name__}: {e}"))
+    return resultados
+
+
+def _tarefas(membros: Iterable[Membro], erros: List[Dict[str, str]], tamanho: int) -> Iterator[List[Tuple[str, bytes]]]:
+    """Agrupa os XMLs legíveis em tarefas; os ilegíveis vão direto para `erros`."""
+    def legiveis():
+        for nome, conteudo, erro in membros:
+            if erro is not None:
+                erros.append({"Arquivo": nome, "Erro": erro})
+            else:
+                yield nome, conteudo
+
+    iterador = legiveis()
+    while True:
+        tarefa = list(itertools.islice(iterador, tamanho))
+        if not tarefa:
+            return
+        yield tarefa
+
+
+def _resultado(futuro, nomes: List[str]) -> List[Extracao]:
+    """Resultado da tarefa ou, se o processo que a extraía morreu (falta de memória, falha do lxml), um erro por XML."""
+    try:
+        return futuro.result()
+    except Exception as e:
+        erro = f"Falha no processo de extração: {type(e).__name__}: {e}"
+        return [(nome, None, None, erro) for nome in nomes]
+
+
+class _Consolidado:
+    """Junta os resultados das tarefas, que chegam fora de ordem, na ordem em que os XMLs foram lidos."""
+
+    def __init__(self):
+        self.partes: Dict[int, List[Extracao]] = {}
+        self.erros_leitura: List[Dict[str, str]] = []
+        self.processados = 0
+        self.inicio = time.perf_counter()
+        self.ultimo_relatorio = self.inicio
+
+    def adicionar(self, indice: int, resultados: List[Extracao]):
+        self.partes[indice] = resultados
+        self.processados += len(resultados)
+        agora = time.perf_counter()
+        if agora - self.ultimo_relatorio >= 5.0:
+            self.ultimo_relatorio = agora
+            print(f"{self.processados} XMLs processados ({self.processados / (agora - self.inicio):.0f}/s)...")
+
+    def tabelas(self) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        cabecalhos, itens, erros = [], [], list(self.erros_leitura)
+        for indice in sorted(self.partes):
+            for nome, cabecalho, produtos, erro in self.partes[indice]:
+                if erro is not None:
+                    erros.append({"Arquivo": nome, "Erro": erro})
+                    continue
+                cabecalhos.append({"Arquivo": nome, **cabecalho})
+                if not produtos.empty:
+                    itens.append(produtos.assign(Arquivo=nome)[["Arquivo", *produtos.columns]])
+        itens_df = pd.concat(itens, ignore_index=True).fillna("0") if itens else pd.DataFrame(columns=["Arquivo"])
+        return pd.DataFrame(cabecalhos).fillna("0"), itens_df, pd.DataFrame(erros, columns=["Arquivo", "Erro"])
+
+
+def processar_lote(fontes: Iterable[str], workers: Optional[int] = None,
+                   arquivos_por_tarefa: int = ARQUIVOS_POR_TAREFA,
+                   extrator: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Extrai todos os XMLs das fontes e devolve (cabeçalhos, itens, erros). `workers` usa por
+    padrão NFE_LOTE_WORKERS ou o número de CPUs; 0 ou 1 processa tudo neste processo. Se um
+    processo do pool morrer, os XMLs das tarefas que estavam nele vão para os erros e as
+    tarefas seguintes seguem num pool novo.
+    `extrator` ("lxml" ou "streaming") usa por padrão o lxml, se instalado.
+    """
+    if workers is None:
+        workers = int(os.environ.get("NFE_LOTE_WORKERS", os.cpu_count() or 1))
+    if extrator is None:
+        extrator = "lxml" if lxml_disponivel() else "streaming"
+    consolidado = _Consolidado()
+    membros = itertools.chain.from_iterable(iterar_xmls(fonte) for fonte in fontes)
+    tarefas = enumerate(_tarefas(membros, consolidado.erros_leitura, arquivos_por_tarefa))
+
+    if workers <= 1:
+        for indice, tarefa in tarefas:
+            consolidado.adicionar(indice, extrair_lote(tarefa, extrator))
+    else:
+        # spawn, como na ingestão do RAG: o processo pai pode ter bibliotecas que não sobrevivem a fork
+        contexto = multiprocessing.get_context("spawn")
+        pendentes = {}
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+        try:
+            for indice, tarefa in tarefas:
+                try:
+                    futuro = pool.submit(extrair_lote, tarefa, extrator)
+                except BrokenProcessPool:
+                    # As tarefas em voo no pool quebrado falham com ele; as próximas vão para um novo
+                    pool.shutdown()
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+                    futuro = pool.submit(extrair_lote, tarefa, extrator)
+                pendentes[futuro] = (indice, [nome for nome, _ in tarefa])
+                if len(pendentes) >= workers * 2:
+                    concluidas, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    for futuro in concluidas:
+                        indice_concluido, nomes = pendentes.pop(futuro)
+                        consolidado.adicionar(indice_concluido, _resultado(futuro, nomes))
+            for futuro, (indice, nomes) in pendentes.items():
+                consolidado.adicionar(indice, _resultado(futuro, nomes))
+        finally:
+            pool.shutdown()
+
+    cabecalhos, itens, erros = consolidado.tabelas()
+    segundos = time.perf_counter() - consolidado.inicio
+    total = len(cabecalhos) + len(erros)
+    print(f"{total} XMLs em {segundos:.1f}s ({total / max(segundos, 1e-9):.0f}/s, {max(1, workers)} processos, {extrator}): "
+          f"{len(cabecalhos)} NF-e, {len(itens)} itens, {len(erros)} erros.")
+    return cabecalhos, itens, erros
+
+
+def salvar_tabelas(cabecalhos: pd.DataFrame, itens: pd.DataFrame, erros: pd.DataFrame, saida: str,
+                   formato: str = "csv") -> List[str]:
+    """Grava as três tabelas em `saida` (CSV separados ou uma planilha com três abas)."""
+    os.makedirs(saida, exist_ok=True)
+    tabelas = {"cabecalhos": cabecalhos, "itens": itens, "erros": erros}
+    if formato == "xlsx":
+        caminho = os.path.join(saida, "nfe_lote.xlsx")
+        with pd.ExcelWriter(caminho, engine="xlsxwriter") as planilha:
+            for nome, tabela in tabelas.items():
+                tabela.to_excel(planilha, sheet_name=nome, index=False)
+        return [caminho]
+    caminhos = []
+    for nome, tabela in tabelas.items():
+        caminhos.append(os.path.join(saida, f"{nome}.csv"))
+        tabela.to_csv(caminhos[-1], index=False)
+    return caminhos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extrai em lote NF-e de diretórios, ZIPs e tar(.gz).")
+    parser.add_argument("fontes", nargs="+", help="XMLs, diretórios, .zip ou .tar/.tar.gz.")
+    parser.add_argument("--saida", required=True, help="Diretório das tabelas consolidadas.")
+    parser.add_argument("--formato", choices=("csv", "xlsx"), default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: NFE_LOTE_WORKERS ou nº de CPUs).")
+    parser.add_argument("--arquivos-por-tarefa", type=int, default=ARQUIVOS_POR_TAREFA)
+    parser.add_argument("--extrator", choices=sorted(EXTRATORES), default=None,
+                        help="Implementação da extração (padrão: lxml, se instalado).")
+    args = parser.parse_args()
+
+    cabecalhos, itens, erros = processar_lote(args.fontes, args.workers, args.arquivos_por_tarefa, args.extrator)
+    for caminho in salvar_tabelas(cabecalhos, itens, erros, args.saida, args.formato):
+        print(f"Gravado: {caminho}")
+    if len(erros):
+        print(f"Primeiros erros:\n{erros.head(10).to_string(index=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,531 @@
+"""
+Vector store backends for RAGSystem.
+
+Both backends expose the same small interface (create/drop/count, upsert/delete by point id,
+bulk_writes, scroll, retrieve and batched top-k search with metadata equality filters), so the sync,
+snapshot and retrieval code in rag_system is backend-agnostic:
+
+- QdrantBackend: a Qdrant collection, embedded (local path) or on a server.
+- NumpyBackend: L2-normalized vectors in one contiguous float32 array, searched with blocked
+  matrix products and argpartition top-k, persisted as a .npy file plus a JSONL of payloads.
+  Enough for a corpus the size of referencias/ without running a vector database.
+
+Both take the same `quantization` mode for the stored vectors:
+
+- "none": float32 vectors.
+- "float16": half-precision vectors (half the memory, scores lose ~3 significant digits).
+- "int8": scalar quantization to one byte per dimension (a quarter of the memory). The search
+  scans the int8 codes, then rescores the best RESCORE_OVERSAMPLING * k candidates with the
+  full-precision vectors, which stay on disk (Qdrant: on_disk vectors; NumPy: the memory-mapped
+  vectors.npy), so the ranking of the returned hits is exact.
+"""
+
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from qdrant_client.http.models import (
+    Distance, VectorParams, PointIdsList, PointStruct, Filter, FieldCondition, MatchValue, QueryRequest,
+    Datatype, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams, QuantizationSearchParams,
+)
+
+from rag_retrieval import filters_key, matches_filters
+
+# (point id, payload {"page_content", "metadata"}, vector or None)
+Point = Tuple[str, Dict[str, Any], Optional[List[float]]]
+
+NUMPY_STORE_FORMAT_VERSION = 1
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+# int8 search: approximate candidates rescored with full-precision vectors, per requested hit
+RESCORE_OVERSAMPLING = 4
+
+
+def quantization_mode(value: Optional[str]) -> str:
+    mode = (value or "none").lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown vector quantization '{value}' (expected one of {', '.join(QUANTIZATION_MODES)})")
+    return mode
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector scalar quantization: matrix ~= codes * scales[:, None]."""
+    scales = np.abs(matrix).max(axis=1).astype(np.float32) / 127.0
+    codes = np.rint(matrix / np.where(scales == 0, 1, scales)[:, None]).astype(np.int8)
+    return codes, scales
+
+
+class QdrantBackend:
+    name = "qdrant"
+
+    def __init__(self, client, collection_name: str, location: str, quantization: Optional[str] = None):
+        self.client = client
+        self.collection_name = collection_name
+        self.location = location
+        self.quantization = quantization_mode(quantization)
+
+    def exists(self) -> bool:
+        return self.client.collection_exists(self.collection_name)
+
+    def create(self, dim: int):
+        # Vectors and payloads live in memory-mapped storage on a Qdrant server, with int8 codes
+        # pinned in RAM when quantized; embedded mode persists everything under qdrant_path and
+        # ignores these hints (it always searches full-precision vectors).
+        quantization_config = None
+        if self.quantization == "int8":
+            quantization_config = ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE, on_disk=True,
+                                        datatype=Datatype.FLOAT16 if self.quantization == "float16" else None),
+            quantization_config=quantization_config,
+            on_disk_payload=True,
+        )
+
+    def drop(self):
+        self.client.delete_collection(collection_name=self.collection_name)
+
+    def count(self) -> int:
+        return self.client.count(collection_name=self.collection_name, exact=True).count
+
+    def dim(self) -> int:
+        return self.client.get_collection(self.collection_name).config.params.vectors.size
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]]):
+        vectors = np.asarray(vectors, dtype=np.float32).tolist()
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[PointStruct(id=point_id, vector=vector, payload=payload)
+                    for point_id, vector, payload in zip(ids, vectors, payloads)],
+        )
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=ids))
+
+    def flush(self):
+        pass  # Qdrant persists on every write
+
+    @contextmanager
+    def bulk_writes(self):
+        """
+        Groups the writes made inside the block. Embedded Qdrant (qdrant-client local mode)
+        commits its sqlite storage once per point, ~35 ms each, which made loading a snapshot
+        as slow as a rebuild; here those commits are deferred to a single one at the end. A
+        Qdrant server, or a client whose local storage does not have that layout, is unaffected.
+        """
+        collection = getattr(getattr(self.client, "_client", None), "collections", {}).get(self.collection_name)
+        persistence = getattr(collection, "storage", None)
+        connection = getattr(persistence, "storage", None)
+        if connection is None or not hasattr(connection, "commit"):
+            yield
+            return
+        persistence.storage = _DeferredCommit(connection)
+        try:
+            yield
+        finally:
+            persistence.storage = connection
+            connection.commit()
+
+    def scroll(self, with_vectors: bool = False, batch_size: int = 1024) -> Iterator[Point]:
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name, limit=batch_size, offset=offset,
+                with_payload=True, with_vectors=with_vectors,
+            )
+            for point in points:
+                yield str(point.id), point.payload or {}, point.vector if with_vectors else None
+            if offset is None:
+                return
+
+    def retrieve(self, ids: List[str], with_vectors: bool = False) -> List[Point]:
+        points = self.client.retrieve(collection_name=self.collection_name, ids=ids,
+                                      with_payload=True, with_vectors=with_vectors)
+        return [(str(point.id), point.payload or {}, point.vector if with_vectors else None) for point in points]
+
+    def search_batch(self, vectors: List[List[float]], k: int,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[str]]:
+        """Top-k point ids per query vector, in a single batched request."""
+        query_filter = self._build_filter(filters)
+        params = None
+        if self.quantization == "int8":
+            params = SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=RESCORE_OVERSAMPLING))
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[QueryRequest(query=list(vector), filter=query_filter, params=params, limit=k)
+                      for vector in vectors],
+        )
+        return [[str(point.id) for point in response.points] for response in responses]
+
+    @staticmethod
+    def _build_filter(filters: Optional[Dict[str, Any]]) -> Optional[Filter]:
+        if not filters:
+            return None
+        return Filter(must=[
+            FieldCondition(key=f"metadata.{key}", match=MatchValue(value=value))
+            for key, value in filters.items()
+        ])
+
+    def as_vectorstore(self, embeddings) -> VectorStore:
+        from langchain_community.vectorstores import Qdrant
+        return Qdrant(client=self.client, collection_name=self.collection_name, embeddings=embeddings)
+
+
+class _DeferredCommit:
+    """sqlite3 connection stand-in whose commit() is a no-op; see QdrantBackend.bulk_writes."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def commit(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class NumpyBackend:
+    """
+    In-memory exact cosine search. Vectors are normalized on insert, so a dot product is the
+    cosine similarity. The float32 vectors are always what is persisted (and memory-mapped back
+    after a flush or load); with quantization the search scans a float16 or int8 copy held in
+    RAM instead, widened to float32 one block at a time (NumPy has no fast half-precision or
+    int8 matmul, so quantization trades some query latency for memory). New points are buffered
+    and concatenated on the next search or flush.
+    """
+
+    name = "numpy"
+    BLOCK_ROWS = 1024  # ~1.5 MB of float32 at dim 384: the widened block stays in cache
+
+    def __init__(self, path: str, quantization: Optional[str] = None):
+        self.path = path
+        self.location = f"numpy:{os.path.abspath(path)}"
+        self.quantization = quantization_mode(quantization)
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._payloads_path = os.path.join(path, "payloads.jsonl")
+        self._meta_path = os.path.join(path, "store.json")
+        self._lock = threading.RLock()
+        self._reset(None)
+        self._load()
+
+    def _reset(self, dim: Optional[int]):
+        self._dim = dim
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._payloads: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        self._pending: List[np.ndarray] = []
+        self._quantized: Optional[Tuple[np.ndarray, Optional[np.ndarray]]] = None
+        self._filter_masks: Dict[Tuple, np.ndarray] = {}
+        self._dirty = False
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("format_version") != NUMPY_STORE_FORMAT_VERSION:
+                print(f"Warning: NumPy vector store at {self.path} has another format; starting empty.")
+                return
+            matrix = np.load(self._vectors_path, mmap_mode="r")
+            with open(self._payloads_path, 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load NumPy vector store at {self.path}: {e}")
+            return
+        if len(records) != matrix.shape[0]:
+            print(f"Warning: NumPy vector store at {self.path} is inconsistent; starting empty.")
+            return
+        self._reset(int(meta["dim"]))
+        # float32 stays in the page cache; stores written as float16 by older versions are widened once.
+        self._matrix = matrix if matrix.dtype == np.float32 else matrix.astype(np.float32)
+        for row, record in enumerate(records):
+            point_id = record.pop("id")
+            self._ids.append(point_id)
+            self._rows[point_id] = row
+            self._payloads.append(record)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _materialize(self):
+        if self._pending:
+            self._matrix = np.concatenate([self._matrix] + self._pending)
+            self._pending = []
+            self._quantized = None
+
+    def _search_arrays(self) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """The array scanned by searches (and int8 scales), quantized lazily after changes."""
+        self._materialize()
+        if self.quantization == "none":
+            return self._matrix, None
+        if self._quantized is None:
+            blocks = [self._matrix[start:start + self.BLOCK_ROWS]
+                      for start in range(0, self._matrix.shape[0], self.BLOCK_ROWS)]
+            if self.quantization == "float16":
+                codes = np.concatenate([block.astype(np.float16) for block in blocks] or
+                                       [np.zeros((0, self._matrix.shape[1]), dtype=np.float16)])
+                self._quantized = (codes, None)
+            else:
+                parts = [quantize_int8(block) for block in blocks]
+                self._quantized = (
+                    np.concatenate([codes for codes, _ in parts] or [np.zeros((0, self._matrix.shape[1]), dtype=np.int8)]),
+                    np.concatenate([scales for _, scales in parts] or [np.zeros(0, dtype=np.float32)]),
+                )
+        return self._quantized
+
+    def index_nbytes(self) -> int:
+        """Bytes held in RAM for search: the float32 matrix, or its float16 / int8 (+ scales) copy."""
+        with self._lock:
+            codes, scales = self._search_arrays()
+            return codes.nbytes + (scales.nbytes if scales is not None else 0)
+
+    def exists(self) -> bool:
+        return self._dim is not None
+
+    def create(self, dim: int):
+        with self._lock:
+            self._reset(dim)
+            self._dirty = True
+
+    def drop(self):
+        with self._lock:
+            self._reset(None)
+            for path in (self._meta_path, self._vectors_path, self._payloads_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict[str, Any]]):
+        if not ids:
+            return
+        matrix = self._normalize(vectors)
+        with self._lock:
+            fresh = []
+            for i, (point_id, payload) in enumerate(zip(ids, payloads)):
+                row = self._rows.get(point_id)
+                if row is None:
+                    self._rows[point_id] = len(self._ids)
+                    self._ids.append(point_id)
+                    self._payloads.append(payload)
+                    fresh.append(i)
+                    continue
+                self._materialize()
+                if not self._matrix.flags.writeable:
+                    self._matrix = np.array(self._matrix)
+                self._matrix[row] = matrix[i]
+                self._payloads[row] = payload
+                self._quantized = None
+            if fresh:
+                self._pending.append(matrix[fresh])
+            self._filter_masks.clear()
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            drop = {self._rows[point_id] for point_id in ids if point_id in self._rows}
+            if not drop:
+                return
+            self._materialize()
+            keep = np.array([row not in drop for row in range(len(self._ids))], dtype=bool)
+            self._matrix = self._matrix[keep]
+            self._quantized = None
+            self._ids = [point_id for row, point_id in enumerate(self._ids) if keep[row]]
+            self._payloads = [payload for row, payload in enumerate(self._payloads) if keep[row]]
+            self._rows = {point_id: row for row, point_id in enumerate(self._ids)}
+            self._filter_masks.clear()
+            self._dirty = True
+
+    def flush(self):
+        """Writes the store to disk (vectors, payloads, then store.json last) if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._materialize()
+            os.makedirs(self.path, exist_ok=True)
+            for path in (self._vectors_path, self._payloads_path):
+                if os.path.exists(path + ".tmp"):
+                    os.remove(path + ".tmp")
+            with open(self._vectors_path + ".tmp", 'wb') as f:
+                np.save(f, np.ascontiguousarray(self._matrix))
+            with open(self._payloads_path + ".tmp", 'w', encoding='utf-8') as f:
+                for point_id, payload in zip(self._ids, self._payloads):
+                    f.write(json.dumps({"id": point_id, **payload}, ensure_ascii=False) + "\n")
+            # store.json is removed first and written last, so a crash in between leaves no store
+            # rather than vectors and payloads that disagree.
+            if os.path.exists(self._meta_path):
+                os.remove(self._meta_path)
+            self._matrix = np.array(self._matrix)  # Release the mmap of the file about to be replaced
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            os.replace(self._payloads_path + ".tmp", self._payloads_path)
+            with open(self._meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"format_version": NUMPY_STORE_FORMAT_VERSION, "dim": self._dim,
+                           "count": len(self._ids), "dtype": "float32"}, f)
+            # Map the float32 vectors back from disk: quantized searches only touch the rows they rescore.
+            self._matrix = np.load(self._vectors_path, mmap_mode="r")
+            self._dirty = False
+
+    @contextmanager
+    def bulk_writes(self):
+        yield  # Writes are buffered in memory until flush() anyway
+
+    def scroll(self, with_vectors: bool = False, batch_size: int = 1024) -> Iterator[Point]:
+        with self._lock:
+            self._materialize()
+            ids, payloads, matrix = list(self._ids), list(self._payloads), self._matrix
+        for row, (point_id, payload) in enumerate(zip(ids, payloads)):
+            yield point_id, payload, matrix[row].tolist() if with_vectors else None
+
+    def retrieve(self, ids: List[str], with_vectors: bool = False) -> List[Point]:
+        with self._lock:
+            self._materialize()
+            rows = [(point_id, self._rows[point_id]) for point_id in ids if point_id in self._rows]
+            return [(point_id, self._payloads[row], self._matrix[row].tolist() if with_vectors else None)
+                    for point_id, row in rows]
+
+    def _filter_mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filters:
+            return None
+        key = filters_key(filters)
+        mask = self._filter_masks.get(key)
+        if mask is None:
+            mask = np.fromiter((matches_filters(payload.get("metadata") or {}, filters)
+                                for payload in self._payloads), dtype=bool, count=len(self._payloads))
+            self._filter_masks[key] = mask
+        return mask
+
+    def scores(self, vectors) -> np.ndarray:
+        """
+        Cosine similarity of every stored vector (rows) to every query (columns), as float32.
+        Approximate when quantized: search_batch rescores int8 candidates with the float32 vectors.
+        """
+        queries = self._normalize(vectors).T
+        with self._lock:
+            codes, scales = self._search_arrays()
+        scores = np.empty((codes.shape[0], queries.shape[1]), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.BLOCK_ROWS):
+            block = codes[start:start + self.BLOCK_ROWS]
+            block_scores = block.astype(np.float32, copy=False) @ queries
+            if scales is not None:
+                block_scores *= scales[start:start + len(block), None]
+            scores[start:start + len(block)] = block_scores
+        return scores
+
+    def search_batch(self, vectors: List[List[float]], k: int,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[str]]:
+        """Top-k point ids per query vector from one matrix product over all stored vectors."""
+        return [[point_id for point_id, _ in hits] for hits in self.search_batch_with_scores(vectors, k, filters)]
+
+    def search_batch_with_scores(self, vectors: List[List[float]], k: int,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float]]]:
+        if not len(vectors) or not self._ids or k <= 0:
+            return [[] for _ in vectors]
+        with self._lock:
+            scores = self.scores(vectors)
+            mask = self._filter_mask(filters)
+            ids, matrix = self._ids, self._matrix
+        available = scores.shape[0] if mask is None else int(mask.sum())
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(k, available)
+        if k == 0:
+            return [[] for _ in vectors]
+        rescore = self.quantization == "int8"
+        candidates = min(k * RESCORE_OVERSAMPLING, available) if rescore else k
+        top = np.argpartition(-scores, candidates - 1, axis=0)[:candidates]
+        queries = self._normalize(vectors) if rescore else None
+        results = []
+        for column in range(scores.shape[1]):
+            rows = top[:, column]
+            if rescore:
+                rows = np.sort(rows)  # Ascending rows: sequential reads from the memory-mapped vectors
+                column_scores = matrix[rows] @ queries[column]
+            else:
+                column_scores = scores[rows, column]
+            order = np.argsort(-column_scores, kind="stable")[:k]
+            results.append([(ids[rows[i]], float(column_scores[i])) for i in order])
+        return results
+
+    def as_vectorstore(self, embeddings) -> VectorStore:
+        return NumpyVectorStore(self, embeddings)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    LangChain adapter over a NumpyBackend, so get_retriever() works with either backend. Texts
+    added here are embedded with the store's embeddings and written straight to the backend; as
+    with Qdrant's own add_texts, they are not in RAGSystem's manifest, so the next
+    initialize_vectorstore() sees a count mismatch and rebuilds the index from referencias/.
+    """
+
+    def __init__(self, backend: NumpyBackend, embeddings):
+        self.backend = backend
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        hits = self.backend.search_batch_with_scores([self._embeddings.embed_query(query)], k, filter)[0]
+        points = {point_id: payload for point_id, payload, _ in self.backend.retrieve([point_id for point_id, _ in hits])}
+        return [(Document(page_content=points[point_id].get("page_content", ""),
+                          metadata=points[point_id].get("metadata") or {}), score)
+                for point_id, score in hits if point_id in points]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self._embeddings.embed_documents(texts)
+        if not self.backend.exists():
+            self.backend.create(len(vectors[0]))
+        self.backend.upsert(ids, vectors, [{"page_content": text, "metadata": metadata or {}}
+                                           for text, metadata in zip(texts, metadatas)])
+        self.backend.flush()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids:
+            self.backend.delete(ids)
+            self.backend.flush()
+        return True
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas: Optional[List[dict]] = None,
+                   path: Optional[str] = None, quantization: Optional[str] = None, **kwargs: Any) -> "NumpyVectorStore":
+        """Builds (or extends) the NumPy store at `path` with `texts`."""
+        if path is None:
+            raise ValueError("NumpyVectorStore.from_texts needs the store directory as path=...")
+        store = cls(NumpyBackend(path, quantization), embedding)
+        store.add_texts(texts, metadatas, **kwargs)
+        return store
@@ -0,0 +1,185 @@
+"""
+Latency and memory benchmark of the RAG vector backends (rag_backends).
+
+Builds the same corpus of random unit vectors in each backend and measures build time,
+single-query and batched top-k latency, filtered search latency, memory held by the index
+and recall@k against an exact float64 search, for each vector quantization mode. The query
+set is fixed (seeded), so recall is comparable between runs and modes.
+
+    python rag_benchmark.py                       # 15k x 384 vectors, Qdrant in-memory vs NumPy
+    python rag_benchmark.py --count 50000 --qdrant-url http://localhost:6333
+    python rag_benchmark.py --snapshot rag_snapshot/   # real embeddings from export_snapshot
+
+With --snapshot, a fixed sample of the exported chunk vectors is held out as queries.
+"""
+
+import gc
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from rag_backends import NumpyBackend, QdrantBackend, QUANTIZATION_MODES
+
+# Collection used for the Qdrant runs; dropped at the end of each run.
+BENCHMARK_COLLECTION = "rag_benchmark"
+
+
+def synthetic_corpus(count: int, dim: int, sources: int = 10, seed: int = 0) -> Tuple[np.ndarray, List[str], List[Dict[str, Any]]]:
+    """Clustered unit vectors (closer to real embeddings than uniform noise), ids and payloads."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 50), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(count)]
+    payloads = [{"page_content": f"chunk {i}", "metadata": {"source": f"fonte_{i % sources}.md"}} for i in range(count)]
+    return vectors, ids, payloads
+
+
+def snapshot_corpus(path: str, queries: int, seed: int = 1):
+    """Vectors of a snapshot (rag_system export_snapshot), minus a seeded held-out query sample."""
+    vectors = np.load(os.path.join(path, "vectors.npy")).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[np.random.default_rng(seed).choice(len(vectors), min(queries, len(vectors) // 10), replace=False)] = True
+    corpus = vectors[~held_out]
+    ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(len(corpus))]
+    payloads = [{"page_content": f"chunk {i}", "metadata": {"source": f"fonte_{i % 10}.md"}} for i in range(len(corpus))]
+    return corpus, ids, payloads, vectors[held_out]
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    scores = vectors.astype(np.float64) @ queries.astype(np.float64).T
+    return [list(np.argsort(-scores[:, j], kind="stable")[:k]) for j in range(scores.shape[1])]
+
+
+def recall_at_k(found: List[List[str]], expected: List[List[int]], ids: List[str]) -> float:
+    hits = sum(len(set(f) & {ids[row] for row in e}) for f, e in zip(found, expected))
+    return hits / max(1, sum(len(e) for e in expected))
+
+
+def timed(fn: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def run_backend(name: str, make_backend: Callable, vectors: np.ndarray, ids: List[str],
+                payloads: List[Dict[str, Any]], queries: np.ndarray, k: int, batch: int,
+                batch_size: int = 1024) -> Dict[str, Any]:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    backend = make_backend()
+    backend.create(vectors.shape[1])
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        backend.upsert(ids[start:end], vectors[start:end], payloads[start:end])
+    backend.flush()  # NumPy: float32 vectors go to disk and are memory-mapped back
+    backend.search_batch(queries[:1].tolist(), k)  # Materializes pending rows / quantizes / warms caches
+    build_seconds = time.perf_counter() - started
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+    # Vectors scanned per query (NumPy); Qdrant's internal memory is not visible to tracemalloc.
+    index_mb = backend.index_nbytes() / 1e6 if isinstance(backend, NumpyBackend) else None
+
+    query_list = queries.tolist()
+    single = []
+    found = []
+    for query in query_list:
+        started = time.perf_counter()
+        found.append(backend.search_batch([query], k)[0])
+        single.append((time.perf_counter() - started) * 1000)
+    batched = timed(lambda: backend.search_batch(query_list[:batch], k), repeat=max(3, len(query_list) // batch))
+    filters = {"source": "fonte_3.md"}
+    filtered = timed(lambda: backend.search_batch(query_list[:1], k, filters), repeat=20)
+
+    result = {
+        "backend": name,
+        "build_s": build_seconds,
+        "memory_mb": memory_mb,
+        "index_mb": index_mb,
+        "p50_ms": float(np.percentile(single, 50)),
+        "p95_ms": float(np.percentile(single, 95)),
+        f"batch{batch}_ms": float(np.median(batched)),
+        "filtered_ms": float(np.median(filtered)),
+        "found": found,
+    }
+    if isinstance(backend, QdrantBackend):
+        backend.drop()
+    return result
+
+
+def print_table(results: List[Dict[str, Any]], columns: List[str]):
+    def cell(value) -> str:
+        if value is None:
+            return "-"
+        return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+    widths = [max([len(column)] + [len(cell(result.get(column, ""))) for result in results]) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(cell(result.get(column, "")).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG vector backends.")
+    parser.add_argument("--count", type=int, default=15000, help="Number of stored vectors.")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension (MiniLM-L12: 384).")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=16, help="Queries per batched search.")
+    parser.add_argument("--qdrant-url", default=None, help="Benchmark a Qdrant server instead of in-memory Qdrant.")
+    parser.add_argument("--snapshot", default=None, help="Use the vectors of an exported RAG snapshot as the corpus.")
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATION_MODES, default=list(QUANTIZATION_MODES),
+                        help="Quantization modes to run (default: all).")
+    args = parser.parse_args()
+
+    from qdrant_client import QdrantClient
+
+    if args.snapshot:
+        vectors, ids, payloads, queries = snapshot_corpus(args.snapshot, args.queries)
+    else:
+        vectors, ids, payloads = synthetic_corpus(args.count, args.dim)
+        queries, _, _ = synthetic_corpus(args.queries, args.dim, seed=1)
+    print(f"Corpus: {len(vectors)} x {vectors.shape[1]} vectors, {len(queries)} queries, k={args.k}")
+    expected = exact_top_k(vectors, queries, args.k)
+
+    def qdrant_run(mode: str):
+        client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(":memory:")
+        return QdrantBackend(client, BENCHMARK_COLLECTION, args.qdrant_url or ":memory:", mode)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # In-memory Qdrant ignores quantization (it always searches float32), so only a server
+        # is benchmarked in every mode.
+        qdrant_modes = args.quantization if args.qdrant_url else ["none"]
+        runs = [(f"{'qdrant' if args.qdrant_url else 'qdrant-memory'}-{mode}", lambda mode=mode: qdrant_run(mode))
+                for mode in qdrant_modes]
+        runs += [(f"numpy-{mode}", lambda mode=mode: NumpyBackend(f"{tmp}/{mode}", mode)) for mode in args.quantization]
+        results = []
+        for name, make_backend in runs:
+            result = run_backend(name, make_backend, vectors, ids, payloads, queries, args.k, args.batch)
+            result["recall"] = recall_at_k(result.pop("found"), expected, ids)
+            results.append(result)
+            print(f"  {name}: done")
+
+    baseline = next((r["index_mb"] for r in results if r["backend"] == "numpy-none"), None)
+    if baseline:
+        for result in results:
+            if result["index_mb"] is not None:
+                result["saved_pct"] = 100.0 * (1 - result["index_mb"] / baseline)
+
+    print()
+    print_table(results, ["backend", "build_s", "memory_mb", "index_mb", "saved_pct", "p50_ms", "p95_ms",
+                          f"batch{args.batch}_ms", "filtered_ms", "recall"])
+
+
+if __name__ == "__main__":
+    main()
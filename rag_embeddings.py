@@ -0,0 +1,281 @@
+"""
+Persistent embedding cache for the RAG reference corpus.
+
+Vectors are stored per embedding model in a single append-only file of fixed-size records
+(32-byte SHA-256 of the normalized text followed by the float32 vector). The file is
+memory-mapped for reads and a hash -> row dict is rebuilt from the keys on open, so a
+rebuild after a small reference update only has to encode texts that were never seen.
+
+It also holds the embedding model factory. A model name prefixed with "onnx:" or "onnx-int8:"
+(e.g. "onnx-int8:sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2") runs the same
+sentence-transformer exported to ONNX (optionally with int8 dynamic quantization) on ONNX
+Runtime's CPU provider instead of PyTorch; any other name loads HuggingFaceEmbeddings. The
+export is done once, with PyTorch, and kept under the given export directory. The ONNX path
+needs the optional `onnxruntime` and `onnx` packages.
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+ONNX_PREFIXES = {"onnx:": False, "onnx-int8:": True}  # Model name prefix -> int8 quantization
+ONNX_EXPORT_FORMAT_VERSION = 1
+
+
+def normalize_text(text: str) -> str:
+    """Normalization applied before hashing; mirrors the newline handling of HuggingFaceEmbeddings."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+def model_directory(base_dir: str, model_name: str) -> str:
+    """Per-model subdirectory of `base_dir`: a readable slug plus a hash, so names never collide."""
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)[-60:]
+    return os.path.join(base_dir, f"{slug}-{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:10]}")
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str):
+        """Cache rooted at `cache_dir`; each model gets its own subdirectory, so keys never mix models."""
+        self.model_name = model_name
+        self.path = model_directory(cache_dir, model_name)
+        self.records_path = os.path.join(self.path, "vectors.bin")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.dim: Optional[int] = None
+        self._dtype = None
+        self._rows: Dict[bytes, int] = {}
+        self._indexed = 0
+        self._array = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model_name") != self.model_name:
+            return
+        self._set_dim(int(meta["dim"]))
+        self._remap()
+
+    def _set_dim(self, dim: int):
+        self.dim = dim
+        # Raw bytes, not "S32": numpy strips trailing NULs from fixed-size strings, which would corrupt digests.
+        self._dtype = np.dtype([("key", "V32"), ("vector", "<f4", (dim,))])
+
+    def _remap(self):
+        """Maps the records file and indexes any rows appended since the last mapping."""
+        if not os.path.exists(self.records_path):
+            return
+        rows = os.path.getsize(self.records_path) // self._dtype.itemsize
+        if rows == 0:
+            return
+        # A torn write from a crashed process leaves a partial record at the tail; it is simply ignored.
+        self._array = np.memmap(self.records_path, dtype=self._dtype, mode="r", shape=(rows,))
+        keys = self._array["key"]
+        for row in range(self._indexed, rows):
+            self._rows.setdefault(keys[row].tobytes(), row)
+        self._indexed = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None where the text has not been embedded yet."""
+        if self.dim is None:
+            self.misses += len(texts)
+            return [None] * len(texts)
+        results = []
+        with self._lock:
+            for text in texts:
+                row = self._rows.get(text_key(text))
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(self._array["vector"][row].tolist())
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        if not texts:
+            return
+        with self._lock:
+            if self.dim is None:
+                self._set_dim(len(vectors[0]))
+                os.makedirs(self.path, exist_ok=True)
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+            records = np.empty(len(texts), dtype=self._dtype)
+            fresh = 0
+            seen = set()
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                records[fresh] = (key, vector)
+                fresh += 1
+            if not fresh:
+                return
+            # A single append per batch keeps records whole even if several processes share the cache.
+            with open(self.records_path, "ab") as f:
+                f.write(records[:fresh].tobytes())
+            self._remap()
+
+
+# --- Embedding models ---
+
+def parse_model_name(model_name: str) -> Tuple[str, Optional[bool]]:
+    """(Hugging Face model, int8 flag) for "onnx:" / "onnx-int8:" names; (model_name, None) otherwise."""
+    for prefix, quantize in ONNX_PREFIXES.items():
+        if model_name.startswith(prefix):
+            return model_name[len(prefix):], quantize
+    return model_name, None
+
+
+def export_onnx(model_name: str, export_dir: str, quantize: bool = False) -> str:
+    """
+    Exports the transformer of a sentence-transformers model (token embeddings, dynamic batch
+    and sequence axes) to `<export_dir>/<model>/model.onnx`, with its tokenizer and pooling
+    settings, and optionally an int8 dynamically quantized `model.int8.onnx` next to it.
+    Returns the path of the requested model; existing exports are reused.
+    """
+    model_dir = model_directory(export_dir, model_name)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    meta_path = os.path.join(model_dir, "export.json")
+    if not os.path.exists(meta_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        print(f"Exporting {model_name} to ONNX in {model_dir}...")
+        model = SentenceTransformer(model_name, device="cpu")
+        pooling = model[1].get_config_dict() if len(model) > 1 else {}
+        if not (pooling.get("pooling_mode_mean_tokens") or pooling.get("pooling_mode_cls_token")):
+            raise ValueError(f"{model_name}: only mean or CLS pooling can be exported to ONNX")
+        transformer = model[0].auto_model.eval()
+
+        class TokenEmbeddings(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, input_ids, attention_mask):
+                return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+        sample = model.tokenizer(["exportação do modelo"], return_tensors="pt")
+        os.makedirs(model_dir, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                TokenEmbeddings(), (sample["input_ids"], sample["attention_mask"]), fp32_path + ".tmp",
+                input_names=["input_ids", "attention_mask"], output_names=["token_embeddings"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"}
+                              for name in ("input_ids", "attention_mask", "token_embeddings")},
+                opset_version=14, do_constant_folding=True,
+            )
+        os.replace(fp32_path + ".tmp", fp32_path)
+        model.tokenizer.save_pretrained(model_dir)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": ONNX_EXPORT_FORMAT_VERSION,
+                "model_name": model_name,
+                "max_seq_length": model.max_seq_length,
+                "pooling": "mean" if pooling.get("pooling_mode_mean_tokens") else "cls",
+                "normalize": any(type(module).__name__ == "Normalize" for module in model),
+            }, f)
+    if not quantize:
+        return fp32_path
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+    return int8_path
+
+
+class OnnxEmbeddings:
+    """
+    LangChain-compatible embeddings from an ONNX export of a sentence-transformers model (see
+    export_onnx). Tokenization, truncation, pooling and normalization follow the exported
+    model's settings and newlines are replaced as in HuggingFaceEmbeddings, so the vectors match
+    the PyTorch path (up to int8 rounding when quantized). Texts are batched by length to keep
+    padding small. `threads` caps ONNX Runtime's intra-op threads (default: all cores).
+    """
+
+    def __init__(self, model_name: str, export_dir: str, quantize: bool = False,
+                 threads: Optional[int] = None, batch_size: int = 32):
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("ONNX embeddings need the optional packages onnxruntime and onnx "
+                              "(pip install onnxruntime onnx)") from e
+        self.model_name = model_name
+        self.model_path = export_onnx(model_name, export_dir, quantize)
+        model_dir = os.path.dirname(self.model_path)
+        with open(os.path.join(model_dir, "export.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.max_seq_length = meta["max_seq_length"]
+        self.pooling = meta["pooling"]
+        self.normalize = meta["normalize"]
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or 0  # 0: ONNX Runtime picks one thread per core
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        parts = []
+        for start in range(0, len(texts), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[row] for row in rows], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors="np")
+            mask = encoded["attention_mask"].astype(np.int64)
+            hidden = self.session.run(None, {"input_ids": encoded["input_ids"].astype(np.int64),
+                                             "attention_mask": mask})[0]
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                weights = mask[:, :, None].astype(np.float32)
+                pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            parts.append((rows, pooled))
+        vectors = np.empty((len(texts), parts[0][1].shape[1]), dtype=np.float32)
+        for rows, pooled in parts:
+            vectors[rows] = pooled
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode([text.replace("\n", " ") for text in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def create_embeddings(model_name: str, export_dir: str, threads: Optional[int] = None):
+    """Embeddings object for a model name: OnnxEmbeddings for "onnx:" / "onnx-int8:" names, else HuggingFaceEmbeddings."""
+    base_model, quantize = parse_model_name(model_name)
+    if quantize is None:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    return OnnxEmbeddings(base_model, export_dir, quantize=quantize, threads=threads)
@@ -0,0 +1,188 @@
+"""
+Retrieval quality and latency benchmark of RAGSystem configurations.
+
+Indexes the local `referencias/` corpus once per configuration (each in its own index
+directory, so the project index is left alone) and runs a fixed set of fiscal queries whose
+relevant chunks are known. For each configuration it reports:
+
+- chunks, build_s: indexed chunks and initialize_vectorstore() time (embedding included
+  unless --index-dir already holds the index; measured with tracemalloc running)
+- memory_mb: Python memory held after the build (vector store, payloads, lexical index)
+- recall@k: share of the expected chunks found in the top k, averaged over queries
+- mrr: mean reciprocal rank of the first relevant chunk (0 when none is in the top k)
+- p50_ms, p95_ms: uncached retrieval latency per query, query embedding included
+
+Everything runs offline once the embedding model is in the local Hugging Face cache.
+
+    python rag_eval.py                                  # every configuration
+    python rag_eval.py --config numpy-hybrid qdrant-vector --k 10 --verbose
+    python rag_eval.py --index-dir /tmp/rag_eval        # keep the indexes between runs
+"""
+
+import gc
+import os
+import time
+import fnmatch
+import argparse
+import tempfile
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag_system import RAGSystem, DEFAULT_EMBEDDINGS_MODEL
+from rag_benchmark import print_table
+
+# Configurations compared by default: RAGSystem keyword arguments by name.
+CONFIGURATIONS: Dict[str, Dict[str, Any]] = {
+    "qdrant-hybrid": {},
+    "qdrant-vector": {"hybrid_retrieval": False},
+    "numpy-hybrid": {"vector_backend": "numpy"},
+    "numpy-vector": {"vector_backend": "numpy", "hybrid_retrieval": False},
+    "numpy-int8-hybrid": {"vector_backend": "numpy", "vector_quantization": "int8"},
+    "numpy-onnx-int8-hybrid": {"vector_backend": "numpy", "embeddings_model_name": f"onnx-int8:{DEFAULT_EMBEDDINGS_MODEL}"},
+}
+
+# Fixed query set. A chunk is relevant to an expected (source glob, text) pair when its source
+# matches the glob and its text contains the given text (case-insensitive), so the set survives
+# changes to chunk boundaries.
+EVAL_QUERIES: List[Dict[str, Any]] = [
+    {"topic": "icms-interestadual", "query": "Qual a alíquota interestadual de ICMS para mercadorias importadas?",
+     "expected": [("regras_fiscais.md", "Resolução Senado nº 13/2012")]},
+    {"topic": "icms-interestadual", "query": "Alíquotas de ICMS interestadual de 7% e 12% conforme a região de origem e destino",
+     "expected": [("calculo_icms_interestadual.txt", "Tabela de Alíquotas Internas e Interestaduais")]},
+    {"topic": "icms-interestadual", "query": "Alíquota de ICMS sobre o transporte intermunicipal",
+     "expected": [("calculo_icms_interestadual.txt", "Transporte Intermunicipal")]},
+    {"topic": "icms-interestadual", "query": "Qual CFOP usar na venda interestadual de mercadoria?",
+     "expected": [("regras_fiscais.md", "Vendas Interestaduais")]},
+    {"topic": "st-ncm", "query": "Como calcular a base de cálculo do ICMS-ST com MVA ajustada?",
+     "expected": [("formulas_calculo.md", "MVA Ajustada"), ("regras_fiscais.md", "MVA/IVA-ST")]},
+    {"topic": "st-ncm", "query": "O NCM 8708.99.90 está sujeito à substituição tributária?",
+     "expected": [("regras_fiscais.md", "87089990"), ("*ncm*.xlsx", "8708.99.90")]},
+    {"topic": "st-ncm", "query": "Substituição tributária em SP para autopeças, CEST 01.001.00",
+     "expected": [("*substitui*tribut*.xlsx", "CEST 01.001.00")]},
+    {"topic": "st-ncm", "query": "Pneus novos estão na substituição tributária de São Paulo?",
+     "expected": [("*substitui*tribut*.xlsx", "PNEUMÁTICOS")]},
+    {"topic": "st-ncm", "query": "Classificação fiscal NCM 0102.21.10 de bovinos reprodutores",
+     "expected": [("*ncm*.xlsx", "0102.21.10")]},
+    {"topic": "credito-pis-cofins", "query": "Crédito de PIS e COFINS no lucro real sobre insumos e energia elétrica",
+     "expected": [("regras_fiscais.md", "Regime Não-Cumulativo")]},
+    {"topic": "credito-pis-cofins", "query": "O CFOP 1102 gera crédito de PIS/COFINS?",
+     "expected": [("*cfop*", "CFOP 1102")]},
+    {"topic": "credito-pis-cofins", "query": "Quais as alíquotas de PIS e COFINS no regime cumulativo do lucro presumido?",
+     "expected": [("regras_fiscais.md", "PIS 0,65%"), ("formulas_calculo.md", "0.0065")]},
+    {"topic": "credito-pis-cofins", "query": "Exclusão do ICMS da base de cálculo do PIS e da COFINS",
+     "expected": [("regras_fiscais.md", "Exclusão do ICMS")]},
+    {"topic": "credito-pis-cofins", "query": "Como funciona o PIS e a COFINS na importação?",
+     "expected": [("credito_pis_cofins_lucro_real.txt", "PIS e COFINS na importação")]},
+    {"topic": "outros", "query": "Benefícios fiscais nas vendas para a Zona Franca de Manaus",
+     "expected": [("beneficios_fiscais.md", "Zona Franca de Manaus")]},
+    {"topic": "outros", "query": "Qual decreto aprovou a TIPI 2022?",
+     "expected": [("tipi.txt", "11.158")]},
+    {"topic": "outros", "query": "Quais produtos são isentos de IPI?",
+     "expected": [("regras_fiscais.md", "Isenções de IPI")]},
+]
+
+
+def is_relevant(expected: Tuple[str, str], text: str, metadata: Dict[str, Any]) -> bool:
+    pattern, needle = expected
+    return (fnmatch.fnmatch(str(metadata.get("source", "")).lower(), pattern.lower())
+            and needle.lower() in text.lower())
+
+
+def score_ranking(ranking: List[str], expected: List[Tuple[str, str]], rag: RAGSystem) -> Tuple[float, float]:
+    """(recall, reciprocal rank) of one ranked id list against the expected chunks."""
+    texts, metadata = rag.lexical_index.texts, rag.lexical_index.metadata
+    found = set()
+    first = 0
+    for rank, chunk_id in enumerate(ranking, start=1):
+        hits = {i for i, spec in enumerate(expected) if is_relevant(spec, texts.get(chunk_id, ""), metadata.get(chunk_id, {}))}
+        if hits and not first:
+            first = rank
+        found |= hits
+    return len(found) / len(expected), (1.0 / first if first else 0.0)
+
+
+def missing_expectations(rag: RAGSystem, queries: List[Dict[str, Any]]) -> List[Tuple[str, Tuple[str, str]]]:
+    """Expected chunks that match nothing in the index (a stale query set after corpus changes)."""
+    chunks = [(rag.lexical_index.texts[chunk_id], rag.lexical_index.metadata[chunk_id]) for chunk_id in rag.lexical_index.texts]
+    return [(item["query"], spec) for item in queries for spec in item["expected"]
+            if not any(is_relevant(spec, text, metadata) for text, metadata in chunks)]
+
+
+def run_configuration(name: str, options: Dict[str, Any], queries: List[Dict[str, Any]], k: int,
+                      repeat: int, index_path: str, verbose: bool = False) -> Dict[str, Any]:
+    rag = RAGSystem(**options, index_path=index_path, qdrant_path=os.path.join(index_path, "qdrant"))
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rag.initialize_vectorstore()
+    build_seconds = time.perf_counter() - started
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+    if not rag.vectorstore:
+        return {"config": name, "error": "vector store not initialized"}
+    for query, (pattern, needle) in missing_expectations(rag, queries):
+        print(f"Warning: no chunk of '{pattern}' contains '{needle}' (query: {query})")
+
+    rankings: List[List[str]] = []
+    latencies: List[float] = []
+    for round_number in range(repeat):
+        for item in queries:
+            started = time.perf_counter()
+            ranking = rag.search_ids(item["query"], k, use_cache=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if round_number == 0:
+                rankings.append(ranking)
+
+    recalls, reciprocal_ranks = zip(*(score_ranking(ranking, item["expected"], rag)
+                                      for ranking, item in zip(rankings, queries)))
+    if verbose:
+        print(f"\n{name}")
+        for item, recall, reciprocal_rank in zip(queries, recalls, reciprocal_ranks):
+            print(f"  recall {recall:.2f}  rr {reciprocal_rank:.2f}  [{item['topic']}] {item['query']}")
+    return {
+        "config": name,
+        "chunks": len(rag.lexical_index),
+        "build_s": build_seconds,
+        "memory_mb": memory_mb,
+        f"recall@{k}": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency of RAGSystem configurations.")
+    parser.add_argument("--config", nargs="+", choices=sorted(CONFIGURATIONS), default=list(CONFIGURATIONS),
+                        help="Configurations to run (default: all).")
+    parser.add_argument("--model", default=None, help="Embedding model for every configuration (default: RAGSystem's).")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over the query set.")
+    parser.add_argument("--index-dir", default=None,
+                        help="Keep each configuration's index under DIR/<config> instead of a temporary directory.")
+    parser.add_argument("--verbose", action="store_true", help="Print recall and reciprocal rank per query.")
+    args = parser.parse_args()
+
+    print(f"{len(EVAL_QUERIES)} queries, k={args.k}, configurations: {', '.join(args.config)}")
+    results = []
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+        for name in args.config:
+            options = dict(CONFIGURATIONS[name])
+            if args.model:
+                options["embeddings_model_name"] = args.model
+            try:
+                results.append(run_configuration(name, options, EVAL_QUERIES, args.k, args.repeat,
+                                                 os.path.join(args.index_dir or tmp, name), args.verbose))
+            except ImportError as e:  # e.g. ONNX configurations without onnxruntime installed
+                print(f"  {name}: skipped ({e})")
+                continue
+            print(f"  {name}: done")
+
+    print()
+    print_table(results, ["config", "chunks", "build_s", "memory_mb", f"recall@{args.k}", "mrr", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
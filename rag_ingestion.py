@@ -0,0 +1,175 @@
+"""
+Batched embedding pipeline for the RAG reference corpus.
+
+Chunks are streamed in fixed-size batches, encoded either in-process or across a pool of
+CPU worker processes (each holding its own copy of the sentence-transformer model, or of its
+ONNX export for "onnx:" model names), and
+handed to an upsert callback as soon as each batch is done. At most a few batches are in
+flight at any time, so memory stays bounded regardless of corpus size. When an
+EmbeddingCache is given, only texts missing from it are sent to the model.
+"""
+
+import os
+import time
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from rag_embeddings import EmbeddingCache, OnnxEmbeddings, create_embeddings, parse_model_name
+
+Batch = Tuple[List[str], List[Document]]
+UpsertFn = Callable[[List[str], List[Document], List[List[float]]], None]
+
+# --- Worker process state ---
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int, onnx_export_path: Optional[str]):
+    """Loads the model once per worker; threads are capped so workers don't oversubscribe the CPU."""
+    global _worker_model
+    if parse_model_name(model_name)[1] is not None:
+        _worker_model = create_embeddings(model_name, onnx_export_path, threads)
+        return
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode_batch(texts: List[str]):
+    if isinstance(_worker_model, OnnxEmbeddings):
+        return _worker_model.embed_documents(texts)
+    # Mirrors HuggingFaceEmbeddings.embed_documents so vectors match the in-process path.
+    texts = [text.replace("\n", " ") for text in texts]
+    return _worker_model.encode(texts, show_progress_bar=False)
+
+
+def iter_batches(items: Iterable[Tuple[str, Document]], batch_size: int) -> Iterator[Batch]:
+    """Groups a stream of (id, document) pairs into batches without materializing the stream."""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, batch_size))
+        if not chunk:
+            return
+        ids, docs = zip(*chunk)
+        yield list(ids), list(docs)
+
+
+class EmbeddingPipeline:
+    def __init__(self, embeddings, model_name: str, batch_size: int = 256, workers: Optional[int] = None,
+                 cache: Optional[EmbeddingCache] = None, onnx_export_path: Optional[str] = None):
+        """
+        `embeddings` is used for in-process encoding; worker processes load `model_name` themselves
+        (ONNX models from the export under `onnx_export_path`, done by the parent).
+        `workers` defaults to RAG_INGEST_WORKERS or the CPU count; 0 or 1 disables the process pool.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.onnx_export_path = onnx_export_path
+        self.batch_size = batch_size
+        if workers is None:
+            workers = int(os.environ.get("RAG_INGEST_WORKERS", os.cpu_count() or 1))
+        self.workers = max(1, workers)
+
+    def run(self, items: Iterable[Tuple[str, Document]], upsert: UpsertFn) -> int:
+        """Embeds every (id, document) pair and upserts it batch by batch. Returns the number of chunks embedded."""
+        batches = iter_batches(items, self.batch_size)
+        first = next(batches, None)
+        if first is None:
+            return 0
+        second = next(batches, None)
+        batches = itertools.chain([first] + ([second] if second else []), batches)
+
+        progress = _Progress()
+        # Spinning up workers costs a model load each; only worth it when there is more than one batch.
+        if self.workers <= 1 or second is None:
+            for ids, docs in batches:
+                texts, vectors, missing = self._lookup(docs)
+                if missing:
+                    computed = self.embeddings.embed_documents([texts[i] for i in missing])
+                    self._fill(texts, vectors, missing, computed)
+                upsert(ids, docs, vectors)
+                progress.update(len(ids), len(missing))
+        else:
+            self._run_pool(batches, upsert, progress)
+        progress.finish()
+        return progress.done
+
+    def _lookup(self, docs: List[Document]):
+        """Returns the batch texts, their cached vectors (None where missing) and the indices to encode."""
+        texts = [doc.page_content for doc in docs]
+        vectors = self.cache.get_many(texts) if self.cache is not None else [None] * len(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        return texts, vectors, missing
+
+    def _fill(self, texts: List[str], vectors: list, missing: List[int], computed):
+        computed = [list(map(float, vector)) for vector in computed]
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+        if self.cache is not None:
+            self.cache.put_many([texts[i] for i in missing], computed)
+
+    def _run_pool(self, batches: Iterator[Batch], upsert: UpsertFn, progress: "_Progress"):
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        max_pending = self.workers * 2
+        # spawn: the parent already has torch loaded, and forking it is not safe.
+        context = multiprocessing.get_context("spawn")
+        pool = None
+        pending = {}
+        try:
+            for ids, docs in batches:
+                texts, vectors, missing = self._lookup(docs)
+                if not missing:
+                    upsert(ids, docs, vectors)
+                    progress.update(len(ids), 0)
+                    continue
+                if pool is None:
+                    # Created on the first cache miss, so fully cached rebuilds never load the model.
+                    print(f"Embedding with {self.workers} worker processes ({threads} threads each), "
+                          f"batch size {self.batch_size}.")
+                    pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                               initializer=_init_worker, initargs=(self.model_name, threads, self.onnx_export_path))
+                future = pool.submit(_encode_batch, [texts[i] for i in missing])
+                pending[future] = (ids, docs, texts, vectors, missing)
+                if len(pending) >= max_pending:
+                    self._drain(pending, upsert, progress, wait_all=False)
+            self._drain(pending, upsert, progress, wait_all=True)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def _drain(self, pending, upsert: UpsertFn, progress: "_Progress", wait_all: bool):
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ids, docs, texts, vectors, missing = pending.pop(future)
+                self._fill(texts, vectors, missing, future.result())
+                upsert(ids, docs, vectors)
+                progress.update(len(ids), len(missing))
+            if not wait_all:
+                return
+
+
+class _Progress:
+    def __init__(self, every_seconds: float = 5.0):
+        self.done = 0
+        self.encoded = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.every_seconds = every_seconds
+
+    def update(self, count: int, encoded: int):
+        self.done += count
+        self.encoded += encoded
+        now = time.perf_counter()
+        if now - self.last_report >= self.every_seconds:
+            self.last_report = now
+            print(f"Embedded {self.done} chunks ({self.done / (now - self.started):.0f} chunks/s)...")
+
+    def finish(self):
+        if self.done:
+            elapsed = time.perf_counter() - self.started
+            print(f"Embedded {self.done} chunks in {elapsed:.1f}s "
+                  f"({self.encoded} encoded, {self.done - self.encoded} from cache).")
@@ -0,0 +1,458 @@
+"""
+Source loaders for the RAG reference corpus.
+
+Each file in `referencias/` is read by the loader registered for its name. Spreadsheets are
+read with streaming, read-only row iterators and parsed into structured records (one per ST
+item, CFOP or NCM line); records that belong together (same CEST, same credit base, same NCM
+heading) are rendered into a single compact Document whose metadata lists the fiscal codes it
+covers (`cest_codes`, `cfop_codes`, `ncm_codes`, without dots), which feeds the exact-code index of
+rag_retrieval.LexicalIndex. Markdown and text files are normalized (scraping artifacts such as
+"[1]" removed), chunked along their headings, paragraphs and list items, and cleared of
+near-duplicate chunks by hashed word shingles.
+
+New sources are supported by decorating a generator `loader(file_path, source)` with
+`@register_loader("<glob pattern>")`; the most recently registered matching pattern wins.
+"""
+
+import re
+import zlib
+import fnmatch
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from base_ncm import formatar_codigo_ncm
+from rag_retrieval import tokenize
+
+Loader = Callable[[str, str], Iterator[Document]]
+
+# Upper bound for the text of a grouped record Document; longer groups are split, repeating their header.
+MAX_GROUP_CHARS = 1500
+
+_LOADERS: List[Tuple[str, Loader]] = []
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200,
+    length_function=len,
+)
+
+
+def register_loader(*patterns: str):
+    """Registers the decorated loader for filenames matching any of the (case-insensitive) glob patterns."""
+    def decorator(loader: Loader) -> Loader:
+        for pattern in patterns:
+            _LOADERS.append((pattern.lower(), loader))
+        return loader
+    return decorator
+
+
+def find_loader(filename: str) -> Optional[Loader]:
+    name = filename.lower()
+    for pattern, loader in reversed(_LOADERS):
+        if fnmatch.fnmatch(name, pattern):
+            return loader
+    return None
+
+
+def _clean(value: Any) -> str:
+    """Cell value as single-line text; blanks and "-" placeholders become ""."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = " ".join(str(value).split())
+    return "" if text in ("-", "nan", "None") else text
+
+
+def _group_documents(header: str, lines: Iterable[Tuple[str, Optional[str]]], metadata: Dict[str, Any],
+                     codes_key: str, header_codes: Iterable[str] = (),
+                     max_chars: int = MAX_GROUP_CHARS) -> Iterator[Document]:
+    """
+    Packs `(line, code)` pairs under `header` into as few Documents as fit in `max_chars` each.
+    Each Document lists under `codes_key` the header codes plus the codes of its own lines.
+    """
+    header_codes = list(header_codes)
+
+    def document(part: List[Tuple[str, Optional[str]]]) -> Document:
+        codes = header_codes + [code for _, code in part if code and code not in header_codes]
+        text = "\n".join([header] + [line for line, _ in part])
+        return Document(page_content=text, metadata={**metadata, codes_key: list(dict.fromkeys(codes))})
+
+    part: List[Tuple[str, Optional[str]]] = []
+    size = len(header)
+    for line, code in lines:
+        if part and size + len(line) + 1 > max_chars:
+            yield document(part)
+            part, size = [], len(header)
+        part.append((line, code))
+        size += len(line) + 1
+    if part:
+        yield document(part)
+
+
+# --- Markdown / plain text ---
+
+# Maximum chunk size for prose; a section that fits is never split.
+MAX_SECTION_CHARS = 1000
+# Word shingle size and the share of a chunk's shingles already seen that marks it as a near duplicate.
+SHINGLE_SIZE = 5
+DUPLICATE_CONTAINMENT = 0.8
+
+_CITATION = re.compile(r"\[\d{1,3}\]")  # "[1]" markers left by web scraping, often mid-word
+_INLINE_SPACE = re.compile(r"[ \t\u00a0\u2000-\u200a\u202f\u3000]+")  # Runs of spaces, tabs and Unicode spaces
+_ZERO_WIDTH = re.compile(r"[\u200b-\u200d\ufeff]")
+_MD_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+_BOLD_HEADING = re.compile(r"^\*\*([^*]+?)\*\*:?$")  # "**Título da seção:**" alone on a line
+_LIST_ITEM = re.compile(r"^([-*+]|\d+[.)])\s+")  # Top-level items only: indented ones continue their parent
+
+
+def normalize_source_text(text: str) -> str:
+    """NFC text without citation artifacts, odd spaces or trailing blanks; at most one empty line in a row."""
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = _ZERO_WIDTH.sub("", _CITATION.sub("", text))
+    lines: List[str] = []
+    for line in text.split("\n"):
+        indent = len(line) - len(line.lstrip(" \t"))
+        line = line[:indent] + _INLINE_SPACE.sub(" ", line[indent:]).rstrip()
+        if line.strip() or (lines and lines[-1]):
+            lines.append(line if line.strip() else "")
+    return "\n".join(lines).strip()
+
+
+def _heading(line: str) -> Optional[Tuple[int, str]]:
+    """(level, title) of a Markdown heading, or of a bold line standing in for one (level 7, below any #)."""
+    match = _MD_HEADING.match(line)
+    if match:
+        return len(match.group(1)), match.group(2)
+    match = _BOLD_HEADING.match(line)
+    if match:
+        return 7, match.group(1).rstrip(":")
+    return None
+
+
+def _sections(text: str) -> Iterator[Tuple[List[str], int, List[str]]]:
+    """
+    (heading path, headings, blocks) per section of normalized text. Blocks are the units a
+    section is split on: headings, paragraphs and top-level list items (with their indented
+    lines); a block that followed an empty line starts with "\\n", so joining blocks with "\\n"
+    restores the text. A heading with no text of its own opens the next section, so `headings`
+    counts the trailing entries of the path whose heading lines are among the blocks.
+    """
+    path: List[Tuple[int, str]] = []
+    blocks: List[str] = []
+    headings = 0
+    current: List[str] = []
+    gap = False
+
+    def close_block():
+        nonlocal gap
+        if current:
+            blocks.append(("\n" if gap and blocks else "") + "\n".join(current))
+            current.clear()
+            gap = False
+
+    for line in text.split("\n"):
+        heading = _heading(line)
+        if heading:
+            close_block()
+            level, title = heading
+            if len(blocks) > headings:
+                yield [title for _, title in path], headings, blocks
+                blocks, headings, gap = [], 0, False
+            elif headings and path[-1][0] >= level:
+                headings = 0  # A sibling or parent replaces the empty heading; keep its line anyway
+            path = [entry for entry in path if entry[0] < level] + [(level, title)]
+            headings = min(headings + 1, len(path))
+            current.append(line)
+            close_block()
+        elif not line:
+            close_block()
+            gap = True
+        else:
+            if _LIST_ITEM.match(line):
+                close_block()
+            current.append(line)
+    close_block()
+    if blocks:
+        yield [title for _, title in path], headings, blocks
+
+
+def split_sections(text: str, metadata: Dict[str, Any], max_chars: int = MAX_SECTION_CHARS) -> Iterator[Document]:
+    """
+    Chunks normalized Markdown / plain text along its structure. Consecutive whole sections are
+    packed into one Document while they fit in `max_chars`; a longer section is split between
+    paragraphs and list items. A chunk that starts inside the heading hierarchy opens with the
+    heading path ("Regras Fiscais > ICMS"), also stored as `section` metadata. Only a single
+    block longer than `max_chars` falls back to text_splitter.
+    """
+    part: List[str] = []
+    section = ""
+    size = 0
+
+    def document() -> Document:
+        return Document(page_content="\n".join(part).strip(), metadata={**metadata, "section": section})
+
+    for path, headings, blocks in _sections(text):
+        section_text = "\n".join(blocks)
+        if part and size + len(section_text) + 2 <= max_chars:
+            part.append("\n" + section_text)
+            size += len(section_text) + 2
+            continue
+        if part:
+            yield document()
+        section = " > ".join(path)
+        parent = " > ".join(path[:len(path) - headings])
+        part, size, filled = ([parent], len(parent), False) if parent else ([], 0, False)
+        for block in blocks:
+            for piece in [block] if len(block) <= max_chars else text_splitter.split_text(block):
+                if filled and size + len(piece) + 1 > max_chars:
+                    yield document()
+                    part, size = [section], len(section)
+                    piece = piece.lstrip("\n")
+                part.append(piece)
+                size += len(piece) + 1
+                filled = True
+    if part:
+        yield document()
+
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    tokens = tokenize(text)
+    if len(tokens) < size:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))} if tokens else set()
+    return {zlib.crc32(" ".join(tokens[i:i + size]).encode("utf-8")) for i in range(len(tokens) - size + 1)}
+
+
+def drop_near_duplicates(documents: Iterable[Document], containment: float = DUPLICATE_CONTAINMENT) -> Iterator[Document]:
+    """
+    Skips Documents whose hashed word shingles are mostly (`containment`) covered by a single
+    Document already yielded: repeated boilerplate, pasted paragraphs, scraped page copies.
+    """
+    kept: List[set] = []
+    for document in documents:
+        shingles = _shingles(document.page_content)
+        if shingles and any(len(shingles & seen) >= containment * len(shingles) for seen in kept):
+            continue
+        kept.append(shingles)
+        yield document
+
+
+@register_loader("*.md", "*.txt")
+def load_text(file_path: str, source: str) -> Iterator[Document]:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = normalize_source_text(f.read())
+    yield from drop_near_duplicates(split_sections(content, {"source": source}))
+
+
+# --- Substituição Tributária (Planilha Eletrônica ST, one sheet per segment) ---
+
+_ST_FIXED = {"item": "item", "cest": "cest", "descrição": "descricao", "op. interna": "op_interna"}
+
+
+def _st_value(header: str, value: Any) -> str:
+    """Formats MVA and internal rates (stored as fractions) as percentages and PFC as reais."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if header.startswith(("MVA", "Alíq")):
+            return f"{value * 100:.2f}".rstrip("0").rstrip(".").replace(".", ",") + "%"
+        if header.startswith("PFC"):
+            return "R$ " + f"{value:.2f}".replace(".", ",")
+    return _clean(value)
+
+
+def iter_st_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields one record per ST item: segment, CEST, description, "Op. Interna" flag, the legal
+    basis per group of UFs and the MVA-ST / internal rate / PFC fields, paired with their
+    "Especificação" column where the sheet has one.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            segmento = sheet.title
+            columns: Optional[List[str]] = None
+            cest_column = -1
+            for row in sheet.iter_rows(values_only=True):
+                if columns is not None:
+                    # Sheets are padded with ~1200 formatted but empty rows; skip them without parsing
+                    if len(row) > cest_column and row[cest_column] is not None:
+                        record = _st_record(segmento, columns, row)
+                        if record is not None:
+                            yield record
+                    continue
+                first = next((_clean(value) for value in row if value is not None), "")
+                if "SEGMENTO:" in first.upper():
+                    segmento = first.split(":", 1)[1].strip() or segmento
+                elif first.upper() == "ITEM":
+                    columns = [_clean(value) for value in row]
+                    cest_column = next((i for i, name in enumerate(columns) if name.upper() == "CEST"), -1)
+                    if cest_column < 0:
+                        break
+    finally:
+        workbook.close()
+
+
+def _st_record(segmento: str, columns: List[str], row: tuple) -> Optional[Dict[str, Any]]:
+    record: Dict[str, Any] = {"segmento": segmento, "acordos": {}, "valores": {}}
+    uf_columns = True
+    specs = {}
+    for header, value in zip(columns, row):
+        if not header:
+            continue
+        header = re.sub(r"\s*\(R\$\)$", "", header)
+        key = _ST_FIXED.get(header.lower())
+        if key:
+            record[key] = _clean(value)
+        elif header.startswith("Especificação"):
+            uf_columns = False
+            specs[header.replace("Especificação", "").strip().lower()] = _clean(value)
+        elif header.startswith(("MVA", "Alíq", "PFC", "Obs")):
+            uf_columns = False
+            record["valores"][header] = _st_value(header, value)
+        elif uf_columns:
+            # Columns between "Op. Interna" and the first MVA-ST hold the protocol/convênio per group of UFs
+            record["acordos"][header] = _clean(value)
+    if not record.get("cest"):
+        return None
+    for header, value in list(record["valores"].items()):
+        spec = specs.get(header.lower())
+        if value and spec:
+            record["valores"][header] = f"{value} ({spec})"
+    return record
+
+
+def _st_fields(record: Dict[str, Any]) -> List[Tuple[str, str]]:
+    fields = [("Op. interna", record.get("op_interna", ""))]
+    fields += [(f"Acordo {ufs}", value) for ufs, value in record["acordos"].items()]
+    fields += list(record["valores"].items())
+    return [(name, value) for name, value in fields if value]
+
+
+@register_loader("*substitui*tribut*.xlsx")
+def load_st_spreadsheet(file_path: str, source: str) -> Iterator[Document]:
+    """Documents per segment: fields shared by all its items in the header, one line per item (CEST) with the rest."""
+    group: List[Dict[str, Any]] = []
+    for record in iter_st_records(file_path):
+        if group and record["segmento"] != group[0]["segmento"]:
+            yield from _st_segment_documents(group, source)
+            group = []
+        group.append(record)
+    if group:
+        yield from _st_segment_documents(group, source)
+
+
+def _st_segment_documents(group: List[Dict[str, Any]], source: str) -> Iterator[Document]:
+    field_sets = [dict(_st_fields(record)) for record in group]
+    # Values held by most items of the segment go once in the header; items only list what differs
+    counts = Counter((name, value) for fields in field_sets for name, value in fields.items())
+    common = {}
+    for (name, value), count in counts.most_common():
+        if name not in common and count * 2 > len(group):
+            common[name] = value
+    names = dict.fromkeys(name for fields in field_sets for name in fields)
+    defaults = {name: common[name] for name in names if name in common}
+    header = f"Substituição Tributária SP - Segmento: {group[0]['segmento']}"
+    if defaults:
+        header += "\nPadrão do segmento (salvo indicação no item): " + "; ".join(
+            f"{name}: {value}" for name, value in defaults.items())
+    lines = []
+    for record, fields in zip(group, field_sets):
+        line = f"- CEST {record['cest']}"
+        if record.get("descricao"):
+            line += f": {record['descricao']}"
+        own = [f"{name}: {value}" for name, value in fields.items() if defaults.get(name) != value]
+        own += [f"{name}: -" for name in defaults if name not in fields]
+        lines.append((f"{line} ({'; '.join(own)})" if own else line, record["cest"].replace(".", "")))
+    metadata = {"source": source, "tipo": "substituicao_tributaria", "segmento": group[0]["segmento"]}
+    yield from _group_documents(header, lines, metadata, "cest_codes")
+
+
+# --- Tabela I (EFD-Contribuições): CFOPs geradores de crédito por base de cálculo ---
+
+_CFOP_GROUP = re.compile(r"^(?P<descricao>.+?)\s*-\s*Código\s*(?P<codigo>\d{2})\s*:?\s*$", re.IGNORECASE)
+
+
+def iter_cfop_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yields {"cfop", "descricao", "base_credito", "base_descricao"} for every CFOP row of each credit-base group."""
+    import xlrd
+
+    workbook = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        for index in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(index)
+            base: Tuple[str, str] = ("", "")
+            for row in sheet.get_rows():
+                first = _clean(row[0].value) if row else ""
+                rest = _clean(row[1].value) if len(row) > 1 else ""
+                group = _CFOP_GROUP.match(first)
+                if group and not rest:
+                    base = (group.group("codigo"), group.group("descricao"))
+                elif re.fullmatch(r"\d\.?\d{3}", first):
+                    yield {"cfop": first.replace(".", ""), "descricao": rest,
+                           "base_credito": base[0], "base_descricao": base[1]}
+            workbook.unload_sheet(index)
+    finally:
+        workbook.release_resources()
+
+
+@register_loader("*cfop*.xls", "*cfop*.xlsx")
+def load_cfop_table(file_path: str, source: str) -> Iterator[Document]:
+    """One Document per credit base (code 01, 02, ...) listing the CFOPs that generate it."""
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for record in iter_cfop_records(file_path):
+        groups.setdefault((record["base_credito"], record["base_descricao"]), []).append(record)
+    for (codigo, descricao), records in groups.items():
+        header = (f"CFOPs que geram crédito de PIS/COFINS - Base de cálculo do crédito {codigo}: {descricao} "
+                  f"(EFD-Contribuições, registros M105/M505)")
+        metadata = {"source": source, "tipo": "cfop_credito", "base_credito": codigo}
+        lines = [(f"- CFOP {record['cfop']}: {record['descricao']}", record["cfop"]) for record in records]
+        yield from _group_documents(header, lines, metadata, "cfop_codes")
+
+
+# --- Tabela NCM (hierarchical: capítulo 01, posição 01.01, subposições, item 0101.21.00) ---
+
+def iter_ncm_records(file_path: str) -> Iterator[Dict[str, str]]:
+    """
+    Yields {"codigo", "descricao"} for each line after the "Código" header, codes without dots.
+    Read through base_ncm's columnar cache, shared with the app, so the spreadsheet is only
+    parsed when it changes.
+    """
+    from base_ncm import carregar_tabela_ncm
+
+    yield from carregar_tabela_ncm(file_path)
+
+
+@register_loader("*ncm*.xlsx")
+def load_ncm_table(file_path: str, source: str) -> Iterator[Document]:
+    """One Document per NCM heading (4 digits) with its chapter, subheadings and 8-digit items."""
+    chapter = ""
+    heading: Optional[Dict[str, str]] = None
+    items: List[Dict[str, str]] = []
+    for record in iter_ncm_records(file_path):
+        codigo = record["codigo"]
+        if len(codigo) == 2:
+            chapter = f"Capítulo {codigo}: {record['descricao']}"
+            continue
+        if len(codigo) == 4 or heading is None or codigo[:4] != heading["codigo"]:
+            if heading is not None:
+                yield from _ncm_heading_documents(chapter, heading, items, source)
+            heading = record if len(codigo) == 4 else {"codigo": codigo[:4], "descricao": ""}
+            items = []
+            if len(codigo) == 4:
+                continue
+        items.append(record)
+    if heading is not None:
+        yield from _ncm_heading_documents(chapter, heading, items, source)
+
+
+def _ncm_heading_documents(chapter: str, heading: Dict[str, str], items: List[Dict[str, str]],
+                           source: str) -> Iterator[Document]:
+    header = f"Tabela NCM - {chapter}\nPosição {formatar_codigo_ncm(heading['codigo'])}: {heading['descricao']}".rstrip(": ")
+    lines = [(f"NCM {formatar_codigo_ncm(item['codigo'])} {item['descricao']}", item["codigo"]) for item in items]
+    metadata = {"source": source, "tipo": "ncm"}
+    yield from _group_documents(header, lines, metadata, "ncm_codes", [heading["codigo"]])
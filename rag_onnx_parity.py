@@ -0,0 +1,100 @@
+"""
+Parity check of the ONNX embedding path (rag_embeddings.OnnxEmbeddings) against PyTorch.
+
+Embeds the chunks of `referencias/` and the rag_eval query set with the sentence-transformer
+through PyTorch (HuggingFaceEmbeddings) and through its ONNX export, then reports:
+
+- cosine similarity between the two vectors of each chunk (min / mean)
+- retrieval parity per query: share of the PyTorch top-k chunks also in the ONNX top-k, and
+  share of queries with the same top-1 chunk
+- encoding throughput of both paths
+
+Exits with status 1 when the mean top-k overlap falls below --min-overlap, so it can gate a
+change of model, export or quantization.
+
+    python rag_onnx_parity.py                          # fp32 ONNX vs PyTorch
+    python rag_onnx_parity.py --int8 --threads 4 --k 10
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import List, Tuple
+
+import numpy as np
+
+from rag_embeddings import create_embeddings
+from rag_eval import EVAL_QUERIES
+from rag_loaders import find_loader
+from rag_system import DEFAULT_EMBEDDINGS_MODEL
+
+REFERENCIAS_PATH = os.path.join(os.path.dirname(__file__), 'referencias')
+DEFAULT_EXPORT_PATH = os.path.join(os.path.dirname(__file__), '.rag_index', 'onnx')
+
+
+def load_chunk_texts(referencias_path: str = REFERENCIAS_PATH) -> List[str]:
+    """Chunk texts of every supported file, produced by the same loaders as the RAG index."""
+    texts = []
+    for filename in sorted(os.listdir(referencias_path)):
+        loader = find_loader(filename)
+        if loader is not None:
+            texts.extend(doc.page_content for doc in loader(os.path.join(referencias_path, filename), filename))
+    return texts
+
+
+def embed(embeddings, texts: List[str], queries: List[str]) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Unit-normalized chunk and query vectors, and chunks encoded per second."""
+    started = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    throughput = len(texts) / (time.perf_counter() - started)
+    query_vectors = np.asarray([embeddings.embed_query(query) for query in queries], dtype=np.float32)
+    return _normalize(vectors), _normalize(query_vectors), throughput
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX and PyTorch embeddings on the reference corpus.")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDINGS_MODEL, help="Hugging Face model name.")
+    parser.add_argument("--int8", action="store_true", help="Check the int8-quantized export.")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N chunks.")
+    parser.add_argument("--export-dir", default=DEFAULT_EXPORT_PATH)
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="Minimum mean top-k overlap to pass.")
+    args = parser.parse_args()
+
+    texts = load_chunk_texts()[:args.limit]
+    queries = [item["query"] for item in EVAL_QUERIES]
+    onnx_name = ("onnx-int8:" if args.int8 else "onnx:") + args.model
+    print(f"{len(texts)} chunks, {len(queries)} queries: {args.model} (PyTorch) vs {onnx_name}")
+
+    torch_vectors, torch_queries, torch_rate = embed(create_embeddings(args.model, args.export_dir), texts, queries)
+    onnx_vectors, onnx_queries, onnx_rate = embed(create_embeddings(onnx_name, args.export_dir, args.threads),
+                                                  texts, queries)
+
+    cosines = np.sum(torch_vectors * onnx_vectors, axis=1)
+    expected = top_k(torch_vectors, torch_queries, args.k)
+    found = top_k(onnx_vectors, onnx_queries, args.k)
+    overlaps = [len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)]
+    same_top1 = float(np.mean(expected[:, 0] == found[:, 0]))
+
+    print(f"Cosine PyTorch vs ONNX: min {cosines.min():.5f}, mean {cosines.mean():.5f}")
+    print(f"Top-{args.k} overlap: mean {np.mean(overlaps):.3f}, min {min(overlaps):.3f}; same top-1: {same_top1:.3f}")
+    print(f"Throughput: PyTorch {torch_rate:.0f} chunks/s, ONNX {onnx_rate:.0f} chunks/s "
+          f"({onnx_rate / torch_rate:.2f}x)")
+    passed = np.mean(overlaps) >= args.min_overlap
+    print("PASS" if passed else f"FAIL: mean top-{args.k} overlap below {args.min_overlap}")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
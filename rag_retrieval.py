@@ -0,0 +1,309 @@
+"""
+Retrieval helpers for RAGSystem: result caching keyed by normalized query, exact fiscal
+code lookup, a BM25 inverted index over chunk texts, reciprocal-rank fusion and
+token-budgeted context packing with maximal marginal relevance.
+"""
+
+import re
+import math
+import time
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from rag_embeddings import normalize_text
+
+# Fiscal codes are matched on the raw text; dots are stripped so "8471.30.12" and "84713012" agree.
+_CODE_PATTERNS = [
+    ("ncm", re.compile(r"\bNCM\b\D{0,12}?(\d{2}(?:\.?\d){0,6})", re.IGNORECASE)),
+    ("ncm", re.compile(r"(?<![\d.])(\d{4}\.?\d{2}\.?\d{2})(?![\d.])")),
+    ("cfop", re.compile(r"\bCFOPs?\b\D{0,12}?(\d\.?\d{3})(?!\d)", re.IGNORECASE)),
+    ("cfop", re.compile(r"(?<![\d.])([1-7]\.\d{3})(?![\d.])")),
+    ("cst", re.compile(r"\b(?:CST|CSOSN)\b\D{0,12}?(\d{2,3})(?!\d)", re.IGNORECASE)),
+    ("cest", re.compile(r"(?<![\d.])(\d{2}\.\d{3}\.\d{2})(?![\d.])")),
+]
+
+# Words that only name the code type next to a code ("NCM 84713012", "CEST 01.001.00").
+_CODE_KEYWORDS = frozenset("ncm ncms cfop cfops cst csosn cest codigo".split())
+
+# Metadata fields that carry fiscal codes, and the code type each one holds.
+CODE_METADATA_KEYS = {"ncm_code": "ncm", "ncm_codes": "ncm", "cfop_codes": "cfop", "cst_codes": "cst", "cest_codes": "cest"}
+
+_STOPWORDS = frozenset(
+    "a ao aos as com da das de do dos e em na nas no nos o os ou para pela pelas pelo pelos por "
+    "qual quais que se sem sobre um uma the and of".split()
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Rough characters-per-token ratio for Portuguese text on Gemini/OpenAI tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def normalize_query(query: str) -> str:
+    return normalize_text(query).lower()
+
+
+def extract_codes(text: str) -> List[str]:
+    """Fiscal codes mentioned in `text`, as "type:digits" strings (e.g. "ncm:84713012"), in order of appearance."""
+    found = []
+    for code_type, pattern in _CODE_PATTERNS:
+        for match in pattern.finditer(text):
+            found.append((match.start(), f"{code_type}:{match.group(1).replace('.', '')}"))
+    return list(dict.fromkeys(code for _, code in sorted(found)))
+
+
+def free_text_terms(text: str) -> List[str]:
+    """Tokens of `text` left once fiscal codes and the words naming their type are removed."""
+    spans = sorted(match.span(1) for _, pattern in _CODE_PATTERNS for match in pattern.finditer(text))
+    remainder, last = [], 0
+    for start, end in spans:
+        if start >= last:
+            remainder.append(text[last:start])
+            last = end
+    remainder.append(text[last:])
+    return [token for token in tokenize(" ".join(remainder)) if token not in _CODE_KEYWORDS]
+
+
+def metadata_codes(metadata: Dict[str, Any]) -> List[str]:
+    codes = []
+    for key, code_type in CODE_METADATA_KEYS.items():
+        values = metadata.get(key)
+        if values is None:
+            continue
+        for value in values if isinstance(values, (list, tuple)) else [values]:
+            value = str(value).replace('.', '').strip()
+            if value and value != "nan":
+                codes.append(f"{code_type}:{value}")
+    return codes
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded, lowercased word tokens without Portuguese stopwords."""
+    folded = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [token for token in _TOKEN.findall(folded) if token not in _STOPWORDS and len(token) > 1]
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    return not filters or all(metadata.get(key) == value for key, value in filters.items())
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[str]:
+    """Merges ranked id lists by summing 1 / (k + rank); ids found by several rankings rise to the top."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: (-scores[item], item))
+
+
+class LexicalIndex:
+    """
+    In-memory companion of the vector index: chunk texts and metadata by id, an exact
+    fiscal-code -> ids map, and a BM25 inverted index for keyword search.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.texts: Dict[str, str] = {}
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self.codes: Dict[str, List[str]] = defaultdict(list)
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._ids: List[str] = []
+        self._lengths: List[int] = []
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, str, Dict[str, Any]]]) -> "LexicalIndex":
+        index = cls()
+        for chunk_id, text, metadata in chunks:
+            index._add(chunk_id, text, metadata or {})
+        return index
+
+    def _add(self, chunk_id: str, text: str, metadata: Dict[str, Any]):
+        doc = len(self._ids)
+        self._ids.append(chunk_id)
+        self.texts[chunk_id] = text
+        self.metadata[chunk_id] = metadata
+        for code in dict.fromkeys(metadata_codes(metadata) + extract_codes(text)):
+            self.codes[code].append(chunk_id)
+        terms = Counter(tokenize(text))
+        self._lengths.append(sum(terms.values()))
+        for term, freq in terms.items():
+            self._postings[term].append((doc, freq))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def lookup_codes(self, codes: List[str], filters: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Ids of chunks tagged with any of `codes`, in code order."""
+        ids = []
+        for code in codes:
+            ids.extend(chunk_id for chunk_id in self.codes.get(code, ())
+                       if matches_filters(self.metadata[chunk_id], filters))
+        return list(dict.fromkeys(ids))
+
+    def search(self, query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Top-k chunk ids by BM25 score."""
+        if not self._ids:
+            return []
+        total = len(self._ids)
+        avg_length = (sum(self._lengths) / total) or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc] / avg_length)
+                scores[doc] += idf * freq * (self.k1 + 1) / (freq + norm)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        results = []
+        for doc in ranked:
+            chunk_id = self._ids[doc]
+            if matches_filters(self.metadata[chunk_id], filters):
+                results.append(chunk_id)
+                if len(results) == k:
+                    break
+        return results
+
+
+def filters_key(filters: Optional[Dict[str, Any]]) -> Tuple:
+    """Hashable, order-independent form of a metadata filter dict."""
+    if not filters:
+        return ()
+    return tuple(sorted((key, repr(value)) for key, value in filters.items()))
+
+
+class RetrievalCache:
+    """
+    Bounded LRU cache with TTL mapping (normalized query, k, filters) -> chunk ids.
+
+    Every entry is tagged with the index version it was computed against, so any re-index
+    makes older entries misses without having to clear the cache explicitly.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, k: int, filters: Optional[Dict[str, Any]] = None) -> Hashable:
+        return (normalize_query(query), k, filters_key(filters))
+
+    def get(self, key: Hashable, index_version: int) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, stored_at, ids = entry
+                if version == index_version and time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return ids
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, index_version: int, ids: List[str]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (index_version, time.monotonic(), list(ids))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def strip_overlap(text: str, selected: List[str], min_overlap: int = 20, max_overlap: int = 300) -> str:
+    """
+    Removes from `text` the parts already present in `selected` chunks: the whole text when it is
+    contained in one of them, otherwise a leading (or trailing) run shared with a neighbouring
+    chunk, as produced by the splitter's chunk overlap.
+    """
+    for previous in selected:
+        if text in previous:
+            return ""
+        upper = min(len(previous), len(text), max_overlap)
+        for size in range(upper, min_overlap - 1, -1):
+            if previous.endswith(text[:size]):
+                text = text[size:].lstrip()
+                break
+            if previous.startswith(text[-size:]):
+                text = text[:-size].rstrip()
+                break
+    return text
+
+
+def pack_context(texts: List[str], vectors: Optional[List[List[float]]], token_budget: int,
+                 mmr_lambda: float = 0.7, separator: str = "\n") -> Dict[str, Any]:
+    """
+    Selects chunks by maximal marginal relevance until `token_budget` is spent.
+
+    `texts` must be ordered by relevance (best first); relevance decays linearly with rank and
+    redundancy is the highest cosine similarity to an already selected chunk. Overlap shared
+    with selected chunks is stripped before a chunk is charged against the budget.
+    """
+    count = len(texts)
+    relevance = np.array([1.0 - rank / count for rank in range(count)]) if count else np.zeros(0)
+    similarity = None
+    if vectors is not None and count:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        similarity = matrix @ matrix.T
+
+    remaining = list(range(count))
+    chosen: List[int] = []
+    chosen_texts: List[str] = []
+    used = 0
+    separator_tokens = estimate_tokens(separator) if separator else 0
+    while remaining and used < token_budget:
+        if similarity is not None and chosen:
+            redundancy = similarity[np.ix_(remaining, chosen)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+        text = strip_overlap(texts[best], chosen_texts)
+        if not text:
+            continue
+        cost = estimate_tokens(text) + (separator_tokens if chosen_texts else 0)
+        if used + cost > token_budget:
+            continue  # A smaller, less relevant chunk may still fit
+        chosen.append(best)
+        chosen_texts.append(text)
+        used += cost
+
+    return {
+        "context": separator.join(chosen_texts),
+        "chunks": chosen_texts,
+        "selected": chosen,
+        "tokens_used": used,
+        "token_budget": token_budget,
+        "candidates": count,
+    }
@@ -1,81 +1,439 @@
 import os
+import sys
 import json
-import pandas as pd
-from typing import List, Dict, Any
+import time
+import uuid
+import shutil
+import argparse
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+import numpy as np
 from langchain_core.documents import Document
 
-from langchain_community.vectorstores import Qdrant
 from qdrant_client import QdrantClient
-from langchain_community.embeddings import HuggingFaceEmbeddings # Or GoogleGenerativeAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-# Assuming utils has NCM loading
-from utils import carregar_base_ncm, consultar_ncm
+from rag_backends import QdrantBackend, NumpyBackend, quantization_mode
+from rag_ingestion import EmbeddingPipeline
+from rag_loaders import find_loader
+from rag_embeddings import EmbeddingCache, create_embeddings
+from rag_retrieval import (RetrievalCache, LexicalIndex, extract_codes, free_text_terms, reciprocal_rank_fusion,
+                           pack_context)
+
+# Bump when the chunking logic changes so existing manifests are rebuilt from scratch.
+MANIFEST_SCHEMA_VERSION = 3
+
+# Bump when the snapshot file layout changes; older snapshots are then ignored at import.
+SNAPSHOT_FORMAT_VERSION = 1
+
+DEFAULT_EMBEDDINGS_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Embedded Qdrant locks its storage folder, so every RAGSystem in the process must share one client per path.
+_local_clients: Dict[str, QdrantClient] = {}
+_local_clients_lock = threading.Lock()
+
+def _get_local_client(path: str) -> QdrantClient:
+    path = os.path.abspath(path)
+    with _local_clients_lock:
+        if path not in _local_clients:
+            os.makedirs(path, exist_ok=True)
+            _local_clients[path] = QdrantClient(path=path)
+        return _local_clients[path]
 
 class RAGSystem:
-    def __init__(self, embeddings_model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+    def __init__(self,
+                 embeddings_model_name: str = DEFAULT_EMBEDDINGS_MODEL,
+                 qdrant_url: Optional[str] = None,
+                 qdrant_path: Optional[str] = None,
+                 ingest_batch_size: int = 256,
+                 ingest_workers: Optional[int] = None,
+                 retrieval_cache_size: int = 1024,
+                 retrieval_cache_ttl: float = 3600.0,
+                 hybrid_retrieval: bool = True,
+                 snapshot_path: Optional[str] = None,
+                 vector_backend: Optional[str] = None,
+                 vector_quantization: Optional[str] = None,
+                 index_path: Optional[str] = None,
+                 embeddings_threads: Optional[int] = None):
+        """
+        By default Qdrant runs embedded in this process, persisted under `.rag_index/qdrant/` (or QDRANT_PATH).
+        Pass `qdrant_url` (or set QDRANT_URL, e.g. http://localhost:6333) to use a Qdrant server instead.
+        `ingest_batch_size` and `ingest_workers` control how new chunks are embedded (see rag_ingestion).
+        `retrieval_cache_size` (0 disables) and `retrieval_cache_ttl` bound the query result cache.
+        `hybrid_retrieval` fuses BM25 keyword results with vector results and resolves NCM/CFOP/CST/CEST
+        codes found in the query through an exact index; set it to False for pure vector search.
+        `snapshot_path` (or RAG_SNAPSHOT_PATH) points to a snapshot written by export_snapshot; it seeds
+        an empty vector store at startup so only files changed since the snapshot are embedded.
+        `vector_backend` (or RAG_VECTOR_BACKEND) is "qdrant" (default) or "numpy", an in-process
+        exact search over a contiguous array persisted under `.rag_index/vectors/`.
+        `vector_quantization` (or RAG_VECTOR_QUANTIZATION) is "none" (default), "float16" or "int8"
+        (int8 codes with float rescoring of the top candidates); see rag_backends.
+        `index_path` (default `.rag_index/` next to this file) holds manifests, the embedding cache
+        and the NumPy vector store.
+        `embeddings_model_name` prefixed with "onnx:" or "onnx-int8:" runs the model through ONNX
+        Runtime (exported once under `.rag_index/onnx/`) instead of PyTorch; `embeddings_threads`
+        (or RAG_EMBEDDINGS_THREADS) caps its CPU threads. See rag_embeddings.
+        """
         self.referencias_path = os.path.join(os.path.dirname(__file__), 'referencias')
-        self.embeddings = HuggingFaceEmbeddings(model_name=embeddings_model_name)
-        self.qdrant_client = QdrantClient(host="localhost", port=6333) # Connect to Qdrant server running in Docker
+        self.index_path = index_path or os.path.join(os.path.dirname(__file__), '.rag_index')
+        self.embeddings_model_name = embeddings_model_name
+        threads = embeddings_threads or os.environ.get("RAG_EMBEDDINGS_THREADS")
+        self.embeddings_threads = int(threads) if threads else None
+        self.onnx_export_path = os.path.join(self.index_path, 'onnx')
+        self.embeddings = create_embeddings(embeddings_model_name, self.onnx_export_path, self.embeddings_threads)
+        # Vectors keyed by (model, normalized text hash), reused across rebuilds and restarts
+        self.embedding_cache = EmbeddingCache(os.path.join(self.index_path, 'embeddings'), embeddings_model_name)
+        self.ingest_batch_size = ingest_batch_size
+        self.ingest_workers = ingest_workers
+        self.qdrant_url = qdrant_url or os.environ.get("QDRANT_URL")
+        self.qdrant_path = qdrant_path or os.environ.get("QDRANT_PATH", os.path.join(self.index_path, 'qdrant'))
         self.collection_name = "fiscal_rules_collection"
+        self.vector_backend = (vector_backend or os.environ.get("RAG_VECTOR_BACKEND", "qdrant")).lower()
+        self.vector_quantization = quantization_mode(vector_quantization or os.environ.get("RAG_VECTOR_QUANTIZATION"))
+        if self.vector_backend == "numpy":
+            self.qdrant_client = None
+            # The NumPy store always persists float32 and quantizes on load, so its location
+            # (and the manifest) does not depend on the quantization mode.
+            self.backend = NumpyBackend(os.path.join(self.index_path, 'vectors', self.collection_name),
+                                        self.vector_quantization)
+        elif self.vector_backend == "qdrant":
+            if self.qdrant_url:
+                self.qdrant_client = QdrantClient(url=self.qdrant_url)
+            else:
+                self.qdrant_client = _get_local_client(self.qdrant_path)
+            location = self.qdrant_url or os.path.abspath(self.qdrant_path)
+            if self.vector_quantization != "none":
+                # Quantization is fixed when the collection is created: a different mode gets a
+                # different location, so the manifest mismatch rebuilds it (from cached embeddings).
+                location += f"#{self.vector_quantization}"
+            self.backend = QdrantBackend(self.qdrant_client, self.collection_name, location,
+                                         self.vector_quantization)
+        else:
+            raise ValueError(f"Unknown vector backend '{self.vector_backend}' (expected 'qdrant' or 'numpy')")
+        # One manifest per backend, so switching backends does not invalidate the other's index.
+        manifest_name = self.collection_name if self.vector_backend == "qdrant" else f"{self.vector_backend}_{self.collection_name}"
+        self.manifest_path = os.path.join(self.index_path, f"manifest_{manifest_name}.json")
+        self.index_version = 0
+        self.retrieval_cache = RetrievalCache(retrieval_cache_size, retrieval_cache_ttl)
+        self.hybrid_retrieval = hybrid_retrieval
+        self.snapshot_path = snapshot_path or os.environ.get("RAG_SNAPSHOT_PATH")
+        self.lexical_index = LexicalIndex()
         self.vectorstore = None
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-
-    def _load_and_chunk_referencias(self) -> List[Document]:
-        """Loads and chunks content from all files in the referencias directory."""
-        all_docs = []
-        for filename in os.listdir(self.referencias_path):
-            file_path = os.path.join(self.referencias_path, filename)
-            if filename.endswith(".md") or filename.endswith(".txt"):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                metadata = {"source": filename}
-                all_docs.extend(self.text_splitter.create_documents([content], metadatas=[metadata]))
-            elif filename.endswith(".xlsx"):
-                try:
-                    df = pd.read_excel(file_path, usecols=[0, 1], dtype=str)
-                    df.columns = ['Código NCM', 'Descrição NCM']
-                    df['Código NCM'] = df['Código NCM'].astype(str).str.replace('.', '', regex=False)
-                    for index, row in df.iterrows():
-                        content = f"Código NCM: {row['Código NCM']} - Descrição: {row['Descrição NCM']}"
-                        metadata = {"source": filename, "ncm_code": row['Código NCM']}
-                        all_docs.append(Document(page_content=content, metadata=metadata))
-                except Exception as e:
-                    print(f"Error loading Excel file {filename}: {e}")
-
-        print(f"Loaded and chunked {len(all_docs)} documents from the referencias directory.")
-        return all_docs
-
-    def initialize_vectorstore(self):
-        """Initializes the Qdrant vector store with all knowledge base data."""
-        all_chunks = self._load_and_chunk_referencias()
-
-        if not all_chunks:
-            print("No chunks to add to vectorstore. RAG system will not be effective.")
+        self._sync_lock = threading.Lock()
+
+    @staticmethod
+    def _hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def _chunk_id(source: str, chunk_hash: str) -> str:
+        """Deterministic point id, so the same chunk text from the same file always maps to the same point."""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}:{chunk_hash}"))
+
+    def _is_supported(self, filename: str) -> bool:
+        return find_loader(filename) is not None
+
+    def _iter_file_chunks(self, filename: str) -> Iterator[Document]:
+        """Streams the chunks of a single file from the referencias directory through its registered loader (see rag_loaders)."""
+        loader = find_loader(filename)
+        if loader is None:
             return
-        
-        print(f"Creating Qdrant vector store with {len(all_chunks)} Document objects...")
         try:
-            # Delete collection if it already exists for a fresh start
-            self.qdrant_client.delete_collection(collection_name=self.collection_name)
+            yield from loader(os.path.join(self.referencias_path, filename), filename)
+        except Exception as e:
+            print(f"Error loading {filename}: {e}")
+
+    def _vector_store_location(self) -> str:
+        return self.backend.location
+
+    def _empty_manifest(self) -> Dict[str, Any]:
+        return {
+            "schema_version": MANIFEST_SCHEMA_VERSION,
+            "index_version": self.index_version,
+            "embeddings_model": self.embeddings_model_name,
+            "collection_name": self.collection_name,
+            "vector_store": self._vector_store_location(),
+            "files": {},
+        }
+
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Loads the persisted manifest, or None when it is missing or was built with another model/schema."""
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read RAG manifest, rebuilding index: {e}")
+            return None
+        if (manifest.get("schema_version") != MANIFEST_SCHEMA_VERSION
+                or manifest.get("embeddings_model") != self.embeddings_model_name
+                or manifest.get("collection_name") != self.collection_name
+                or manifest.get("vector_store") != self._vector_store_location()):
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.index_path, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _manifest_matches_collection(self, manifest: Dict[str, Any]) -> bool:
+        """Checks that the collection still holds exactly the points the manifest describes."""
+        try:
+            if not self.backend.exists():
+                return False
+            expected = sum(len(entry["chunks"]) for entry in manifest["files"].values())
+            return expected == self.backend.count()
         except Exception as e:
-            print(f"Warning: Could not delete Qdrant collection (might not exist): {e}")
+            print(f"Warning: Could not inspect the vector store: {e}")
+            return False
+
+    def _ensure_collection(self):
+        if self.backend.exists():
+            return
+        self.backend.create(self.embedding_cache.dim or len(self.embeddings.embed_query("dimensão")))
+
+    def initialize_vectorstore(self, force_rebuild: bool = False):
+        """
+        Synchronizes the vector store with the referencias directory.
+
+        A manifest of per-file and per-chunk content hashes is kept under `.rag_index/`, so
+        only chunks from added or changed files are embedded and chunks that disappeared are
+        deleted. `index_version` is bumped whenever the indexed content changes.
+        """
+        # Retrieval keeps working on the previous lexical index while a sync runs; only syncs are serialized.
+        with self._sync_lock:
+            self._sync_vectorstore(force_rebuild)
+
+    def _sync_vectorstore(self, force_rebuild: bool):
+        manifest = None if force_rebuild else self._load_manifest()
+        if manifest is not None and not self._manifest_matches_collection(manifest):
+            print("RAG manifest is out of sync with the vector collection. Rebuilding index...")
+            manifest = None
+
+        if manifest is None:
+            try:
+                # Delete collection if it already exists for a fresh start
+                self.backend.drop()
+            except Exception as e:
+                print(f"Warning: Could not delete vector collection (might not exist): {e}")
+            manifest = self._empty_manifest()
+            if not force_rebuild and self.snapshot_path and os.path.isdir(self.snapshot_path):
+                manifest = self._import_snapshot(self.snapshot_path) or manifest
+
+        self.index_version = manifest["index_version"]
+        old_files = manifest["files"]
+        new_files: Dict[str, Any] = {}
+        ids_to_delete: List[str] = []
 
         try:
-            self.vectorstore = Qdrant.from_documents(
-                all_chunks,
-                self.embeddings,
-                url="http://localhost:6333",
-                collection_name=self.collection_name,
-            )
-            print("Qdrant vector store initialized successfully.")
+            self._ensure_collection()
+            self.vectorstore = self.backend.as_vectorstore(self.embeddings)
+            pipeline = EmbeddingPipeline(self.embeddings, self.embeddings_model_name,
+                                         batch_size=self.ingest_batch_size, workers=self.ingest_workers,
+                                         cache=self.embedding_cache, onnx_export_path=self.onnx_export_path)
+            with self.backend.bulk_writes():
+                added = pipeline.run(self._iter_pending_chunks(old_files, new_files, ids_to_delete), self._upsert_batch)
+                self.backend.delete(ids_to_delete)
+            self.backend.flush()
         except Exception as e:
-            print(f"Error initializing Qdrant vector store: {e}")
+            print(f"Error initializing {self.vector_backend} vector store: {e}")
             self.vectorstore = None
+            return
+
+        changed = bool(added or ids_to_delete or new_files.keys() != old_files.keys())
+        print(f"RAG index sync: {added} chunks embedded, {len(ids_to_delete)} deleted, "
+              f"{len(new_files)} files tracked.")
+
+        if changed or not os.path.exists(self.manifest_path):
+            if changed:
+                self.index_version += 1
+            manifest["index_version"] = self.index_version
+            manifest["files"] = new_files
+            self._save_manifest(manifest)
+        self.lexical_index = LexicalIndex.build(self._iter_indexed_chunks())
+        print(f"{self.backend.name.capitalize()} vector store ready (index version {self.index_version}, {len(self.lexical_index)} chunks).")
+
+    def export_snapshot(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Writes the synchronized index to `path`: `vectors.npy` (float32, one row per point),
+        `payloads.jsonl` (id, text and metadata in the same order), `manifest.json` and a
+        `snapshot.json` header. The directory is replaced atomically. Returns the header, or
+        None when the index is not in sync with its manifest.
+        """
+        with self._sync_lock:
+            manifest = self._load_manifest()
+            if manifest is None or not self._manifest_matches_collection(manifest):
+                print("Error: RAG index is not synchronized; run initialize_vectorstore() before exporting.")
+                return None
+            count = self.backend.count()
+            dim = self.backend.dim()
+
+            tmp_path = path.rstrip(os.sep) + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                                dtype=np.float32, shape=(count, dim))
+            row = 0
+            with open(os.path.join(tmp_path, "payloads.jsonl"), 'w', encoding='utf-8') as payloads:
+                for point_id, payload, vector in self.backend.scroll(with_vectors=True):
+                    vectors[row] = vector
+                    payloads.write(json.dumps({"id": point_id, **payload}, ensure_ascii=False) + "\n")
+                    row += 1
+            vectors.flush()
+            del vectors
+
+            header = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "schema_version": MANIFEST_SCHEMA_VERSION,
+                "embeddings_model": self.embeddings_model_name,
+                "collection_name": self.collection_name,
+                "index_version": manifest["index_version"],
+                "dim": dim,
+                "count": row,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            }
+            with open(os.path.join(tmp_path, "manifest.json"), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            with open(os.path.join(tmp_path, "snapshot.json"), 'w', encoding='utf-8') as f:
+                json.dump(header, f, ensure_ascii=False, indent=2)
+
+            old_path = path.rstrip(os.sep) + ".old"
+            shutil.rmtree(old_path, ignore_errors=True)
+            if os.path.exists(path):
+                os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            print(f"RAG snapshot written to {path} ({row} chunks, index version {header['index_version']}).")
+            return header
+
+    def import_snapshot(self, path: str) -> bool:
+        """Replaces the vector store with the snapshot at `path`, then syncs any files changed since it was built."""
+        with self._sync_lock:
+            try:
+                self.backend.drop()
+            except Exception as e:
+                print(f"Warning: Could not delete vector collection (might not exist): {e}")
+            manifest = self._import_snapshot(path)
+            if manifest is None:
+                return False
+            self._save_manifest(manifest)
+            self._sync_vectorstore(force_rebuild=False)
+            return True
+
+    def _read_snapshot_header(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(path, "snapshot.json"), 'r', encoding='utf-8') as f:
+                header = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read RAG snapshot at {path}: {e}")
+            return None
+        if (header.get("format_version") != SNAPSHOT_FORMAT_VERSION
+                or header.get("schema_version") != MANIFEST_SCHEMA_VERSION
+                or header.get("embeddings_model") != self.embeddings_model_name):
+            print(f"Warning: RAG snapshot at {path} was built with another format, schema or model; ignoring it.")
+            return None
+        return header
+
+    def _import_snapshot(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Loads a snapshot into the (empty) collection without embedding anything. Vectors are
+        memory-mapped and streamed to the vector store in batches. Returns the manifest to sync against.
+        """
+        header = self._read_snapshot_header(path)
+        if header is None:
+            return None
+        started = time.perf_counter()
+        try:
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            if vectors.shape != (header["count"], header["dim"]):
+                raise ValueError(f"vectors.npy has shape {vectors.shape}, expected {(header['count'], header['dim'])}")
+            with open(os.path.join(path, "manifest.json"), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if not self.backend.exists():
+                self.backend.create(header["dim"])
+            with open(os.path.join(path, "payloads.jsonl"), 'r', encoding='utf-8') as payloads, \
+                    self.backend.bulk_writes():
+                row = 0
+                ids, batch = [], []
+                for line in payloads:
+                    payload = json.loads(line)
+                    ids.append(payload.pop("id"))
+                    batch.append(payload)
+                    row += 1
+                    if len(batch) == 1024:
+                        self.backend.upsert(ids, vectors[row - len(batch):row], batch)
+                        ids, batch = [], []
+                if batch:
+                    self.backend.upsert(ids, vectors[row - len(batch):row], batch)
+            self.backend.flush()
+        except Exception as e:
+            print(f"Error importing RAG snapshot from {path}: {e}")
+            try:
+                self.backend.drop()
+            except Exception:
+                pass
+            return None
+
+        # The snapshot may come from another machine: re-target its manifest at this vector store.
+        manifest["vector_store"] = self._vector_store_location()
+        manifest["collection_name"] = self.collection_name
+        print(f"RAG snapshot imported from {path}: {row} chunks in {time.perf_counter() - started:.1f}s "
+              f"(index version {manifest['index_version']}).")
+        return manifest
+
+    def _iter_indexed_chunks(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Streams (id, text, metadata) for every point in the collection."""
+        for point_id, payload, _ in self.backend.scroll():
+            yield point_id, payload.get("page_content", ""), payload.get("metadata") or {}
+
+    def _iter_pending_chunks(self, old_files: Dict[str, Any], new_files: Dict[str, Any],
+                             ids_to_delete: List[str]) -> Iterator[Tuple[str, Document]]:
+        """
+        Yields (point id, document) for every chunk that is not indexed yet, one file at a time.
+        Fills `new_files` with the updated manifest entries and `ids_to_delete` with stale points as it goes.
+        """
+        for filename in sorted(os.listdir(self.referencias_path)):
+            if not self._is_supported(filename):
+                continue
+            file_hash = self._hash_file(os.path.join(self.referencias_path, filename))
+            old_entry = old_files.get(filename)
+            if old_entry is not None and old_entry["hash"] == file_hash:
+                new_files[filename] = old_entry
+                continue
+
+            chunks = {}
+            for doc in self._iter_file_chunks(filename):
+                chunk_hash = self._hash_text(doc.page_content)
+                chunk_id = self._chunk_id(filename, chunk_hash)
+                if chunk_id in chunks:
+                    continue  # Identical text in the same file adds nothing to retrieval
+                chunks[chunk_id] = chunk_hash
+                if old_entry is None or chunk_id not in old_entry["chunks"]:
+                    yield chunk_id, doc
+            if old_entry is not None:
+                ids_to_delete.extend(cid for cid in old_entry["chunks"] if cid not in chunks)
+            new_files[filename] = {"hash": file_hash, "chunks": chunks}
+
+        for filename, old_entry in old_files.items():
+            if filename not in new_files:
+                ids_to_delete.extend(old_entry["chunks"])
+
+    def _upsert_batch(self, ids: List[str], docs: List[Document], vectors: List[List[float]]):
+        # Same payload layout as langchain's Qdrant wrapper, so similarity_search can read the points back.
+        self.backend.upsert(ids, vectors, [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
 
     def get_retriever(self):
         """Returns a LangChain retriever object."""
@@ -85,29 +443,187 @@ class RAGSystem:
             print("Vector store not initialized. Cannot return retriever.")
             return None
 
-    def retrieve_context(self, query: str, k: int = 5) -> List[str]:
-        """Retrieves relevant context based on a query."""
+    def search_ids(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                   use_cache: bool = True) -> List[str]:
+        """
+        Ranked chunk ids for a query: the search behind `retrieve_context`. With `use_cache=False`
+        the retrieval cache is neither read nor filled (e.g. to measure search latency).
+        """
+        if not use_cache:
+            return self._search_ids(query, k, filters)
+        cache_key = self.retrieval_cache.make_key(query, k, filters)
+        ids = self.retrieval_cache.get(cache_key, self.index_version)
+        if ids is None:
+            ids = self._search_ids(query, k, filters)
+            self.retrieval_cache.put(cache_key, self.index_version, ids)
+        return ids
+
+    def retrieve_context(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                         use_cache: bool = True) -> List[str]:
+        """
+        Retrieves relevant context based on a query.
+
+        `filters` restricts the search to chunks whose metadata matches every key/value given
+        (e.g. {"source": "tipi.txt"}). Results are cached per (normalized query, k, filters)
+        until the index version changes; see `retrieval_cache_stats()`. `use_cache=False`
+        bypasses that cache.
+        """
         if self.vectorstore:
-            print(f"DEBUG: retrieve_context called with query: {query[:100]}...")
-            print(f"DEBUG: self.vectorstore is not None: {self.vectorstore is not None}")
             try:
-                docs = self.vectorstore.similarity_search(query, k=k)
-                return [doc.page_content for doc in docs]
+                return self._fetch_chunks(self.search_ids(query, k, filters, use_cache))
             except Exception as e:
-                print(f"Error during FAISS similarity search: {e}")
+                print(f"Error during vector similarity search: {e}")
                 raise # Re-raise the exception to get a full traceback
         else:
             print("Vector store not initialized. Skipping context retrieval.")
             return []
 
-# Example Usage (for testing within rag_system.py)
-if __name__ == "__main__":
-    # Ensure GOOGLE_API_KEY is set in environment for utils.carregar_base_ncm to run if it uses it directly.
-    # For HuggingFaceEmbeddings, you often don't need a specific API key unless using a private model.
+    def retrieve_context_batch(self, queries: List[str], k: int = 10, k_per_query: Optional[int] = None,
+                               filters: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Retrieves context for several queries at once (e.g. one per product or discrepancy).
 
-    rag_sys = RAGSystem()
-    rag_sys.initialize_vectorstore()
+        Queries missing from the cache are embedded in a single model call and searched in a
+        single batched vector-store request; the per-query rankings (`k_per_query` each,
+        default `k`) are merged by reciprocal-rank fusion and deduplicated down to `k` chunks.
+        """
+        queries = list(dict.fromkeys(q for q in queries if q and q.strip()))
+        if not self.vectorstore or not queries:
+            if not self.vectorstore:
+                print("Vector store not initialized. Skipping context retrieval.")
+            return []
+        return self._fetch_chunks(self._ranked_ids_batch(queries, k, k_per_query, filters))
 
+    def _ranked_ids_batch(self, queries: List[str], k: int, k_per_query: Optional[int],
+                          filters: Optional[Dict[str, Any]]) -> List[str]:
+        per_query = k_per_query or k
+        keys = [self.retrieval_cache.make_key(query, per_query, filters) for query in queries]
+        rankings = [self.retrieval_cache.get(key, self.index_version) for key in keys]
+        misses = [i for i, ranking in enumerate(rankings) if ranking is None]
+        try:
+            for i, ids in zip(misses, self._search_ids_batch([queries[i] for i in misses], per_query, filters)):
+                self.retrieval_cache.put(keys[i], self.index_version, ids)
+                rankings[i] = ids
+        except Exception as e:
+            print(f"Error during vector batch search: {e}")
+            raise
+        return reciprocal_rank_fusion(rankings)[:k]
+
+    def assemble_context(self, queries, token_budget: int, candidates: int = 20,
+                         filters: Optional[Dict[str, Any]] = None, mmr_lambda: float = 0.7) -> Dict[str, Any]:
+        """
+        Builds a prompt-ready context of at most `token_budget` (estimated) tokens.
+
+        Retrieves `candidates` chunks for `queries` (a string or a list, as in
+        retrieve_context_batch), then picks them by maximal marginal relevance while stripping
+        text that overlaps already selected chunks. Returns a dict with "context" (the joined
+        text), "chunks", "tokens_used" and "token_budget".
+        """
+        if isinstance(queries, str):
+            queries = [queries]
+        queries = list(dict.fromkeys(q for q in queries if q and q.strip()))
+        if not self.vectorstore or not queries:
+            if not self.vectorstore:
+                print("Vector store not initialized. Skipping context retrieval.")
+            return pack_context([], None, token_budget)
+        ids = self._ranked_ids_batch(queries, candidates, None, filters)
+        texts = self.lexical_index.texts
+        ids = [point_id for point_id in ids if point_id in texts]
+        vectors = self._fetch_vectors(ids)
+        packed = pack_context([texts[point_id] for point_id in ids], vectors, token_budget, mmr_lambda)
+        print(f"RAG context: {len(packed['chunks'])}/{len(ids)} chunks, "
+              f"{packed['tokens_used']}/{token_budget} tokens.")
+        return packed
+
+    def _fetch_vectors(self, ids: List[str]) -> Optional[List[List[float]]]:
+        if not ids:
+            return None
+        by_id = {point_id: vector for point_id, _, vector in self.backend.retrieve(ids, with_vectors=True)}
+        if len(by_id) != len(ids):
+            return None
+        return [by_id[point_id] for point_id in ids]
+
+    def _search_ids(self, query: str, k: int, filters: Optional[Dict[str, Any]]) -> List[str]:
+        return self._search_ids_batch([query], k, filters)[0]
+
+    def _search_ids_batch(self, queries: List[str], k: int, filters: Optional[Dict[str, Any]]) -> List[List[str]]:
+        """
+        Hybrid search. Chunks tagged with a code mentioned in the query come first. When the query
+        is only codes (e.g. "NCM 84713012", "CFOP 1102") and some chunk is tagged with them, or
+        the tagged chunks already fill k, the embedding model is never called: the remaining
+        slots come from BM25. Otherwise the free text goes through BM25 and the vector index,
+        fused by reciprocal rank.
+        """
+        results: List[Optional[List[str]]] = [None] * len(queries)
+        exact_hits: Dict[int, List[str]] = {}
+        pending = []
+        for i, query in enumerate(queries):
+            if self.hybrid_retrieval:
+                exact = self.lexical_index.lookup_codes(extract_codes(query), filters)
+                if len(exact) >= k:
+                    results[i] = exact[:k]
+                    continue
+                if exact and not free_text_terms(query):
+                    lexical = self.lexical_index.search(query, k, filters)
+                    results[i] = list(dict.fromkeys(exact + lexical))[:k]
+                    continue
+                exact_hits[i] = exact
+            pending.append(i)
+
+        candidates = k * 3 if self.hybrid_retrieval else k
+        vector_rankings = self._vector_search_ids_batch([queries[i] for i in pending], candidates, filters)
+        for i, vector_ids in zip(pending, vector_rankings):
+            if not self.hybrid_retrieval:
+                results[i] = vector_ids
+                continue
+            fused = reciprocal_rank_fusion([vector_ids, self.lexical_index.search(queries[i], candidates, filters)])
+            results[i] = list(dict.fromkeys(exact_hits[i] + fused))[:k]
+        return results
+
+    def _vector_search_ids_batch(self, queries: List[str], k: int,
+                                 filters: Optional[Dict[str, Any]]) -> List[List[str]]:
+        """One embedding call and one batched vector-store search for all queries."""
+        if not queries:
+            return []
+        if len(queries) == 1:
+            vectors = [self.embeddings.embed_query(queries[0])]
+        else:
+            vectors = self.embeddings.embed_documents(queries)
+        return self.backend.search_batch(vectors, k, filters)
+
+    def _fetch_chunks(self, ids: List[str]) -> List[str]:
+        """Resolves point ids to chunk texts, preserving the given order."""
+        texts = self.lexical_index.texts
+        missing = [point_id for point_id in ids if point_id not in texts]
+        if missing:
+            points = self.backend.retrieve(missing)
+            texts = {**texts, **{point_id: payload.get("page_content", "") for point_id, payload, _ in points}}
+        return [texts[point_id] for point_id in ids if point_id in texts]
+
+    def retrieval_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the retrieval result cache."""
+        return self.retrieval_cache.stats()
+
+_shared_system: Optional[RAGSystem] = None
+_shared_system_lock = threading.Lock()
+
+def get_rag_system() -> RAGSystem:
+    """
+    Process-wide RAGSystem shared by every agent and Streamlit session: the embedding model is
+    loaded, the vector store synchronized and the query path warmed once, on first use.
+    Retrieval on the shared instance is thread-safe.
+    """
+    global _shared_system
+    if _shared_system is None:
+        with _shared_system_lock:
+            if _shared_system is None:
+                rag_sys = RAGSystem()
+                rag_sys.initialize_vectorstore()
+                rag_sys.embeddings.embed_query("aquecimento")  # First call pays the model's lazy setup
+                _shared_system = rag_sys
+    return _shared_system
+
+def _print_example(rag_sys: RAGSystem):
     if rag_sys.vectorstore:
         query = "Qual é a alíquota de ICMS para operações interestaduais envolvendo o NCM 84713012, e quais são as regras de substituição tributária aplicáveis?"
         context = rag_sys.retrieve_context(query)
@@ -115,3 +631,27 @@ if __name__ == "__main__":
         for i, c in enumerate(context):
             print(f"--- Chunk {i+1} ---")
             print(c)
+
+# Example Usage (for testing within rag_system.py)
+#   python rag_system.py                              sync the index and run an example query
+#   python rag_system.py snapshot-export <dir>        sync the index and write a snapshot for deploy images
+#   python rag_system.py snapshot-import <dir>        load a snapshot into the vector store
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG index maintenance for the fiscal reference corpus.")
+    subparsers = parser.add_subparsers(dest="command")
+    export_parser = subparsers.add_parser("snapshot-export", help="Build the index and write a snapshot.")
+    export_parser.add_argument("path", help="Snapshot directory (replaced if it exists).")
+    export_parser.add_argument("--rebuild", action="store_true", help="Re-index from scratch before exporting.")
+    import_parser = subparsers.add_parser("snapshot-import", help="Load a snapshot into the vector store.")
+    import_parser.add_argument("path", help="Snapshot directory written by snapshot-export.")
+    args = parser.parse_args()
+
+    rag_sys = RAGSystem()
+    if args.command == "snapshot-export":
+        rag_sys.initialize_vectorstore(force_rebuild=args.rebuild)
+        sys.exit(0 if rag_sys.export_snapshot(args.path) else 1)
+    elif args.command == "snapshot-import":
+        sys.exit(0 if rag_sys.import_snapshot(args.path) else 1)
+    else:
+        rag_sys.initialize_vectorstore()
+        _print_example(rag_sys)
@@ -0,0 +1,109 @@
+"""
+Orçamento de tempo de importação e de primeira renderização do app Streamlit.
+
+Executa o app.py num processo Python limpo com o streamlit.testing (AppTest), como o servidor
+faz a cada nova sessão, uma vez para cada tela inicial (boas-vindas e login), e verifica que:
+
+- a tela renderiza dentro do orçamento (padrão: 1 s, sem contar a importação do Streamlit);
+- nenhum módulo pesado (PyTorch, sentence-transformers, LangChain, Qdrant, Gemini, agentes,
+  RAG) foi importado para isso: eles só devem carregar quando a página ou o agente que os usa
+  roda pela primeira vez.
+
+Com --detalhes (ou em caso de falha) lista as importações mais lentas da tela, medidas com
+`python -X importtime`. Sai com status 1 se alguma tela estourar o orçamento.
+
+    python tempo_importacao.py
+    python tempo_importacao.py --orcamento 0.5 --detalhes
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+RAIZ = os.path.abspath(os.path.dirname(__file__))
+TELAS = ("welcome", "login")
+
+# Prefixos de módulos que não podem ser importados pelas telas iniciais.
+MODULOS_PESADOS = (
+    "torch", "sentence_transformers", "transformers", "onnxruntime",
+    "langchain", "langchain_core", "langchain_community", "langchain_google_genai",
+    "qdrant_client", "google.generativeai",
+    "rag_system", "agents.validador", "agents.analista", "agents.tributarista",
+)
+
+MARCADOR = "--- app.py ---"
+
+# Código executado no processo filho: importa o Streamlit fora da medição e roda o app.py.
+_FILHO = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=120)
+app.session_state["view"] = {tela!r}
+sys.stderr.write({marcador!r} + "\\n")
+sys.stderr.flush()
+inicio = time.perf_counter()
+app.run()
+segundos = time.perf_counter() - inicio
+pesados = sorted(nome for nome in sys.modules if any(nome == p or nome.startswith(p + ".") for p in {pesados!r}))
+print(json.dumps({{"segundos": segundos, "pesados": pesados,
+                  "excecoes": [str(e.value) for e in app.exception]}}))
+"""
+
+
+def medir_tela(tela: str) -> Dict[str, Any]:
+    """Roda o app.py na `tela` num processo novo e devolve tempo, módulos pesados e importações lentas."""
+    codigo = _FILHO.format(app=os.path.join(RAIZ, "app.py"), tela=tela, marcador=MARCADOR,
+                           pesados=MODULOS_PESADOS)
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo], cwd=RAIZ,
+                              capture_output=True, text=True, timeout=300)
+    if processo.returncode != 0 or not processo.stdout.strip():
+        raise RuntimeError(f"Falha ao executar a tela '{tela}':\n{processo.stderr[-2000:]}")
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    resultado["importacoes"] = importacoes_lentas(processo.stderr)
+    return resultado
+
+
+def importacoes_lentas(saida_importtime: str, limite: int = 10) -> List[Tuple[str, float]]:
+    """(módulo, ms acumulados) das importações de primeiro nível feitas pelo app.py, da mais lenta à mais rápida."""
+    linhas = saida_importtime.split(MARCADOR, 1)[-1].splitlines()
+    medidas = []
+    for linha in linhas:
+        encontrado = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)", linha)
+        if encontrado:
+            medidas.append((len(encontrado.group(2)), encontrado.group(3), int(encontrado.group(1)) / 1000))
+    if not medidas:
+        return []
+    nivel = min(recuo for recuo, _, _ in medidas)
+    primeiro_nivel = [(nome, ms) for recuo, nome, ms in medidas if recuo == nivel]
+    return sorted(primeiro_nivel, key=lambda item: -item[1])[:limite]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica o tempo de primeira renderização das telas iniciais.")
+    parser.add_argument("--orcamento", type=float, default=1.0, help="Segundos permitidos por tela.")
+    parser.add_argument("--detalhes", action="store_true", help="Lista as importações mais lentas de cada tela.")
+    args = parser.parse_args()
+
+    aprovado = True
+    for tela in TELAS:
+        resultado = medir_tela(tela)
+        dentro = resultado["segundos"] <= args.orcamento and not resultado["pesados"]
+        aprovado = aprovado and dentro
+        print(f"{tela}: {resultado['segundos']:.3f} s (orçamento {args.orcamento:.1f} s) "
+              f"{'OK' if dentro else 'ACIMA DO ORÇAMENTO'}")
+        if resultado["pesados"]:
+            print(f"  módulos pesados importados: {', '.join(resultado['pesados'])}")
+        for excecao in resultado["excecoes"]:
+            print(f"  exceção no app: {excecao}")
+        if args.detalhes or not dentro:
+            for nome, ms in resultado["importacoes"]:
+                print(f"  {ms:8.1f} ms  {nome}")
+    sys.exit(0 if aprovado else 1)
+
+
+if __name__ == "__main__":
+    main()
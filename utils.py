@@ -1,13 +1,15 @@
 # --- Importações Essenciais ---
 import streamlit as st
-import pandas as pd
 import re
-import google.generativeai as genai
-from google.api_core import exceptions
 import os
+import pandas as pd
 
 # --- Funções de Validação e Obtenção de Modelos ---
+# O SDK do Gemini é importado só quando usado: importá-lo no topo atrasava a abertura do app.
 def validate_gemini_api_key(api_key):
+    import google.generativeai as genai
+    from google.api_core import exceptions
+
     try:
         genai.configure(api_key=api_key)
         genai.list_models()
@@ -20,6 +22,8 @@ def validate_gemini_api_key(api_key):
         return False
 
 def get_gemini_models():
+    import google.generativeai as genai
+
     try:
         return [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
     except Exception as e:
@@ -27,15 +31,20 @@ def get_gemini_models():
         return []
 
 # --- Funções de Consulta à Base de Conhecimento (NCM) ---
+def carregar_tabela_base_ncm():
+    """TabelaNCM de carregar_base_ncm: a tabela padrão do processo, também usada pelo classificador NCM."""
+    from base_ncm import tabela_ncm
+
+    return tabela_ncm()
+
 @st.cache_data
 def carregar_base_ncm():
-    """Carrega a planilha de NCM para um DataFrame em cache."""
-    caminho_planilha = os.path.join(os.path.dirname(__file__), 'referencias', 'Tabela_NCM_Vigente_20251024.xlsx')
+    """Carrega a tabela NCM para um DataFrame em cache (lida do cache colunar do base_ncm)."""
+    from base_ncm import CAMINHO_PLANILHA_NCM
+
+    caminho_planilha = CAMINHO_PLANILHA_NCM
     try:
-        df = pd.read_excel(caminho_planilha, usecols=[0, 1], dtype={'Código NCM': str})
-        df.columns = ['Código NCM', 'Descrição NCM']
-        df['Código NCM'] = df['Código NCM'].str.replace('.', '', regex=False)
-        return df
+        return carregar_tabela_base_ncm().para_dataframe()
     except FileNotFoundError:
         st.error(f"A planilha de NCM não foi encontrada em '{caminho_planilha}'. Verifique o caminho e o nome do arquivo.")
         return None
@@ -43,6 +52,12 @@ def carregar_base_ncm():
         st.error(f"Erro ao ler a planilha de NCM: {e}")
         return None
 
+def _descricoes_ncm(base_ncm_df):
+    """'Descrição NCM' indexada pelo código: a de carregar_base_ncm já vem assim; outras bases são reindexadas."""
+    if 'Código NCM' in base_ncm_df.columns and not pd.api.types.is_string_dtype(base_ncm_df.index):
+        base_ncm_df = base_ncm_df.set_index(base_ncm_df['Código NCM'].astype(str))
+    return base_ncm_df['Descrição NCM']
+
 def consultar_ncm(ncm_codigo, base_ncm_df):
     """Consulta a descrição de um NCM na base de conhecimento."""
     if base_ncm_df is None:
@@ -51,12 +66,24 @@ def consultar_ncm(ncm_codigo, base_ncm_df):
     try:
         # Limpa o código NCM para garantir a busca correta
         ncm_codigo_limpo = str(ncm_codigo).strip().replace('.', '')
-        
-        resultado = base_ncm_df[base_ncm_df['Código NCM'] == ncm_codigo_limpo]
-        
-        if not resultado.empty:
-            return resultado['Descrição NCM'].iloc[0]
-        else:
-            return "NCM não encontrado na base de conhecimento."
+
+        # Busca por hash no índice de códigos, sem varrer a tabela
+        descricoes = _descricoes_ncm(base_ncm_df)
+        descricao = descricoes.get(ncm_codigo_limpo)
+
+        if descricao is not None:
+            return descricao
+
+        # Código ausente (ex.: NCM extinto ou desdobrado): descreve o ancestral mais longo da própria base
+        from base_ncm import formatar_caminho_ncm
+
+        resolvido = next((ncm_codigo_limpo[:tamanho] for tamanho in range(len(ncm_codigo_limpo) - 1, 1, -1)
+                          if ncm_codigo_limpo[:tamanho] in descricoes.index), None)
+        caminho = [{"codigo": resolvido[:tamanho], "descricao": str(descricoes[resolvido[:tamanho]]).lstrip("- ")}
+                   for tamanho in range(2, len(resolvido) + 1)
+                   if resolvido[:tamanho] in descricoes.index] if resolvido else []
+        if caminho:
+            return f"NCM não encontrado na base de conhecimento. Código mais próximo: {formatar_caminho_ncm(caminho)}"
+        return "NCM não encontrado na base de conhecimento."
     except Exception as e:
         return f"Erro ao consultar NCM: {e}"
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+Extração da NF-e com lxml (opcional): mesmo esquema e mesmos valores de extrair_dados_xml.
+
+As consultas das funções de view.extrator_xml (findtext com caminhos "nfe:..." e buscas
+".//nfe:vICMS" em cada item) são resolvidas a cada chamada. Aqui cada caminho vira um
+etree.XPath compilado uma única vez, com o namespace já resolvido, e os campos de cada seção
+ficam numa tabela (coluna, caminho) percorrida em ordem, o que preserva a ordem das colunas.
+
+lxml não faz parte de requirements.txt: sem ele, lxml_disponivel() devolve False e
+extrair_dados_xml_lxml levanta ImportError com a instrução de instalação
+(pip install lxml). A paridade com extrair_dados_xml é conferida em nfe_benchmark.py.
+"""
+
+import io
+import os
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from view.extrator_xml import CAMPOS_TRIBUTOS, NS, SECOES_CABECALHO, converter_codigo_uf, valor_numerico
+
+# Campos do cabeçalho por seção filha de infNFe: (grupo dentro da seção ou None, campos).
+# Cada campo é (coluna, caminho, converter a UF?). Um grupo ausente não gera as suas colunas,
+# como em dados_secao.
+CAMPOS_CABECALHO = {
+    "ide": [(None, [
+        ("Número NF", "nfe:nNF", False), ("Série", "nfe:serie", False),
+        ("Data Emissão", "nfe:dhEmi", False), ("Data Saída/Entrada", "nfe:dhSaiEnt", False),
+        ("Natureza Operação", "nfe:natOp", False), ("Tipo NF", "nfe:tpNF", False),
+        ("Modelo", "nfe:mod", False), ("UF", "nfe:cUF", True), ("UF Código", "nfe:cUF", False),
+        ("Finalidade", "nfe:finNFe", False),
+    ])],
+    "emit": [(None, [
+        ("Emitente CNPJ", "nfe:CNPJ", False), ("Emitente Nome", "nfe:xNome", False),
+        ("Emitente Fantasia", "nfe:xFant", False), ("Emitente IE", "nfe:IE", False),
+        ("Emitente UF", "nfe:enderEmit/nfe:UF", True), ("Emitente Município", "nfe:enderEmit/nfe:xMun", False),
+        ("Emitente CEP", "nfe:enderEmit/nfe:CEP", False),
+    ])],
+    "dest": [(None, [
+        ("Destinatário CNPJ", "nfe:CNPJ", False), ("Destinatário Nome", "nfe:xNome", False),
+        ("Destinatário IE", "nfe:IE", False), ("Destinatário UF", "nfe:enderDest/nfe:UF", True),
+        ("Destinatário Município", "nfe:enderDest/nfe:xMun", False),
+        ("Destinatário CEP", "nfe:enderDest/nfe:CEP", False),
+    ])],
+    "transp": [
+        (None, [("Modalidade Frete", "nfe:modFrete", False)]),
+        ("nfe:transporta", [("Transportadora Nome", "nfe:xNome", False),
+                            ("Transportadora CNPJ", "nfe:CNPJ", False), ("Transportadora UF", "nfe:UF", True)]),
+        ("nfe:vol", [("Qtde Volumes", "nfe:qVol", False), ("Peso Líquido", "nfe:pesoL", False),
+                     ("Peso Bruto", "nfe:pesoB", False)]),
+    ],
+    "cobr": [
+        ("nfe:fat", [("Número Fatura", "nfe:nFat", False), ("Valor Original", "nfe:vOrig", False),
+                     ("Valor Líquido", "nfe:vLiq", False)]),
+        ("nfe:dup", [("Número Duplicata", "nfe:nDup", False), ("Data Vencimento", "nfe:dVenc", False),
+                     ("Valor Duplicata", "nfe:vDup", False)]),
+    ],
+    "total": [
+        ("nfe:ICMSTot", [("Base ICMS", "nfe:vBC", False), ("Valor ICMS", "nfe:vICMS", False),
+                         ("Valor Produtos", "nfe:vProd", False), ("Valor NF", "nfe:vNF", False),
+                         ("Valor Frete", "nfe:vFrete", False), ("Valor IPI", "nfe:vIPI", False),
+                         ("Valor COFINS", "nfe:vCOFINS", False), ("Valor PIS", "nfe:vPIS", False)]),
+    ],
+}
+
+# Campos de cada item: os de `prod` e, se houver `imposto`, os valores dos tributos (os grupos
+# completos de tributos vêm de CAMPOS_TRIBUTOS, compartilhado com view.extrator_xml).
+CAMPOS_PRODUTO = [
+    ("Código", "nfe:cProd"), ("Descrição", "nfe:xProd"), ("NCM", "nfe:NCM"), ("CFOP", "nfe:CFOP"),
+    ("Unidade", "nfe:uCom"), ("Quantidade", "nfe:qCom"), ("Valor Unitário", "nfe:vUnCom"),
+    ("Valor Total", "nfe:vProd"),
+]
+CAMPOS_IMPOSTO = [("ICMS", ".//nfe:vICMS"), ("IPI", ".//nfe:vIPI"), ("PIS", ".//nfe:vPIS"), ("COFINS", ".//nfe:vCOFINS")]
+
+
+def lxml_disponivel() -> bool:
+    try:
+        import lxml.etree  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _Consultas:
+    """XPath compilados de todos os caminhos usados na extração."""
+
+    def __init__(self, etree):
+        def compilar(caminho: str) -> Callable:
+            return etree.XPath(caminho, namespaces=NS)
+
+        self.parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+        self.parser_utf8 = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True, encoding="utf-8")
+        self.inf_nfe = compilar("descendant-or-self::nfe:infNFe")
+        self.det = compilar("nfe:det")
+        self.prod = compilar("nfe:prod")
+        self.imposto = compilar("nfe:imposto")
+        self.secoes = {nome: compilar(f"nfe:{nome}") for nome in SECOES_CABECALHO}
+        self.cabecalho = {
+            nome: [(compilar(grupo) if grupo else None,
+                    [(coluna, compilar(caminho), uf) for coluna, caminho, uf in campos])
+                   for grupo, campos in grupos]
+            for nome, grupos in CAMPOS_CABECALHO.items()
+        }
+        self.produto = [(coluna, compilar(caminho)) for coluna, caminho in CAMPOS_PRODUTO]
+        self.imposto_campos = [(coluna, compilar(caminho)) for coluna, caminho in CAMPOS_IMPOSTO]
+        self.tributos = [(compilar(grupo), [(coluna, compilar(caminho), numerico) for coluna, caminho, numerico in campos])
+                         for grupo, campos in CAMPOS_TRIBUTOS]
+
+
+@lru_cache(maxsize=1)
+def _consultas() -> _Consultas:
+    try:
+        from lxml import etree
+    except ImportError as e:
+        raise ImportError("A extração com lxml precisa do pacote opcional lxml (pip install lxml)") from e
+    return _Consultas(etree)
+
+
+def _texto(xpath: Callable, elemento) -> str:
+    """Como findtext(..., default="0"): texto do primeiro resultado, "" se vazio, "0" se ausente."""
+    encontrados = xpath(elemento)
+    if not encontrados:
+        return "0"
+    return encontrados[0].text or ""
+
+
+def _raiz(fonte: Union[str, bytes, os.PathLike, io.IOBase], consultas: _Consultas):
+    from lxml import etree
+
+    if isinstance(fonte, bytes):
+        return etree.fromstring(fonte, consultas.parser)
+    if isinstance(fonte, str) and fonte.lstrip().startswith("<"):
+        # Conteúdo já decodificado (como no upload do app): a declaração de encoding não vale mais
+        return etree.fromstring(fonte.encode("utf-8"), consultas.parser_utf8)
+    return etree.parse(fonte, consultas.parser).getroot()
+
+
+def extrair_dados_xml_lxml(fonte: Union[str, bytes, os.PathLike, io.IOBase]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Mesmo resultado de extrair_dados_xml (cabecalho_df, produtos_df), com lxml e XPath compilados."""
+    consultas = _consultas()
+    encontrados = consultas.inf_nfe(_raiz(fonte, consultas))
+    if not encontrados:
+        raise ValueError("XML sem o grupo infNFe: não parece uma NF-e.")
+    inf_nfe = encontrados[0]
+
+    dados: Dict[str, str] = {}
+    for nome in SECOES_CABECALHO:
+        secoes = consultas.secoes[nome](inf_nfe)
+        if not secoes:
+            continue
+        for grupo, campos in consultas.cabecalho[nome]:
+            elemento = secoes[0]
+            if grupo is not None:
+                grupos = grupo(elemento)
+                if not grupos:
+                    continue
+                elemento = grupos[0]
+            for coluna, xpath, uf in campos:
+                valor = _texto(xpath, elemento)
+                dados[coluna] = converter_codigo_uf(valor) if uf else valor
+
+    produtos: List[Dict[str, str]] = []
+    for det in consultas.det(inf_nfe):
+        prod: Optional[list] = consultas.prod(det)
+        if not prod:
+            continue
+        p = {"Item": det.get("nItem", "0")}
+        for coluna, xpath in consultas.produto:
+            p[coluna] = _texto(xpath, prod[0])
+        imposto = consultas.imposto(det)
+        if imposto:
+            for coluna, xpath in consultas.imposto_campos:
+                p[coluna] = _texto(xpath, imposto[0])
+        for grupo, campos in consultas.tributos:
+            elementos = grupo(imposto[0]) if imposto else []
+            for coluna, xpath, numerico in campos:
+                texto = _texto(xpath, elementos[0]) if elementos else "0"
+                p[coluna] = valor_numerico(texto) if numerico else texto
+        produtos.append(p)
+
+    return pd.DataFrame([dados]).fillna("0"), pd.DataFrame(produtos).fillna("0")
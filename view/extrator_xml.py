@@ -0,0 +1,317 @@
+"""
+Extração dos dados da NF-e (cabeçalho e produtos) a partir do XML.
+
+Os campos de cada seção (ide, emit, dest, transp, cobr, total e det) são lidos pelas mesmas
+funções nos dois modos:
+
+- extrair_dados_xml (view.main): monta a árvore inteira com ET.fromstring; simples e suficiente
+  para notas comuns.
+- LeitorNFe / extrair_dados_xml_streaming: uma única passada com ET.iterparse, que trata cada
+  seção ao fechar a tag e a descarta em seguida. Os produtos saem em blocos de tamanho fixo
+  (DataFrames) e o cabeçalho é montado na mesma passada, ficando completo ao fim dela. A
+  memória fica limitada a um bloco, mesmo em notas com milhares de itens `det`.
+"""
+
+import io
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+NS = {"nfe": "http://www.portalfiscal.inf.br/nfe"}
+_TAG_INF_NFE = "{http://www.portalfiscal.inf.br/nfe}infNFe"
+_PREFIXO_TAG = "{http://www.portalfiscal.inf.br/nfe}"
+
+# Seções do cabeçalho, na ordem das colunas de cabecalho_df.
+SECOES_CABECALHO = ("ide", "emit", "dest", "transp", "cobr", "total")
+
+# Produtos por bloco no modo streaming.
+TAMANHO_BLOCO = 1000
+
+# Grupos de tributos de cada item, relativos a `imposto`: (grupo, campos). Cada campo é
+# (coluna, caminho dentro do grupo, numérico?). Os numéricos viram float (0.0 se ausentes);
+# os códigos (origem, CST, CSOSN, modalidades) continuam texto, para não perder zeros à
+# esquerda. O grupo do ICMS é o único filho de ICMS (ICMS00, ICMS10, ..., ICMSSN101, ...); os
+# de PIS e COFINS, o único filho de PIS/COFINS (Aliq, Qtde, NT ou Outr).
+CAMPOS_TRIBUTOS = [
+    ("nfe:ICMS/*", [
+        ("Origem", "nfe:orig", False), ("CST ICMS", "nfe:CST", False), ("CSOSN", "nfe:CSOSN", False),
+        ("Modalidade BC ICMS", "nfe:modBC", False), ("Base ICMS", "nfe:vBC", True),
+        ("Alíquota ICMS", "nfe:pICMS", True), ("Valor ICMS", "nfe:vICMS", True),
+        ("Modalidade BC ICMS ST", "nfe:modBCST", False), ("MVA ICMS ST", "nfe:pMVAST", True),
+        ("Base ICMS ST", "nfe:vBCST", True), ("Alíquota ICMS ST", "nfe:pICMSST", True),
+        ("Valor ICMS ST", "nfe:vICMSST", True), ("Alíquota FCP", "nfe:pFCP", True),
+        ("Valor FCP", "nfe:vFCP", True), ("Valor FCP ST", "nfe:vFCPST", True),
+    ]),
+    ("nfe:IPI", [
+        ("CST IPI", "*/nfe:CST", False), ("Base IPI", "*/nfe:vBC", True),
+        ("Alíquota IPI", "*/nfe:pIPI", True), ("Valor IPI", "*/nfe:vIPI", True),
+    ]),
+    ("nfe:PIS/*", [
+        ("CST PIS", "nfe:CST", False), ("Base PIS", "nfe:vBC", True),
+        ("Alíquota PIS", "nfe:pPIS", True), ("Valor PIS", "nfe:vPIS", True),
+    ]),
+    ("nfe:COFINS/*", [
+        ("CST COFINS", "nfe:CST", False), ("Base COFINS", "nfe:vBC", True),
+        ("Alíquota COFINS", "nfe:pCOFINS", True), ("Valor COFINS", "nfe:vCOFINS", True),
+    ]),
+]
+
+# Conferência base x alíquota = valor por tributo: (tributo, base, alíquota, valor, dedução,
+# código que dispensa a conferência). No ICMS ST o valor destacado é o imposto da operação
+# própria descontado do calculado; no Simples Nacional (CSOSN 201, 202, 203, 900) esse imposto
+# próprio não vem no grupo, então o ST desses itens não é conferido.
+CALCULOS_TRIBUTOS = [
+    ("ICMS", "Base ICMS", "Alíquota ICMS", "Valor ICMS", None, None),
+    ("ICMS ST", "Base ICMS ST", "Alíquota ICMS ST", "Valor ICMS ST", "Valor ICMS", "CSOSN"),
+    ("IPI", "Base IPI", "Alíquota IPI", "Valor IPI", None, None),
+    ("PIS", "Base PIS", "Alíquota PIS", "Valor PIS", None, None),
+    ("COFINS", "Base COFINS", "Alíquota COFINS", "Valor COFINS", None, None),
+]
+
+MAPA_UF = {
+    '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
+    '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL', '28': 'SE', '29': 'BA',
+    '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP',
+    '41': 'PR', '42': 'SC', '43': 'RS',
+    '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF'
+}
+
+
+def converter_codigo_uf(codigo_uf):
+    """Converte código numérico da UF para sigla"""
+    return MAPA_UF.get(str(codigo_uf), codigo_uf)
+
+
+def get_text(tag, parent, default="0"):
+    return parent.findtext(tag, default=default, namespaces=NS)
+
+
+def valor_numerico(texto: str) -> float:
+    """Valor decimal da NF-e (ponto como separador); vazio ou inválido vale 0.0."""
+    try:
+        return float(texto)
+    except ValueError:
+        return 0.0
+
+
+def dados_secao(nome: str, secao: ET.Element) -> Dict[str, str]:
+    """Campos do cabeçalho vindos de uma seção filha de infNFe (ide, emit, dest, transp, cobr ou total)."""
+    dados = {}
+
+    # --- IDE (Identificação da Nota) ---
+    if nome == "ide":
+        dados["Número NF"] = get_text("nfe:nNF", secao)
+        dados["Série"] = get_text("nfe:serie", secao)
+        dados["Data Emissão"] = get_text("nfe:dhEmi", secao)
+        dados["Data Saída/Entrada"] = get_text("nfe:dhSaiEnt", secao)
+        dados["Natureza Operação"] = get_text("nfe:natOp", secao)
+        dados["Tipo NF"] = get_text("nfe:tpNF", secao)
+        dados["Modelo"] = get_text("nfe:mod", secao)
+        # Converter código UF para sigla
+        codigo_uf = get_text("nfe:cUF", secao)
+        dados["UF"] = converter_codigo_uf(codigo_uf)
+        dados["UF Código"] = codigo_uf  # Manter código original também
+        dados["Finalidade"] = get_text("nfe:finNFe", secao)
+
+    # --- EMITENTE ---
+    elif nome == "emit":
+        dados["Emitente CNPJ"] = get_text("nfe:CNPJ", secao)
+        dados["Emitente Nome"] = get_text("nfe:xNome", secao)
+        dados["Emitente Fantasia"] = get_text("nfe:xFant", secao)
+        dados["Emitente IE"] = get_text("nfe:IE", secao)
+        # UF do emitente com conversão
+        uf_emit = get_text("nfe:enderEmit/nfe:UF", secao)
+        dados["Emitente UF"] = converter_codigo_uf(uf_emit) if uf_emit != "0" else uf_emit
+        dados["Emitente Município"] = get_text("nfe:enderEmit/nfe:xMun", secao)
+        dados["Emitente CEP"] = get_text("nfe:enderEmit/nfe:CEP", secao)
+
+    # --- DESTINATÁRIO ---
+    elif nome == "dest":
+        dados["Destinatário CNPJ"] = get_text("nfe:CNPJ", secao)
+        dados["Destinatário Nome"] = get_text("nfe:xNome", secao)
+        dados["Destinatário IE"] = get_text("nfe:IE", secao)
+        # UF do destinatário com conversão (CRÍTICO para ICMS)
+        uf_dest = get_text("nfe:enderDest/nfe:UF", secao)
+        dados["Destinatário UF"] = converter_codigo_uf(uf_dest) if uf_dest != "0" else uf_dest
+        dados["Destinatário Município"] = get_text("nfe:enderDest/nfe:xMun", secao)
+        dados["Destinatário CEP"] = get_text("nfe:enderDest/nfe:CEP", secao)
+
+    # --- TRANSPORTE ---
+    elif nome == "transp":
+        transporta = secao.find("nfe:transporta", NS)
+        vol = secao.find("nfe:vol", NS)
+        dados["Modalidade Frete"] = get_text("nfe:modFrete", secao)
+        if transporta is not None:
+            dados["Transportadora Nome"] = get_text("nfe:xNome", transporta)
+            dados["Transportadora CNPJ"] = get_text("nfe:CNPJ", transporta)
+            # UF da transportadora com conversão
+            uf_transp = get_text("nfe:UF", transporta)
+            dados["Transportadora UF"] = converter_codigo_uf(uf_transp) if uf_transp != "0" else uf_transp
+        if vol is not None:
+            dados["Qtde Volumes"] = get_text("nfe:qVol", vol)
+            dados["Peso Líquido"] = get_text("nfe:pesoL", vol)
+            dados["Peso Bruto"] = get_text("nfe:pesoB", vol)
+
+    # --- COBRANÇA / FATURA ---
+    elif nome == "cobr":
+        fat = secao.find("nfe:fat", NS)
+        dup = secao.find("nfe:dup", NS)
+        if fat is not None:
+            dados["Número Fatura"] = get_text("nfe:nFat", fat)
+            dados["Valor Original"] = get_text("nfe:vOrig", fat)
+            dados["Valor Líquido"] = get_text("nfe:vLiq", fat)
+        if dup is not None:
+            dados["Número Duplicata"] = get_text("nfe:nDup", dup)
+            dados["Data Vencimento"] = get_text("nfe:dVenc", dup)
+            dados["Valor Duplicata"] = get_text("nfe:vDup", dup)
+
+    # --- TOTALIZAÇÃO ---
+    elif nome == "total":
+        total = secao.find("nfe:ICMSTot", NS)
+        if total is not None:
+            dados["Base ICMS"] = get_text("nfe:vBC", total)
+            dados["Valor ICMS"] = get_text("nfe:vICMS", total)
+            dados["Valor Produtos"] = get_text("nfe:vProd", total)
+            dados["Valor NF"] = get_text("nfe:vNF", total)
+            dados["Valor Frete"] = get_text("nfe:vFrete", total)
+            dados["Valor IPI"] = get_text("nfe:vIPI", total)
+            dados["Valor COFINS"] = get_text("nfe:vCOFINS", total)
+            dados["Valor PIS"] = get_text("nfe:vPIS", total)
+
+    return dados
+
+
+def dados_produto(det: ET.Element) -> Optional[Dict[str, str]]:
+    """Linha de produtos de um item `det`, ou None se ele não tiver `prod`."""
+    prod = det.find("nfe:prod", NS)
+    imp = det.find("nfe:imposto", NS)
+    if prod is None:
+        return None
+    p = {
+        "Item": det.attrib.get("nItem", "0"),
+        "Código": get_text("nfe:cProd", prod),
+        "Descrição": get_text("nfe:xProd", prod),
+        "NCM": get_text("nfe:NCM", prod),
+        "CFOP": get_text("nfe:CFOP", prod),
+        "Unidade": get_text("nfe:uCom", prod),
+        "Quantidade": get_text("nfe:qCom", prod),
+        "Valor Unitário": get_text("nfe:vUnCom", prod),
+        "Valor Total": get_text("nfe:vProd", prod),
+    }
+    if imp is not None:
+        p["ICMS"] = get_text(".//nfe:vICMS", imp)
+        p["IPI"] = get_text(".//nfe:vIPI", imp)
+        p["PIS"] = get_text(".//nfe:vPIS", imp)
+        p["COFINS"] = get_text(".//nfe:vCOFINS", imp)
+    # Colunas de tributos sempre presentes, para que blocos e notas diferentes tenham o mesmo esquema
+    for grupo, campos in CAMPOS_TRIBUTOS:
+        elemento = imp.find(grupo, NS) if imp is not None else None
+        for coluna, caminho, numerico in campos:
+            texto = get_text(caminho, elemento) if elemento is not None else "0"
+            p[coluna] = valor_numerico(texto) if numerico else texto
+    return p
+
+
+def divergencias_tributos(produtos_df: pd.DataFrame, tolerancia: float = 0.02) -> pd.DataFrame:
+    """
+    Itens em que base x alíquota / 100 (menos a dedução, no ICMS ST) difere do valor destacado
+    em mais de `tolerancia` reais, com o tributo, o valor calculado e o destacado. Só confere
+    tributos com base e alíquota informadas (tributação por quantidade, por exemplo, fica de fora)
+    e pula o ICMS ST de itens do Simples Nacional, cuja dedução não está no XML.
+    """
+    partes = []
+    for tributo, base, aliquota, valor, deducao, exceto in CALCULOS_TRIBUTOS:
+        if not {base, aliquota, valor}.issubset(produtos_df.columns):
+            continue
+        calculado = (produtos_df[base] * produtos_df[aliquota] / 100).round(2)
+        if deducao is not None:
+            calculado = calculado - produtos_df[deducao]
+        informado = (produtos_df[base] > 0) & (produtos_df[aliquota] > 0)
+        if exceto is not None and exceto in produtos_df.columns:
+            informado &= produtos_df[exceto].isin(["0", ""])
+        divergente = informado & ((calculado - produtos_df[valor]).abs() > tolerancia)
+        if divergente.any():
+            partes.append(pd.DataFrame({
+                "Item": produtos_df.loc[divergente, "Item"] if "Item" in produtos_df.columns else produtos_df.index[divergente],
+                "Tributo": tributo,
+                "Base": produtos_df.loc[divergente, base],
+                "Alíquota": produtos_df.loc[divergente, aliquota],
+                "Valor Calculado": calculado[divergente],
+                "Valor Destacado": produtos_df.loc[divergente, valor],
+            }))
+    if not partes:
+        return pd.DataFrame(columns=["Item", "Tributo", "Base", "Alíquota", "Valor Calculado", "Valor Destacado"])
+    return pd.concat(partes).sort_index(kind="stable")
+
+
+def _abrir(fonte: Union[str, bytes, os.PathLike, io.IOBase]):
+    """Arquivo para o iterparse: caminho, conteúdo XML (str ou bytes) ou arquivo já aberto."""
+    if isinstance(fonte, bytes):
+        return io.BytesIO(fonte)
+    if isinstance(fonte, str) and fonte.lstrip().startswith("<"):
+        return io.StringIO(fonte)
+    return fonte
+
+
+class LeitorNFe:
+    """
+    Leitura em uma passada de uma NF-e: `blocos()` produz DataFrames de até `tamanho_bloco`
+    produtos e, ao terminar, `cabecalho` (e `cabecalho_df()`) tem os campos do cabeçalho.
+    """
+
+    def __init__(self, fonte: Union[str, bytes, os.PathLike, io.IOBase], tamanho_bloco: int = TAMANHO_BLOCO):
+        self.fonte = fonte
+        self.tamanho_bloco = tamanho_bloco
+        self.cabecalho: Dict[str, str] = {}
+        self.itens = 0
+
+    def blocos(self) -> Iterator[pd.DataFrame]:
+        secoes: Dict[str, Dict[str, str]] = {}
+        linhas: List[Dict[str, str]] = []
+        pilha: List[ET.Element] = []
+        encontrada = False
+        for evento, elemento in ET.iterparse(_abrir(self.fonte), events=("start", "end")):
+            if evento == "start":
+                pilha.append(elemento)
+                encontrada = encontrada or elemento.tag == _TAG_INF_NFE
+                continue
+            pilha.pop()
+            if elemento.tag == _TAG_INF_NFE:
+                break  # Assinatura e protocolo que vêm depois não são usados
+            if not pilha or pilha[-1].tag != _TAG_INF_NFE:
+                continue
+
+            # Filho direto de infNFe: extrai e descarta a seção
+            nome = elemento.tag[len(_PREFIXO_TAG):] if elemento.tag.startswith(_PREFIXO_TAG) else elemento.tag
+            if nome == "det":
+                linha = dados_produto(elemento)
+                if linha is not None:
+                    linhas.append(linha)
+                    if len(linhas) >= self.tamanho_bloco:
+                        self.itens += len(linhas)
+                        yield pd.DataFrame(linhas).fillna("0")
+                        linhas = []
+            elif nome in SECOES_CABECALHO and nome not in secoes:
+                secoes[nome] = dados_secao(nome, elemento)
+            pilha[-1].remove(elemento)
+
+        if not encontrada:
+            raise ValueError("XML sem o grupo infNFe: não parece uma NF-e.")
+        if linhas:
+            self.itens += len(linhas)
+            yield pd.DataFrame(linhas).fillna("0")
+        self.cabecalho = {campo: valor for nome in SECOES_CABECALHO for campo, valor in secoes.get(nome, {}).items()}
+
+    def cabecalho_df(self) -> pd.DataFrame:
+        return pd.DataFrame([self.cabecalho]).fillna("0")
+
+
+def extrair_dados_xml_streaming(fonte: Union[str, bytes, os.PathLike, io.IOBase],
+                                tamanho_bloco: int = TAMANHO_BLOCO) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Mesmo resultado de extrair_dados_xml (cabecalho_df, produtos_df), lido em uma passada com iterparse."""
+    leitor = LeitorNFe(fonte, tamanho_bloco)
+    blocos = list(leitor.blocos())
+    produtos_df = pd.concat(blocos, ignore_index=True).fillna("0") if blocos else pd.DataFrame()
+    return leitor.cabecalho_df(), produtos_df